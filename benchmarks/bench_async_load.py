@@ -0,0 +1,55 @@
+"""
+Сравнение пропускной способности синхронного и асинхронного режимов
+(config.DB_MODE) под нагрузкой GET /users/{id} от множества конкурентных
+клиентов.
+
+Запуск: python -m benchmarks.bench_async_load --clients 500 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from benchmarks.common import make_engine, seed, serve, write_results
+from benchmarks.load import run_load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    # Приложение работает с local.db в текущей папке сервера
+    cwd = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(cwd, "local.db"))
+    seed(engine, users=args.users, items=args.users * 10)
+    engine.dispose()
+
+    paths = [f"/users/{i}" for i in range(1, args.users + 1)]
+
+    print(
+        f"{'mode':>6} {'req/s':>8} {'p50, ms':>8} {'p95, ms':>8}"
+        f" {'p99, ms':>8} {'errors':>7}"
+    )
+    results = {}
+    for mode in ("sync", "async"):
+        with serve(cwd, env={"DB_MODE": mode}) as base_url:
+            result = asyncio.run(
+                run_load(base_url, paths, args.clients, args.duration)
+            )
+        results[mode] = result
+        print(
+            f"{mode:>6} {result['rps']:>8.0f} {result['p50_ms']:>8.1f}"
+            f" {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+            f" {result['errors']:>7}"
+        )
+
+    write_results(args.json, "async_load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Микро-бенчмарки функций crud на наборах данных разного размера.
+Записывающие функции работают со своими строками, поэтому набор данных
+между замерами не меняется по объему.
+
+Запуск: python -m benchmarks.bench_crud --datasets 1k 100k --json crud.json
+"""
+
+import argparse
+import itertools
+import random
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from benchmarks.common import (
+    DATASETS,
+    make_engine,
+    measure,
+    seed_dataset,
+    write_results,
+)
+from src import cache, schemas
+from src.internal.crud import change as changecrud
+from src.internal.crud import item as itemcrud
+from src.internal.crud import user as usercrud
+
+# Количество строк в одном вызове массовых функций
+BULK_SIZE = 100
+
+
+def crud_benchmarks(
+    db: Session, users: int, items: int
+) -> dict[str, Callable[[], object]]:
+    """
+    Возвращает функции, вызывающие каждую функцию crud, по именам.
+    """
+    counter = itertools.count()
+
+    def user_id() -> int:
+        return random.randint(1, users)
+
+    def item_id() -> int:
+        return random.randint(1, items)
+
+    def new_user() -> schemas.UserCreate:
+        return schemas.UserCreate(
+            name="Bench", email=f"bench{next(counter)}@mail.com", address=""
+        )
+
+    def new_item() -> schemas.ItemCreate:
+        return schemas.ItemCreate(
+            title="Bench", description="", user_id=user_id()
+        )
+
+    def created_ids(create: Callable[[], list[schemas.BulkResult]]):
+        """
+        Возвращает функцию, выдающую id строк, созданных create,
+        для удаления по одной.
+        """
+        pool = []
+
+        def next_id() -> int:
+            if not pool:
+                pool.extend(r.id for r in create())
+            return pool.pop()
+
+        return next_id
+
+    user_to_delete = created_ids(
+        lambda: usercrud.create_users([new_user() for _ in range(50)], db)
+    )
+    item_to_delete = created_ids(
+        lambda: itemcrud.create_items([new_item() for _ in range(50)], db)
+    )
+
+    def delete_user():
+        db_user = usercrud.get_user_by_id(id=user_to_delete(), db=db)
+        usercrud.delete_user(db_user=db_user, db=db)
+
+    def delete_item():
+        db_item = itemcrud.get_item_by_id(id=item_to_delete(), db=db)
+        itemcrud.delete_item(db_item=db_item, db=db)
+
+    return {
+        "user.get_users": lambda: usercrud.get_users(
+            db=db, after_id=user_id(), limit=100
+        ).all(),
+        "user.iter_users": lambda: next(
+            usercrud.iter_users(db=db, chunk_size=100)
+        ),
+        "user.get_users_by_items_count": lambda: usercrud.get_users(
+            db=db,
+            limit=100,
+            filters=schemas.UserFilter(sort="-items_count"),
+        ).all(),
+        "user.get_user_stats": lambda: usercrud.get_user_stats(db=db),
+        "user.get_user_by_id": lambda: usercrud.get_user_by_id(
+            id=user_id(), db=db
+        ),
+        "user.get_user_cached": lambda: usercrud.get_user_cached(
+            id=user_id(), db=db
+        ),
+        "user.get_users_by_ids": lambda: usercrud.get_users_by_ids(
+            ids=[user_id() for _ in range(BULK_SIZE)], db=db
+        ),
+        "user.get_user_by_email": lambda: usercrud.get_user_by_email(
+            email=f"user{user_id() - 1}@mail.com", db=db
+        ),
+        "user.create_user": lambda: usercrud.create_user(
+            user=new_user(), db=db
+        ),
+        "user.update_user": lambda: usercrud.update_user(
+            id=user_id(),
+            user=schemas.UserCreate(
+                name="Bench",
+                email=f"bench{next(counter)}@mail.com",
+                address="",
+            ),
+            db=db,
+        ),
+        "user.delete_user": delete_user,
+        "user.create_users": lambda: usercrud.create_users(
+            users=[new_user() for _ in range(BULK_SIZE)], db=db
+        ),
+        "user.update_users": lambda: usercrud.update_users(
+            users=[
+                schemas.UserBulkUpdate(
+                    id=user_id(),
+                    name="Bench",
+                    email=f"bench{next(counter)}@mail.com",
+                    address="",
+                )
+                for _ in range(BULK_SIZE)
+            ],
+            db=db,
+        ),
+        "user.delete_users": lambda: usercrud.delete_users(
+            ids=[user_to_delete() for _ in range(BULK_SIZE)], db=db
+        ),
+        "item.get_items": lambda: itemcrud.get_items(
+            db=db, after_id=item_id(), limit=100
+        ).all(),
+        "item.get_items_by_title": lambda: itemcrud.get_items(
+            db=db,
+            limit=100,
+            filters=schemas.ItemFilter(
+                title_prefix=f"Item {item_id()}", sort="title"
+            ),
+        ).all(),
+        "item.search_items": lambda: itemcrud.search_items(
+            q=str(item_id()), db=db, limit=100
+        ),
+        "item.get_item_stats": lambda: itemcrud.get_item_stats(db=db),
+        "item.iter_items": lambda: next(
+            itemcrud.iter_items(db=db, chunk_size=100)
+        ),
+        "item.get_item_by_id": lambda: itemcrud.get_item_by_id(
+            id=item_id(), db=db
+        ),
+        "item.get_item_cached": lambda: itemcrud.get_item_cached(
+            id=item_id(), db=db
+        ),
+        "item.get_items_by_ids": lambda: itemcrud.get_items_by_ids(
+            ids=[item_id() for _ in range(BULK_SIZE)], db=db
+        ),
+        "item.create_item": lambda: itemcrud.create_item(
+            item=new_item(), db=db
+        ),
+        "item.update_item": lambda: itemcrud.update_item(
+            id=item_id(), item=new_item(), db=db
+        ),
+        "item.delete_item": delete_item,
+        "item.create_items": lambda: itemcrud.create_items(
+            items=[new_item() for _ in range(BULK_SIZE)], db=db
+        ),
+        "item.update_items": lambda: itemcrud.update_items(
+            items=[
+                schemas.ItemBulkUpdate(id=item_id(), **new_item().model_dump())
+                for _ in range(BULK_SIZE)
+            ],
+            db=db,
+        ),
+        "item.delete_items": lambda: itemcrud.delete_items(
+            ids=[item_to_delete() for _ in range(BULK_SIZE)], db=db
+        ),
+        # Журнал заполнен записями о строках набора данных
+        "change.get_changes": lambda: changecrud.get_changes(
+            db=db, since=random.randint(0, users + items), limit=100
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--datasets", nargs="+", choices=DATASETS, default=["1k", "100k"]
+    )
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'function':>40} {'median, ms':>12} {'mean, ms':>12}")
+    for dataset in args.datasets:
+        engine = make_engine()
+        users, items = seed_dataset(engine, dataset)
+        cache.backend.clear()
+        with Session(bind=engine) as db:
+            for name, fn in crud_benchmarks(db, users, items).items():
+                result = measure(fn, repeat=args.repeat)
+                results[f"{dataset}/{name}"] = result
+                print(
+                    f"{dataset + '/' + name:>40} {result['median_ms']:>12.3f}"
+                    f" {result['mean_ms']:>12.3f}"
+                )
+        engine.dispose()
+
+    write_results(args.json, "crud", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Время до первого байта, полное время и пик памяти потоковой выгрузки
+элементов (GET /items/export) на таблицах разного размера.
+
+Приложение вызывается напрямую через ASGI: тестовый клиент накапливает
+тело ответа целиком и не позволяет измерить время до первого байта.
+
+Запуск: python -m benchmarks.bench_export --items 10000 100000
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.common import make_client, make_engine, seed
+from src.main import app
+
+
+async def stream_get(path: str) -> tuple[float, float]:
+    """
+    Выполняет GET-запрос к приложению, отбрасывая тело ответа.
+    Возвращает время до первого байта тела и полное время в миллисекундах.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [],
+        "server": ("bench", 80),
+        "client": ("bench", 1),
+    }
+    ttfb = None
+    requested = False
+    done = asyncio.Event()
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Клиент "отключается" только после получения всего ответа
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal ttfb
+        if message["type"] != "http.response.body":
+            return
+        if ttfb is None:
+            ttfb = (time.perf_counter() - start) * 1000
+        if not message.get("more_body", False):
+            done.set()
+
+    await app(scope, receive, send)
+    return ttfb, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--items", type=int, nargs="+", default=[10_000, 100_000]
+    )
+    args = parser.parse_args()
+
+    print(f"{'items':>10} {'ttfb, ms':>10} {'total, ms':>10} {'peak, MB':>10}")
+    for items in args.items:
+        engine = make_engine()
+        seed(engine, users=1_000, items=items)
+        # Подменяем зависимость БД на заполненную базу
+        make_client(engine)
+
+        tracemalloc.start()
+        ttfb, total = asyncio.run(stream_get("/items/export"))
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+        print(f"{items:>10} {ttfb:>10.1f} {total:>10.1f} {peak:>10.1f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Пропускная способность создания элементов из многих потоков: каждая
+строка своей транзакцией (crud.create_item) и групповая запись через
+ItemWriter. Стоимость фиксации транзакции зависит от SQLITE_SYNCHRONOUS
+(с FULL каждая фиксация выполняет fsync).
+
+Запуск: python -m benchmarks.bench_item_writer --rows 5000 --threads 32
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import make_engine, seed, write_results
+from src import schemas
+from src.internal.crud import item as crud
+from src.writer import ItemWriter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    engine = make_engine()
+    seed(engine, users=100, items=0)
+    Session = sessionmaker(autoflush=False, bind=engine)
+    item = schemas.ItemCreate(title="Bench", description="", user_id=1)
+
+    def direct(_):
+        with Session() as db:
+            return crud.create_item(item=item, db=db).id
+
+    writer = ItemWriter(Session)
+
+    def batched(_):
+        return writer.submit(item).result()
+
+    results = {}
+    print(f"{'mode':>10} {'total, ms':>12} {'rows/s':>10}")
+    for name, create in (("direct", direct), ("batched", batched)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(create, range(args.rows)))
+        total = (time.perf_counter() - start) * 1000
+        results[name] = {"total_ms": total}
+        print(f"{name:>10} {total:>12.1f} {args.rows / total * 1000:>10.0f}")
+
+    writer.close()
+    write_results(args.json, "item_writer", vars(args), results)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Сравнение постраничной выборки элементов по ключу (keyset) и через OFFSET
+на разной глубине страниц.
+
+Запуск: python -m benchmarks.bench_pagination --items 200000
+"""
+
+import argparse
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from benchmarks.common import make_engine, measure, seed
+from src import models
+from src.internal.crud import item as crud
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = make_engine()
+    seed(engine, users=1_000, items=args.items)
+
+    pages = [1, 10, 100, 1_000]
+    pages = [p for p in pages if p * args.page_size <= args.items]
+
+    print(f"{'page':>6} {'keyset, ms':>12} {'offset, ms':>12}")
+    with Session(bind=engine) as db:
+        for page in pages:
+            # id последнего элемента предыдущей страницы
+            after_id = (page - 1) * args.page_size
+
+            keyset = measure(
+                lambda: crud.get_items(
+                    db=db, after_id=after_id, limit=args.page_size
+                ).all(),
+                repeat=args.repeat,
+            )
+            offset = measure(
+                lambda: db.scalars(
+                    select(models.Item)
+                    .order_by(models.Item.id)
+                    .offset(after_id)
+                    .limit(args.page_size)
+                ).all(),
+                repeat=args.repeat,
+            )
+            print(
+                f"{page:>6} {keyset['median_ms']:>12.3f}"
+                f" {offset['median_ms']:>12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
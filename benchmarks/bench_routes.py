@@ -0,0 +1,213 @@
+"""
+Бенчмарки всех маршрутов приложения, вызываемых в том же процессе через
+httpx.AsyncClient и ASGI, на наборах данных разного размера.
+
+Запуск: python -m benchmarks.bench_routes --datasets 1k 100k --json routes.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+from typing import Awaitable, Callable
+
+import httpx
+from fastapi.routing import APIRoute
+
+from benchmarks.common import (
+    DATASETS,
+    make_async_client,
+    make_engine,
+    measure_async,
+    seed_dataset,
+    write_results,
+)
+from src import cache
+from src.main import app
+
+# Количество строк в одном запросе массовых маршрутов
+BULK_SIZE = 100
+
+
+def route_benchmarks(
+    client: httpx.AsyncClient, users: int, items: int
+) -> dict[tuple[str, str], Callable[[], Awaitable[object]]]:
+    """
+    Возвращает функции, выполняющие запрос к каждому маршруту, по методу
+    и пути маршрута.
+    """
+    counter = itertools.count()
+    # id строк, созданных для удаления
+    to_delete = {"users": [], "items": []}
+
+    def user_id() -> int:
+        return random.randint(1, users)
+
+    def item_id() -> int:
+        return random.randint(1, items)
+
+    def batch(count: int) -> list[int]:
+        return random.sample(range(1, count + 1), min(BULK_SIZE, count))
+
+    def new_user() -> dict:
+        return {
+            "name": "Bench",
+            "email": f"bench{next(counter)}@mail.com",
+            "address": "",
+        }
+
+    def new_item() -> dict:
+        return {"title": "Bench", "description": "", "user_id": user_id()}
+
+    async def request(method: str, url: str, **kwargs) -> httpx.Response:
+        response = await client.request(method, url, **kwargs)
+        assert response.status_code < 400, (method, url, response.text)
+        return response
+
+    async def pop_id(resource: str) -> int:
+        pool = to_delete[resource]
+        if not pool:
+            new = new_user if resource == "users" else new_item
+            response = await request(
+                "POST", f"/{resource}/bulk", json=[new() for _ in range(50)]
+            )
+            pool.extend(r["id"] for r in response.json())
+        return pool.pop()
+
+    async def delete_one(resource: str):
+        await request("DELETE", f"/{resource}/{await pop_id(resource)}")
+
+    async def delete_bulk(resource: str):
+        ids = [await pop_id(resource) for _ in range(BULK_SIZE)]
+        await request("DELETE", f"/{resource}/bulk", json=ids)
+
+    return {
+        ("GET", "/users/"): lambda: request(
+            "GET", "/users/", params={"after_id": user_id()}
+        ),
+        ("GET", "/users/export"): lambda: request("GET", "/users/export"),
+        ("GET", "/users/stats"): lambda: request("GET", "/users/stats"),
+        ("POST", "/users/bulk"): lambda: request(
+            "POST",
+            "/users/bulk",
+            json=[new_user() for _ in range(BULK_SIZE)],
+        ),
+        ("PUT", "/users/bulk"): lambda: request(
+            "PUT",
+            "/users/bulk",
+            json=[new_user() | {"id": user_id()} for _ in range(BULK_SIZE)],
+        ),
+        ("DELETE", "/users/bulk"): lambda: delete_bulk("users"),
+        ("GET", "/users/batch"): lambda: request(
+            "GET",
+            "/users/batch",
+            params={"ids": ",".join(map(str, batch(users)))},
+        ),
+        ("POST", "/users/batch"): lambda: request(
+            "POST", "/users/batch", json=batch(users)
+        ),
+        ("GET", "/users/{id}"): lambda: request("GET", f"/users/{user_id()}"),
+        ("GET", "/users/{id}/items"): lambda: request(
+            "GET", f"/users/{user_id()}/items"
+        ),
+        ("POST", "/users/"): lambda: request(
+            "POST", "/users/", json=new_user()
+        ),
+        ("PUT", "/users/{id}"): lambda: request(
+            "PUT", f"/users/{user_id()}", json=new_user()
+        ),
+        ("DELETE", "/users/{id}"): lambda: delete_one("users"),
+        ("GET", "/items/"): lambda: request(
+            "GET", "/items/", params={"after_id": item_id()}
+        ),
+        ("GET", "/items/export"): lambda: request("GET", "/items/export"),
+        ("GET", "/items/stats"): lambda: request("GET", "/items/stats"),
+        ("GET", "/items/search"): lambda: request(
+            "GET", "/items/search", params={"q": f"item {item_id()}"}
+        ),
+        ("POST", "/items/bulk"): lambda: request(
+            "POST",
+            "/items/bulk",
+            json=[new_item() for _ in range(BULK_SIZE)],
+        ),
+        ("PUT", "/items/bulk"): lambda: request(
+            "PUT",
+            "/items/bulk",
+            json=[new_item() | {"id": item_id()} for _ in range(BULK_SIZE)],
+        ),
+        ("DELETE", "/items/bulk"): lambda: delete_bulk("items"),
+        ("GET", "/items/batch"): lambda: request(
+            "GET",
+            "/items/batch",
+            params={"ids": ",".join(map(str, batch(items)))},
+        ),
+        ("POST", "/items/batch"): lambda: request(
+            "POST", "/items/batch", json=batch(items)
+        ),
+        ("GET", "/items/{id}"): lambda: request("GET", f"/items/{item_id()}"),
+        ("POST", "/items/"): lambda: request(
+            "POST", "/items/", json=new_item()
+        ),
+        ("PUT", "/items/{id}"): lambda: request(
+            "PUT", f"/items/{item_id()}", json=new_item()
+        ),
+        ("DELETE", "/items/{id}"): lambda: delete_one("items"),
+        # Журнал заполнен при загрузке набора данных: по изменению на строку
+        ("GET", "/changes"): lambda: request(
+            "GET",
+            "/changes",
+            params={"since": random.randint(0, users + items)},
+        ),
+        ("GET", "/cache/stats"): lambda: request("GET", "/cache/stats"),
+        ("GET", "/metrics"): lambda: request("GET", "/metrics"),
+    }
+
+
+async def run(datasets: list[str], repeat: int) -> dict[str, dict]:
+    """
+    Замеряет все маршруты на каждом наборе данных из datasets.
+    """
+    routes = {
+        (method, route.path)
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    results = {}
+    print(f"{'route':>32} {'median, ms':>12} {'mean, ms':>12}")
+    for dataset in datasets:
+        engine = make_engine()
+        users, items = seed_dataset(engine, dataset)
+        cache.backend.clear()
+        async with make_async_client(engine) as client:
+            benchmarks = route_benchmarks(client, users, items)
+            # Маршруты, добавленные в приложение без бенчмарка
+            for method, path in sorted(routes - benchmarks.keys()):
+                print(f"no benchmark for {method} {path}")
+            for (method, path), fn in benchmarks.items():
+                name = f"{dataset}/{method} {path}"
+                result = await measure_async(fn, repeat=repeat)
+                results[name] = result
+                print(
+                    f"{name:>32} {result['median_ms']:>12.3f}"
+                    f" {result['mean_ms']:>12.3f}"
+                )
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--datasets", nargs="+", choices=DATASETS, default=["1k", "100k"]
+    )
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.datasets, args.repeat))
+    write_results(args.json, "routes", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Процессорное время на сериализацию 10 тысяч строк списков пользователей
+и элементов (GET /users/ и GET /items/) в режимах RESPONSE_SERIALIZER:
+"pydantic" - объекты моделей через response_model, "orjson" - столбцы
+схем напрямую в JSON. Строки выбираются страницами максимального размера
+по курсору, время считается по всем потокам процесса (time.process_time).
+
+Запуск: python -m benchmarks.bench_serialization --rows 10000 --json ser.json
+"""
+
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+
+from benchmarks.common import (
+    make_client,
+    make_engine,
+    measure,
+    seed,
+    write_results,
+)
+from src import config
+
+SERIALIZERS = ("pydantic", "orjson")
+
+
+def read_all(client: TestClient, path: str) -> int:
+    """
+    Читает все страницы списка path по курсору.
+    Возвращает количество строк.
+    """
+    rows = 0
+    params = {"limit": config.PAGE_SIZE_MAX}
+    while True:
+        response = client.get(path, params=params)
+        response.raise_for_status()
+        rows += len(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+        params["after_id"] = cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    engine = make_engine()
+    # У каждого пользователя по два элемента
+    seed(engine, users=args.rows, items=args.rows * 2)
+    client = make_client(engine)
+
+    results = {}
+    print(f"{'list':>20} {'median, ms':>12} {'per 10k, ms':>12}")
+    for path in ("/users/", "/items/"):
+        rows = args.rows * (2 if path == "/items/" else 1)
+        for serializer in SERIALIZERS:
+            config.RESPONSE_SERIALIZER = serializer
+            # Прогрев: первые запросы компилируют SQL и схемы
+            read_all(client, path)
+            result = measure(
+                lambda: read_all(client, path),
+                repeat=args.repeat,
+                clock=time.process_time,
+            )
+            name = f"{path}{serializer}"
+            results[name] = result
+            print(
+                f"{name:>20} {result['median_ms']:>12.1f}"
+                f" {result['median_ms'] * 10_000 / rows:>12.1f}"
+            )
+
+    write_results(args.json, "serialization", vars(args), results)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
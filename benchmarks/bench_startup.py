@@ -0,0 +1,141 @@
+"""
+Время холодного старта: от запуска процесса uvicorn до первого ответа 200
+на GET /users/{id}, время этого первого запроса и следующего, без прогрева
+и с прогревом (config.STARTUP_WARMUP). С --importtime выводит профиль
+импорта src.main (python -X importtime): модули с наибольшим временем.
+
+Запуск: python -m benchmarks.bench_startup --repeat 5 --importtime
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import (
+    make_engine,
+    seed,
+    start_server,
+    stop_server,
+    write_results,
+)
+
+# Интервал опроса сервера до первого ответа, в секундах
+POLL_INTERVAL = 0.005
+
+
+def cold_start(cwd: str, env: dict[str, str]) -> dict[str, float]:
+    """
+    Запускает сервер и опрашивает GET /users/1 до первого ответа 200.
+    Возвращает время до этого ответа, время первого ответа и следующего
+    запроса в миллисекундах.
+    """
+    start = time.perf_counter()
+    process, base_url = start_server(cwd, env)
+    try:
+        with httpx.Client(base_url=base_url) as client:
+            while True:
+                request_start = time.perf_counter()
+                try:
+                    response = client.get("/users/1")
+                except httpx.TransportError:
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                if response.status_code == 200:
+                    break
+                raise RuntimeError(f"Unexpected status {response.status_code}")
+            end = time.perf_counter()
+            # Следующий запрос к другому пользователю, мимо кэша
+            next_start = time.perf_counter()
+            client.get("/users/2").raise_for_status()
+            next_end = time.perf_counter()
+    finally:
+        stop_server(process)
+    return {
+        "first_200_ms": (end - start) * 1000,
+        "first_request_ms": (end - request_start) * 1000,
+        "second_request_ms": (next_end - next_start) * 1000,
+    }
+
+
+def import_profile(top: int) -> list[tuple[str, int, int]]:
+    """
+    Возвращает top модулей с наибольшим суммарным временем импорта при
+    импорте src.main: (модуль, собственное время, суммарное время в мкс).
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    modules.sort(key=lambda m: m[2], reverse=True)
+    return modules[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument(
+        "--importtime", action="store_true", help="профиль импорта src.main"
+    )
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = {}
+    if args.importtime:
+        print(f"{'module':>50} {'self, ms':>10} {'cumulative, ms':>15}")
+        for name, own, cumulative in import_profile(args.top):
+            print(f"{name:>50} {own / 1000:>10.1f} {cumulative / 1000:>15.1f}")
+            results[f"import/{name}"] = {
+                "self_ms": own / 1000,
+                "cumulative_ms": cumulative / 1000,
+            }
+
+    # Приложение работает с local.db в текущей папке сервера
+    cwd = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(cwd, "local.db"))
+    seed(engine, users=args.users, items=args.users * 10)
+    engine.dispose()
+
+    print(
+        f"{'warmup':>8} {'first 200, ms':>14} {'first req, ms':>14}"
+        f" {'second req, ms':>15}"
+    )
+    for warmup in ("0", "1"):
+        runs = [
+            cold_start(cwd, {"STARTUP_WARMUP": warmup})
+            for _ in range(args.repeat)
+        ]
+        result = {
+            f"{key}_median": statistics.median(run[key] for run in runs)
+            for key in runs[0]
+        }
+        results[f"startup/warmup={warmup}"] = result
+        print(
+            f"{warmup:>8} {result['first_200_ms_median']:>14.1f}"
+            f" {result['first_request_ms_median']:>14.2f}"
+            f" {result['second_request_ms_median']:>15.2f}"
+        )
+
+    write_results(args.json, "startup", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Время GET /users/{id} на большой таблице items до и после применения
+миграции с индексом на items.user_id.
+
+Запуск: python -m benchmarks.bench_user_items_index --items 1000000
+"""
+
+import argparse
+import random
+
+from sqlalchemy import text
+
+from benchmarks.common import make_client, make_engine, measure, seed
+from src import migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = make_engine()
+    seed(engine, users=args.users, items=args.items)
+    # Приводим схему к состоянию до миграции
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_items_user_id"))
+        conn.execute(text("DROP TABLE IF EXISTS schema_version"))
+    client = make_client(engine)
+
+    def get_user():
+        response = client.get(f"/users/{random.randint(1, args.users)}")
+        assert response.status_code == 200
+
+    before = measure(get_user, repeat=args.repeat)
+    migrations.migrate(engine)
+    after = measure(get_user, repeat=args.repeat)
+
+    print(f"{'':>8} {'median, ms':>12} {'mean, ms':>12}")
+    for name, result in (("before", before), ("after", after)):
+        print(
+            f"{name:>8} {result['median_ms']:>12.3f}"
+            f" {result['mean_ms']:>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Масштабирование пропускной способности чтения GET /users/{id} с
+количеством рабочих процессов src.server. Кэш отключен, чтобы каждый
+запрос выполнял SQL-запрос. Пропускная способность растет с количеством
+процессов до количества ядер процессора.
+
+Запуск: python -m benchmarks.bench_workers --workers 1 2 4 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+from benchmarks.common import make_engine, seed, serve, write_results
+from benchmarks.load import run_load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    # Приложение работает с local.db в текущей папке сервера
+    cwd = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(cwd, "local.db"))
+    seed(engine, users=args.users, items=args.users * 10)
+    engine.dispose()
+
+    paths = [f"/users/{i}" for i in range(1, args.users + 1)]
+
+    print(f"cpu count: {os.cpu_count()}")
+    print(
+        f"{'workers':>7} {'req/s':>8} {'p50, ms':>8} {'p95, ms':>8}"
+        f" {'p99, ms':>8} {'errors':>7}"
+    )
+    results = {}
+    for workers in args.workers:
+        with serve(
+            cwd, env={"CACHE_BACKEND": "none"}, workers=workers
+        ) as base_url:
+            result = asyncio.run(
+                run_load(base_url, paths, args.clients, args.duration)
+            )
+        results[f"workers={workers}"] = result
+        print(
+            f"{workers:>7} {result['rps']:>8.0f} {result['p50_ms']:>8.1f}"
+            f" {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+            f" {result['errors']:>7}"
+        )
+
+    write_results(args.json, "workers", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import datetime
+import json
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator
+
+import httpx
+import sqlalchemy
+
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from src import models
+from src.database import create_db_engine, get_db, get_read_db
+from src.main import app
+
+# Размер пачки строк при заполнении БД
+SEED_CHUNK_SIZE = 10_000
+
+# Наборы данных: количество элементов, пользователей в 10 раз меньше
+DATASETS = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+
+def make_engine(path: str | None = None) -> Engine:
+    """
+    Создает engine к файлу sqlite (по умолчанию во временной папке)
+    с настройками из config и создает в нем все таблицы.
+    """
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_db_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def override_db(engine: Engine) -> None:
+    """
+    Переключает зависимости БД приложения (запись и чтение) на engine.
+    """
+    session_local = sessionmaker(autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_local()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+
+
+def make_client(engine: Engine) -> TestClient:
+    """
+    Возвращает тестовый клиент приложения, работающий с БД engine.
+    """
+    override_db(engine)
+    return TestClient(app)
+
+
+def make_async_client(engine: Engine) -> httpx.AsyncClient:
+    """
+    Возвращает асинхронный клиент, вызывающий приложение в том же процессе
+    через ASGI без сети, приложение работает с БД engine.
+    """
+    override_db(engine)
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    )
+
+
+def start_server(
+    cwd: str, env: dict[str, str] | None = None, workers: int = 1
+) -> tuple[subprocess.Popen, str]:
+    """
+    Запускает сервер src.server с workers процессами в папке cwd (в ней
+    находится local.db) с дополнительными переменными окружения env, не
+    дожидаясь готовности. Возвращает процесс и адрес сервера.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "src.server",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+            # Схему создает seed
+            "--no-migrate",
+        ],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": root, **(env or {})},
+        # Ошибки сервера учитываются генератором нагрузки
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """
+    Останавливает сервер, запущенный start_server.
+    """
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        # Сервер не смог завершить зависшие запросы
+        process.kill()
+        process.wait()
+
+
+@contextmanager
+def serve(
+    cwd: str, env: dict[str, str] | None = None, workers: int = 1
+) -> Iterator[str]:
+    """
+    Запускает uvicorn с приложением src.main:app в папке cwd (в ней
+    находится local.db) с дополнительными переменными окружения env.
+    Возвращает адрес сервера, после выхода из блока сервер останавливается.
+    """
+    process, base_url = start_server(cwd, env, workers)
+    try:
+        # Ждем, пока сервер начнет принимать запросы
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/docs")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        yield base_url
+    finally:
+        stop_server(process)
+
+
+def seed(engine: Engine, users: int, items: int) -> None:
+    """
+    Заполняет БД users пользователями и items элементами, распределенными
+    между пользователями по кругу.
+    """
+    with engine.begin() as conn:
+        for start in range(0, users, SEED_CHUNK_SIZE):
+            conn.execute(
+                insert(models.User),
+                [
+                    {
+                        "name": f"User {i}",
+                        "email": f"user{i}@mail.com",
+                        "address": f"address {i}",
+                    }
+                    for i in range(start, min(start + SEED_CHUNK_SIZE, users))
+                ],
+            )
+        for start in range(0, items, SEED_CHUNK_SIZE):
+            conn.execute(
+                insert(models.Item),
+                [
+                    {
+                        "title": f"Item {i}",
+                        "description": f"description of item {i}",
+                        "user_id": i % users + 1,
+                    }
+                    for i in range(start, min(start + SEED_CHUNK_SIZE, items))
+                ],
+            )
+
+
+def seed_dataset(engine: Engine, dataset: str) -> tuple[int, int]:
+    """
+    Заполняет БД набором данных dataset из DATASETS.
+    Возвращает количество пользователей и элементов.
+    """
+    items = DATASETS[dataset]
+    users = max(1, items // 10)
+    seed(engine, users=users, items=items)
+    return users, items
+
+
+def measure(
+    fn: Callable[[], object],
+    repeat: int = 20,
+    clock: Callable[[], float] = time.perf_counter,
+) -> dict[str, float]:
+    """
+    Выполняет fn repeat раз и возвращает статистику времени в миллисекундах.
+    Время измеряется часами clock, например time.process_time для
+    процессорного времени всех потоков процесса.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = clock()
+        fn()
+        timings.append((clock() - start) * 1000)
+    return {
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+async def measure_async(
+    fn: Callable[[], Awaitable[object]], repeat: int = 20
+) -> dict[str, float]:
+    """
+    Выполняет корутину fn() repeat раз и возвращает статистику времени
+    в миллисекундах.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(timings),
+        "median_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+    }
+
+
+def write_results(
+    path: str | None,
+    benchmark: str,
+    params: dict[str, Any],
+    results: dict[str, dict[str, float]],
+) -> None:
+    """
+    Сохраняет результаты results бенчмарка benchmark с параметрами params
+    в JSON-файл path вместе с описанием окружения. Файлы разных запусков
+    сравниваются скриптом benchmarks.compare. Если path не указан, ничего
+    не делает.
+    """
+    if path is None:
+        return
+    data = {
+        "benchmark": benchmark,
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
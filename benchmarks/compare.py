@@ -0,0 +1,73 @@
+"""
+Сравнение двух файлов результатов бенчмарков (--json) для поиска
+регрессий. Метрики времени (*_ms) считаются регрессией при росте, а
+пропускная способность (rps) - при падении больше чем на threshold
+процентов. Код возврата 1, если найдена хотя бы одна регрессия.
+
+Запуск: python -m benchmarks.compare base.json new.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(
+    base: dict, new: dict
+) -> list[tuple[str, str, float, float, float]]:
+    """
+    Возвращает изменения метрик, общих для результатов base и new:
+    (имя замера, метрика, старое значение, новое значение, изменение в
+    процентах, положительное - ухудшение). Метрика min_ms не сравнивается,
+    так как слишком чувствительна к шуму.
+    """
+    changes = []
+    for name, metrics in new["results"].items():
+        base_metrics = base["results"].get(name, {})
+        for metric, value in metrics.items():
+            old = base_metrics.get(metric)
+            if not old or metric == "min_ms":
+                continue
+            if metric.endswith("_ms"):
+                change = (value - old) / old * 100
+            elif metric == "rps":
+                change = (old - value) / old * 100
+            else:
+                continue
+            changes.append((name, metric, old, value, change))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10)
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if base["benchmark"] != new["benchmark"]:
+        sys.exit(
+            f"different benchmarks: {base['benchmark']}, {new['benchmark']}"
+        )
+
+    regressions = 0
+    print(
+        f"{'name':>40} {'metric':>10} {'base':>10} {'new':>10} {'change':>8}"
+    )
+    for name, metric, old, value, change in compare(base, new):
+        regressed = change > args.threshold
+        regressions += regressed
+        print(
+            f"{name:>40} {metric:>10} {old:>10.2f} {value:>10.2f}"
+            f" {change:>+7.1f}%{' !' if regressed else ''}"
+        )
+    print(f"regressions: {regressions}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Генератор нагрузки: несколько конкурентных клиентов в течение заданного
+времени выполняют запросы к запущенному серверу.
+
+Запуск: python -m benchmarks.load --dataset 100k --clients 50 --json load.json
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import (
+    DATASETS,
+    make_engine,
+    seed_dataset,
+    serve,
+    write_results,
+)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Возвращает p-й перцентиль значений values.
+    """
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+async def run_load(
+    base_url: str,
+    paths: list[str],
+    clients: int,
+    duration: float,
+    timeout: float = 10,
+) -> dict[str, float]:
+    """
+    Запускает clients конкурентных клиентов, каждый из которых в течение
+    duration секунд выполняет GET-запросы к случайным путям из paths.
+    Запросы, не получившие ответа за timeout секунд, считаются ошибками.
+    Возвращает пропускную способность и перцентили задержки в миллисекундах.
+    """
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=timeout
+    ) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(random.choice(paths))
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dataset", choices=DATASETS, default="100k")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    # Приложение работает с local.db в текущей папке сервера
+    cwd = tempfile.mkdtemp()
+    engine = make_engine(os.path.join(cwd, "local.db"))
+    users, items = seed_dataset(engine, args.dataset)
+    engine.dispose()
+
+    # Смесь чтений: по id, страницы списков
+    scenarios = {
+        "users_by_id": [f"/users/{i}" for i in range(1, users + 1)],
+        "items_by_id": [f"/items/{i}" for i in range(1, items + 1)],
+        "pages": [
+            f"/{resource}/?after_id={after_id}"
+            for resource, count in (("users", users), ("items", items))
+            for after_id in range(0, count, 100)
+        ],
+    }
+
+    results = {}
+    print(
+        f"{'scenario':>12} {'req/s':>8} {'p50, ms':>8} {'p95, ms':>8}"
+        f" {'p99, ms':>8} {'errors':>7}"
+    )
+    with serve(cwd, workers=args.workers) as base_url:
+        for name, paths in scenarios.items():
+            result = asyncio.run(
+                run_load(base_url, paths, args.clients, args.duration)
+            )
+            results[name] = result
+            print(
+                f"{name:>12} {result['rps']:>8.0f} {result['p50_ms']:>8.1f}"
+                f" {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+                f" {result['errors']:>7}"
+            )
+
+    write_results(args.json, "load", vars(args), results)
+
+
+if __name__ == "__main__":
+    main()
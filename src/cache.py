@@ -0,0 +1,295 @@
+"""
+Кэш чтения пользователей и элементов по id.
+
+В кэше хранятся словари схем (schemas.User, schemas.Item), готовые к
+сериализации в JSON, поэтому их можно хранить как в памяти процесса, так
+и во внешнем хранилище. Записи сбрасываются функциями crud при изменении
+данных, время жизни записи ограничивает устаревание, если данные изменены
+в обход crud (например, другим процессом при кэше в памяти).
+
+Каждый сброс ключа меняет его поколение. Читатель берет поколение ключа
+до чтения из БД и передает его в set: если ключ сброшен во время чтения,
+прочитанные данные могли устареть и в кэш не сохраняются.
+"""
+
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Iterable
+
+from src import config
+
+
+class CacheBackend(ABC):
+    """
+    Базовый класс хранилища кэша со счетчиками попаданий и промахов.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Any | None:
+        """
+        Возвращает значение по ключу key или None, если его нет в кэше.
+        """
+
+    @abstractmethod
+    def generation(self, key: str) -> int:
+        """
+        Возвращает поколение ключа key: оно меняется при каждом сбросе
+        ключа.
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any, generation: int | None = None) -> None:
+        """
+        Сохраняет значение value по ключу key. Если передано поколение
+        generation, значение сохраняется, только если с тех пор ключ не
+        сбрасывался.
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        """
+        Удаляет из кэша значения по ключам keys и меняет их поколения.
+        """
+
+    def clear(self) -> None:
+        """
+        Очищает кэш и сбрасывает счетчики.
+        """
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    @abstractmethod
+    def size(self) -> int:
+        """
+        Возвращает количество записей в кэше.
+        """
+
+    def stats(self) -> dict[str, int]:
+        """
+        Возвращает счетчики кэша.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": self.size(),
+        }
+
+
+class NullCache(CacheBackend):
+    """
+    Отключенный кэш: ничего не хранит, каждое чтение - промах.
+    """
+
+    def get(self, key: str) -> Any | None:
+        self.misses += 1
+        return None
+
+    def generation(self, key: str) -> int:
+        return 0
+
+    def set(self, key: str, value: Any, generation: int | None = None) -> None:
+        pass
+
+    def delete(self, *keys: str) -> None:
+        pass
+
+    def size(self) -> int:
+        return 0
+
+
+class LRUCache(CacheBackend):
+    """
+    Кэш в памяти процесса, ограниченный количеством записей maxsize
+    и временем жизни записи ttl в секундах. При переполнении вытесняются
+    давно не использованные записи.
+    Поколения хранятся для maxsize последних сброшенных ключей, у остальных
+    ключей поколение - наибольшее из вытесненных, поэтому вытеснение может
+    только лишний раз отменить заполнение, но не пропустить сброс.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Ключ -> (время истечения, значение), в порядке использования
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        # Ключ -> номер последнего сброса, в порядке сброса
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        # Счетчик сбросов и поколение ключей без своего номера
+        self._resets = 0
+        self._base_generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._generations.get(key, self._base_generation)
+
+    def set(self, key: str, value: Any, generation: int | None = None) -> None:
+        with self._lock:
+            current = self._generations.get(key, self._base_generation)
+            if generation is not None and generation != current:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._resets += 1
+                self._generations[key] = self._resets
+                self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, self._base_generation = self._generations.popitem(
+                    last=False
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            # Очистка сбрасывает все ключи
+            self._resets += 1
+            self._generations.clear()
+            self._base_generation = self._resets
+            super().clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """
+    Кэш во внешнем хранилище с интерфейсом Redis (get, set с ex, delete,
+    pipeline, transaction). Общий для всех процессов приложения.
+    Вытеснение выполняет само хранилище, поэтому счетчики evictions и
+    expirations не ведутся.
+    Поколение ключа - счетчик в отдельном ключе, который увеличивается при
+    сбросе и живет столько же, сколько запись. Заполнение с поколением
+    выполняется транзакцией с WATCH этого счетчика.
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "cache:"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Any | None:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def _generation_name(self, key: str) -> str:
+        return f"{self.prefix}generation:{key}"
+
+    def _expire(self) -> int:
+        return max(1, round(self.ttl))
+
+    def generation(self, key: str) -> int:
+        return int(self.client.get(self._generation_name(key)) or 0)
+
+    def set(self, key: str, value: Any, generation: int | None = None) -> None:
+        name, data = self.prefix + key, json.dumps(value)
+        if generation is None:
+            self.client.set(name, data, ex=self._expire())
+            return
+
+        def fill(pipe) -> None:
+            # Если счетчик изменится после WATCH, транзакция повторится
+            # и заполнение отменится
+            current = int(pipe.get(self._generation_name(key)) or 0)
+            if current != generation:
+                return
+            pipe.multi()
+            pipe.set(name, data, ex=self._expire())
+
+        self.client.transaction(fill, self._generation_name(key))
+
+    def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.incr(self._generation_name(key))
+            pipe.expire(self._generation_name(key), self._expire())
+        pipe.delete(*(self.prefix + key for key in keys))
+        pipe.execute()
+
+    def size(self) -> int:
+        return -1
+
+
+def create_cache() -> CacheBackend:
+    """
+    Создает хранилище кэша по настройкам из config.
+    """
+    if config.CACHE_BACKEND == "memory":
+        return LRUCache(maxsize=config.CACHE_MAXSIZE, ttl=config.CACHE_TTL)
+    if config.CACHE_BACKEND == "redis":
+        # Зависимость нужна только для этого хранилища
+        import redis
+
+        client = redis.Redis.from_url(config.CACHE_REDIS_URL)
+        return RedisCache(client, ttl=config.CACHE_TTL)
+    if config.CACHE_BACKEND == "none":
+        return NullCache()
+    raise ValueError(f"Unknown cache backend: {config.CACHE_BACKEND}")
+
+
+def user_key(id: int) -> str:
+    """
+    Возвращает ключ кэша пользователя с указанным id.
+    """
+    return f"user:{id}"
+
+
+def item_key(id: int) -> str:
+    """
+    Возвращает ключ кэша элемента с указанным id.
+    """
+    return f"item:{id}"
+
+
+def invalidate(
+    user_ids: Iterable[int] = (), item_ids: Iterable[int] = ()
+) -> None:
+    """
+    Удаляет из кэша пользователей с id из user_ids и элементы с id из
+    item_ids.
+    """
+    backend.delete(*map(user_key, user_ids), *map(item_key, item_ids))
+
+
+backend = create_cache()
@@ -0,0 +1,132 @@
+import os
+
+# Адрес подключения к БД
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///local.db")
+# Адрес подключения к той же БД через асинхронный драйвер
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:", 1),
+)
+
+# Адрес БД для чтения: GET-запросы выполняются через отдельный engine и
+# пул соединений, запись - только через DATABASE_URL. Это может быть реплика
+# или та же БД (по умолчанию): в режиме WAL соединения для чтения работают
+# параллельно с записью. Реплика может отставать от основной БД: запрос с
+# заголовком X-Read-Your-Writes читает из основной БД мимо кэша по id
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", DATABASE_URL)
+ASYNC_READ_DATABASE_URL = os.getenv(
+    "ASYNC_READ_DATABASE_URL",
+    READ_DATABASE_URL.replace("sqlite:", "sqlite+aiosqlite:", 1),
+)
+
+# Настройки пула соединений. По умолчанию пул вмещает 40 соединений - столько
+# же, сколько потоков в пуле Starlette. Если соединений меньше, под нагрузкой
+# все потоки заняты обработчиками, ждущими соединение, а сессии с
+# соединениями ждут свободный поток для сериализации ответа (взаимоблокировка)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Настройки пула соединений для чтения, задаются независимо от пула записи
+READ_DB_POOL_SIZE = int(os.getenv("READ_DB_POOL_SIZE", str(DB_POOL_SIZE)))
+READ_DB_MAX_OVERFLOW = int(
+    os.getenv("READ_DB_MAX_OVERFLOW", str(DB_MAX_OVERFLOW))
+)
+# Проверка соединения перед выдачей из пула
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+# Время жизни соединения в секундах (-1 - без ограничения)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+
+# Параметры sqlite, устанавливаемые при открытии соединения.
+# WAL позволяет читать параллельно с записью, synchronous=NORMAL в режиме WAL
+# убирает fsync при каждом коммите (fsync выполняется при checkpoint)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Время ожидания блокировки БД в миллисекундах
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+# Размер кэша страниц: отрицательное значение - в килобайтах (64 МБ)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))
+# Размер файла БД, отображаемого в память, в байтах (256 МБ)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", "268435456"))
+
+# Режим работы с БД: "sync" - синхронные обработчики в пуле потоков,
+# "async" - асинхронные обработчики и AsyncEngine (требуется aiosqlite)
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+# Стратегия жадной загрузки User.items при чтении пользователей:
+# "selectin" - отдельный запрос SELECT ... WHERE user_id IN (...) на пачку
+# пользователей, "joined" - один запрос с LEFT OUTER JOIN
+USER_ITEMS_LOADING = os.getenv("USER_ITEMS_LOADING", "selectin")
+
+# Размер страницы списков по умолчанию и максимально допустимый размер
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Количество строк, которое выбирается из БД за раз при потоковой выгрузке
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+# Количество строк, обрабатываемых в одной транзакции массовых операций
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+# Максимальное количество строк в одном запросе массовой операции
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "10000"))
+
+# Максимальное количество id в одном запросе пакетного чтения
+# (/users/batch, /items/batch)
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "1000"))
+# Количество id в одном условии WHERE id IN (...): не больше ограничения
+# sqlite на количество параметров запроса (999 в версиях до 3.32)
+SQL_IN_CHUNK_SIZE = int(os.getenv("SQL_IN_CHUNK_SIZE", "900"))
+
+# Кэш чтения пользователей и элементов по id: "memory" - LRU-кэш в памяти
+# процесса, "redis" - внешнее хранилище с интерфейсом Redis (требуется
+# пакет redis), "none" - кэш отключен
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+# Максимальное количество записей в кэше в памяти
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+# Время жизни записи в секундах
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+# Адрес хранилища для CACHE_BACKEND=redis
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Порог времени SQL-запроса в миллисекундах, начиная с которого запрос
+# вместе с параметрами пишется в лог (-1 - журнал отключен)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Сериализация страниц списков пользователей и элементов: "pydantic" -
+# объекты моделей проверяются и сериализуются через response_model,
+# "orjson" - выбираются только столбцы схем, и строки сериализуются в JSON
+# напрямую (требуется пакет orjson)
+RESPONSE_SERIALIZER = os.getenv("RESPONSE_SERIALIZER", "pydantic")
+
+# Групповая запись элементов ("1" - включена): POST /items/ ставит строку
+# в очередь потока записи, который вставляет накопленные строки одной
+# транзакцией. Ответ отправляется только после фиксации транзакции
+ITEM_WRITE_BATCHING = os.getenv("ITEM_WRITE_BATCHING", "0") == "1"
+# Максимальное количество строк в группе (не больше BULK_CHUNK_SIZE строк
+# в транзакции) и время ожидания строк после первой в миллисекундах
+ITEM_WRITE_BATCH_SIZE = int(os.getenv("ITEM_WRITE_BATCH_SIZE", "500"))
+ITEM_WRITE_BATCH_MS = float(os.getenv("ITEM_WRITE_BATCH_MS", "2"))
+
+# Прогрев приложения при старте ("1" - включен): пулы соединений заполняются
+# STARTUP_WARMUP_CONNECTIONS соединениями, а основные запросы чтения
+# выполняются один раз, чтобы их SQL был скомпилирован до первого запроса
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "0") == "1"
+STARTUP_WARMUP_CONNECTIONS = int(os.getenv("STARTUP_WARMUP_CONNECTIONS", "4"))
+
+# Параметры запуска сервера через src.server: адрес, порт и количество
+# рабочих процессов (по умолчанию по количеству ядер). Каждый процесс
+# создает свои engine и пулы соединений, а CACHE_BACKEND=memory при
+# нескольких процессах отключается
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+# Время в секундах, в течение которого остановленный процесс завершает
+# начатые запросы, прежде чем закрыть соединения
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+# Очистка мягко удаленных пользователей и элементов (src.purge): интервал
+# запуска фоновой очистки в секундах (0 - отключена), количество строк,
+# удаляемых одной транзакцией, и пауза между транзакциями в миллисекундах,
+# чтобы очистка не задерживала запись запросов
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "60"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_BATCH_PAUSE_MS = float(os.getenv("PURGE_BATCH_PAUSE_MS", "10"))
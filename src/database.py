@@ -1,25 +1,243 @@
-from sqlalchemy import create_engine
+import os
+import threading
+from typing import Any, AsyncIterator
+
+from fastapi import Header
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from src import config, metrics
+from src.migrations import migrate
 from src.models import Base
 
-# Адрес подключения к БД
-SQLALCHEMY_DATABASE_URL = "sqlite:///local.db"
+# Заголовок запроса, с которым чтение выполняется через основную БД, чтобы
+# увидеть собственные только что зафиксированные изменения
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
 
-# Настраиваем engine подключения
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-)
 
-# Настраиваем свой класс для сессии БД
-SessionLocal = sessionmaker(autoflush=False, bind=engine)
+def is_memory_database(url: str) -> bool:
+    """
+    Проверяет, что адрес url указывает на БД sqlite в памяти.
+    """
+    db_url = make_url(url)
+    return db_url.get_backend_name() == "sqlite" and db_url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def engine_options(url: str, read_only: bool = False) -> dict[str, Any]:
+    """
+    Возвращает параметры engine для адреса url из настроек config.
+    Для engine чтения (read_only) используются настройки пула для чтения.
+    """
+    db_url = make_url(url)
+    options: dict[str, Any] = {
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+    if db_url.get_backend_name() == "sqlite":
+        # Соединение sqlite используется разными потоками пула Starlette
+        options["connect_args"] = {"check_same_thread": False}
+        # БД в памяти использует пул из одного соединения
+        if is_memory_database(url):
+            return options
+    options.update(
+        pool_size=(
+            config.READ_DB_POOL_SIZE if read_only else config.DB_POOL_SIZE
+        ),
+        max_overflow=(
+            config.READ_DB_MAX_OVERFLOW
+            if read_only
+            else config.DB_MAX_OVERFLOW
+        ),
+        pool_timeout=config.DB_POOL_TIMEOUT,
+    )
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Устанавливает параметры sqlite из config для нового соединения.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT:d}")
+    cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE:d}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE:d}")
+    cursor.close()
+
+
+def set_sqlite_query_only(dbapi_connection, connection_record) -> None:
+    """
+    Запрещает запись через новое соединение sqlite.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def create_db_engine(
+    url: str = config.DATABASE_URL, read_only: bool = False
+) -> Engine:
+    """
+    Создает engine подключения к БД по адресу url с настройками из config.
+    Через соединения engine чтения (read_only) sqlite запись запрещена.
+    Запросы engine учитываются в метриках src.metrics.
+    """
+    engine = create_engine(url, **engine_options(url, read_only))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        if read_only:
+            event.listen(engine, "connect", set_sqlite_query_only)
+    metrics.instrument_engine(engine)
+    return engine
+
+
+def create_async_db_engine(
+    url: str = config.ASYNC_DATABASE_URL, read_only: bool = False
+) -> AsyncEngine:
+    """
+    Создает асинхронный engine подключения к БД по адресу url с настройками
+    из config. Через соединения engine чтения (read_only) sqlite запись
+    запрещена. Запросы engine учитываются в метриках src.metrics.
+    """
+    options = engine_options(url, read_only)
+    if "pool_size" in options:
+        # aiosqlite по умолчанию открывает соединение на каждую сессию
+        # (NullPool), используем пул соединений, как и для синхронного engine
+        options["poolclass"] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url, **options)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+        if read_only:
+            event.listen(engine.sync_engine, "connect", set_sqlite_query_only)
+    metrics.instrument_engine(engine.sync_engine)
+    return engine
+
+
+# engine создаются не при импорте модуля, а при старте приложения
+# (init_engines в lifespan src.main) или при первой сессии. Классы сессий
+# привязываются к engine при их создании
+engine: Engine | None = None
+read_engine: Engine | None = None
+SessionLocal = sessionmaker(autoflush=False)
+ReadSessionLocal = sessionmaker(autoflush=False)
+
+# Асинхронные engine создаются только в асинхронном режиме, чтобы aiosqlite
+# не требовался для синхронного
+async_engine: AsyncEngine | None = None
+async_read_engine: AsyncEngine | None = None
+AsyncSessionLocal = async_sessionmaker(autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False)
+
+_init_lock = threading.Lock()
+
+
+def init_engines() -> None:
+    """
+    Создает engine подключения к БД и engine для чтения (в асинхронном
+    режиме также асинхронные) и привязывает к ним классы сессий.
+    Повторный вызов ничего не делает.
+    """
+    global engine, read_engine, async_engine, async_read_engine
+    if engine is not None:
+        return
+    with _init_lock:
+        if engine is not None:
+            return
+        primary = create_db_engine(config.DATABASE_URL)
+        # engine для чтения с отдельным пулом соединений. БД в памяти
+        # существует только внутри соединения engine записи, поэтому
+        # читается через него
+        read_engine = primary
+        if not is_memory_database(config.READ_DATABASE_URL):
+            read_engine = create_db_engine(
+                config.READ_DATABASE_URL, read_only=True
+            )
+        SessionLocal.configure(bind=primary)
+        ReadSessionLocal.configure(bind=read_engine)
+
+        if config.DB_MODE == "async":
+            async_engine = create_async_db_engine(config.ASYNC_DATABASE_URL)
+            async_read_engine = async_engine
+            if not is_memory_database(config.ASYNC_READ_DATABASE_URL):
+                async_read_engine = create_async_db_engine(
+                    config.ASYNC_READ_DATABASE_URL, read_only=True
+                )
+            AsyncSessionLocal.configure(bind=async_engine)
+            AsyncReadSessionLocal.configure(bind=async_read_engine)
+        # Признак инициализации присваивается последним
+        engine = primary
+
+
+def reset_engines_after_fork() -> None:
+    """
+    Сбрасывает engine, унаследованные дочерним процессом при fork, чтобы
+    процесс создал свои engine и пулы при первом init_engines. Соединения
+    sqlite не должны использоваться несколькими процессами, поэтому
+    унаследованные соединения не закрываются (их закрывает родительский
+    процесс), а только забываются.
+    """
+    global engine, read_engine, async_engine, async_read_engine, _init_lock
+    for sync_engine in {engine, read_engine} - {None}:
+        sync_engine.dispose(close=False)
+    for aengine in {async_engine, async_read_engine} - {None}:
+        aengine.sync_engine.dispose(close=False)
+    engine = read_engine = async_engine = async_read_engine = None
+    # Блокировка могла быть захвачена другим потоком родителя в момент fork
+    _init_lock = threading.Lock()
+
+
+# Рабочие процессы, созданные fork после инициализации (например, gunicorn
+# с preload), создают свои engine
+os.register_at_fork(after_in_child=reset_engines_after_fork)
+
+
+def fill_pool(engine: Engine, size: int) -> None:
+    """
+    Открывает size соединений engine одновременно и возвращает их в пул,
+    чтобы первые запросы не ждали открытия соединений.
+    """
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+
+
+async def fill_async_pool(engine: AsyncEngine, size: int) -> None:
+    """
+    Открывает size соединений асинхронного engine одновременно и возвращает
+    их в пул.
+    """
+    connections = [await engine.connect() for _ in range(size)]
+    for connection in connections:
+        await connection.close()
+
+
+async def dispose_engines() -> None:
+    """
+    Закрывает соединения пулов всех созданных engine.
+    """
+    for sync_engine in {engine, read_engine} - {None}:
+        sync_engine.dispose()
+    for aengine in {async_engine, async_read_engine} - {None}:
+        await aengine.dispose()
 
 
 def get_db():
     """
-    Генератор сессий БД.
+    Генератор сессий основной БД для обработчиков, изменяющих данные.
     """
+    init_engines()
     db = SessionLocal()
     try:
         yield db
@@ -27,12 +245,56 @@ def get_db():
         db.close()
 
 
+def get_read_db(
+    read_your_writes: bool = Header(False, alias=READ_YOUR_WRITES_HEADER),
+):
+    """
+    Генератор сессий БД для чтения. С заголовком X-Read-Your-Writes сессия
+    работает с основной БД, иначе с engine для чтения.
+    """
+    init_engines()
+    db = SessionLocal() if read_your_writes else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Асинхронный генератор сессий основной БД для обработчиков, изменяющих
+    данные.
+    """
+    init_engines()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db(
+    read_your_writes: bool = Header(False, alias=READ_YOUR_WRITES_HEADER),
+) -> AsyncIterator[AsyncSession]:
+    """
+    Асинхронный генератор сессий БД для чтения. С заголовком
+    X-Read-Your-Writes сессия работает с основной БД, иначе с engine для
+    чтения.
+    """
+    init_engines()
+    session_local = (
+        AsyncSessionLocal if read_your_writes else AsyncReadSessionLocal
+    )
+    async with session_local() as db:
+        yield db
+
+
 def create_database():
     """
     Создает таблицы в БД (также создается файл БД, если используется sqlite).
     Таблицы создаются на основе моделей из src/models.py.
+    Изменения схемы в уже существующих таблицах применяются миграциями.
     """
+    init_engines()
     Base.metadata.create_all(bind=engine)
+    migrate(engine)
 
 
 if __name__ == "__main__":
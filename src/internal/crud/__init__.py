@@ -0,0 +1,131 @@
+from typing import Any, Callable, Iterable, Iterator, Sequence, TypeVar
+
+from sqlalchemy import Select, literal, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+from src import cache, config
+
+T = TypeVar("T")
+
+
+def chunked(
+    rows: Sequence[T], size: int | None = None
+) -> Iterator[tuple[int, Sequence[T]]]:
+    """
+    Разбивает rows на пачки по size штук.
+    Возвращает пары (индекс первой строки пачки, пачка).
+    """
+    size = size or config.BULK_CHUNK_SIZE
+    for start in range(0, len(rows), size):
+        yield start, rows[start : start + size]
+
+
+def detach(db: Session, *objs) -> None:
+    """
+    Отсоединяет объекты objs от сессии db. Commit сбрасывает атрибуты
+    объектов сессии, и их чтение после commit выполняет повторный SELECT,
+    а у отсоединенных объектов остаются значения, полученные через
+    RETURNING.
+    """
+    for obj in objs:
+        db.expunge(obj)
+
+
+def keyset_page(
+    stmt: Select,
+    key: InstrumentedAttribute,
+    after_id: int | None = None,
+    limit: int | None = None,
+) -> Select:
+    """
+    Добавляет к запросу stmt постраничную выборку по ключу (keyset):
+    строки с key больше after_id, не более limit штук, упорядоченные по key.
+    """
+    stmt = stmt.order_by(key)
+    if after_id is not None:
+        stmt = stmt.where(key > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def sorted_page(
+    stmt: Select,
+    keys: Sequence[InstrumentedAttribute],
+    descending: bool = False,
+    after_id: int | None = None,
+    limit: int | None = None,
+    after_key: Sequence | None = None,
+) -> Select:
+    """
+    Добавляет к запросу stmt порядок по столбцам keys, последний из которых
+    id, и постраничную выборку по ключу сортировки (keyset): строки после
+    строки с ключом (*after_key, after_id), не более limit штук. after_key -
+    значения остальных столбцов ключа последней строки предыдущей страницы,
+    поэтому следующая страница не зависит от того, изменена или удалена ли
+    с тех пор эта строка. Для сортировки только по id after_key не нужен.
+    """
+    if after_id is not None:
+        after_key = after_key or []
+        if len(after_key) != len(keys) - 1:
+            raise ValueError("Page key does not match the sort keys")
+        values = [literal(value) for value in after_key]
+        cursor = tuple_(*values, literal(after_id))
+        key = tuple_(*keys)
+        stmt = stmt.where(key < cursor if descending else key > cursor)
+    stmt = stmt.order_by(*(key.desc() if descending else key for key in keys))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def get_by_ids(
+    stmt: Select,
+    key: InstrumentedAttribute,
+    ids: Iterable[int],
+    db: Session,
+) -> dict[int, Any]:
+    """
+    Выбирает объекты запроса stmt, у которых key входит в ids, запросами
+    WHERE key IN (...) пачками по config.SQL_IN_CHUNK_SIZE id.
+    Возвращает словарь id -> объект, id которых нет в БД, в нем нет.
+    """
+    found = {}
+    unique_ids = list(dict.fromkeys(ids))
+    for _, chunk in chunked(unique_ids, config.SQL_IN_CHUNK_SIZE):
+        # unique нужен при жадной загрузке связей через JOIN
+        for obj in db.scalars(stmt.where(key.in_(chunk))).unique():
+            found[obj.id] = obj
+    return found
+
+
+def get_cached_by_ids(
+    ids: Iterable[int],
+    key: Callable[[int], str],
+    load: Callable[[list[int]], dict[int, dict]],
+    use_cache: bool = True,
+) -> dict[int, dict]:
+    """
+    Возвращает словари записей с id из ids: из кэша по ключам key(id), а
+    не найденные в кэше - одним вызовом load, который возвращает словарь
+    id -> словарь записи. Прочитанные из БД записи сохраняются в кэш, если
+    их ключи не сбрасывались во время чтения.
+    С use_cache=False все записи читаются вызовом load, а кэш не
+    читается и не заполняется.
+    """
+    if not use_cache:
+        return load(list(dict.fromkeys(ids)))
+    found = {}
+    # id -> поколение ключа до чтения из БД
+    missing = {}
+    for id in dict.fromkeys(ids):
+        data = cache.backend.get(key(id))
+        if data is None:
+            missing[id] = cache.backend.generation(key(id))
+        else:
+            found[id] = data
+    if missing:
+        for id, data in load(list(missing)).items():
+            cache.backend.set(key(id), data, missing[id])
+            found[id] = data
+    return found
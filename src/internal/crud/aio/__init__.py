@@ -0,0 +1,77 @@
+"""
+Асинхронные варианты функций crud.
+
+Каждая функция выполняет синхронную функцию crud через
+AsyncSession.run_sync: запросы идут через асинхронный драйвер, а логика
+работы с БД остается в одном месте. Все атрибуты возвращаемых объектов,
+включая связи, загружаются внутри run_sync, так как ленивая загрузка вне
+него в асинхронном режиме невозможна.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class BatchLoader(Generic[T]):
+    """
+    Загрузчик записей по id, объединяющий одиночные запросы (DataLoader):
+    id, запрошенные через load в одной итерации цикла событий (например,
+    параллельными задачами одного HTTP-запроса), загружаются одним вызовом
+    batch_load, который возвращает словарь id -> запись. Пачки выполняются
+    по одной, так как одновременные запросы через одну AsyncSession
+    недопустимы. Результаты запоминаются на время жизни загрузчика, поэтому
+    он создается на один HTTP-запрос.
+    """
+
+    def __init__(
+        self, batch_load: Callable[[list[int]], Awaitable[dict[int, T]]]
+    ):
+        self.batch_load = batch_load
+        self._futures: dict[int, asyncio.Future] = {}
+        self._pending: list[int] = []
+        self._lock = asyncio.Lock()
+        # Ссылки на задачи загрузки, чтобы их не удалил сборщик мусора
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, id: int) -> T | None:
+        """
+        Возвращает запись с указанным id или None, если ее нет.
+        """
+        future = self._futures.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[id] = loop.create_future()
+            self._pending.append(id)
+            if len(self._pending) == 1:
+                # Пачка отправляется в следующей итерации цикла, после
+                # задач, которые уже готовы выполниться и вызвать load
+                loop.call_soon(self._schedule)
+        return await future
+
+    async def load_many(self, ids: list[int]) -> list[T | None]:
+        """
+        Возвращает записи с id из ids (None для отсутствующих) в том же
+        порядке.
+        """
+        return await asyncio.gather(*(self.load(id) for id in ids))
+
+    def _schedule(self) -> None:
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self) -> None:
+        async with self._lock:
+            ids, self._pending = self._pending, []
+            try:
+                found = await self.batch_load(ids)
+            except Exception as e:
+                # Ошибка передается ожидающим, следующий load повторит
+                # запрос
+                for id in ids:
+                    self._futures.pop(id).set_exception(e)
+                return
+            for id in ids:
+                self._futures[id].set_result(found.get(id))
@@ -0,0 +1,16 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import schemas
+from src.internal.crud import change as crud
+
+
+async def get_changes(
+    db: AsyncSession, since: int = 0, limit: int | None = None
+) -> list[schemas.Change]:
+    """
+    Возвращает не более limit изменений пользователей и элементов с
+    номером больше since в порядке номеров.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_changes(db=s, since=since, limit=limit)
+    )
@@ -0,0 +1,178 @@
+from typing import AsyncIterator, Iterable, Sequence
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import models, schemas
+from src.internal.crud import item as crud
+from src.internal.crud.aio import BatchLoader
+
+
+async def get_items(
+    db: AsyncSession,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.ItemFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[models.Item]:
+    """
+    Возвращает список элементов из БД, отобранных по filters.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_items(
+            db=s,
+            after_id=after_id,
+            limit=limit,
+            filters=filters,
+            after_key=after_key,
+        ).all()
+    )
+
+
+async def get_item_rows(
+    db: AsyncSession,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.ItemFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[Row]:
+    """
+    Возвращает страницу элементов в виде кортежей столбцов
+    serialization.ITEM_FIELDS.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_item_rows(
+            db=s,
+            after_id=after_id,
+            limit=limit,
+            filters=filters,
+            after_key=after_key,
+        )
+    )
+
+
+async def search_items(
+    q: str, db: AsyncSession, limit: int
+) -> list[models.Item]:
+    """
+    Ищет элементы по словам q в title и description.
+    """
+    return await db.run_sync(
+        lambda s: crud.search_items(q=q, db=s, limit=limit)
+    )
+
+
+async def get_item_stats(db: AsyncSession) -> schemas.ItemStats:
+    """
+    Возвращает статистику элементов, посчитанную в БД.
+    """
+    return await db.run_sync(lambda s: crud.get_item_stats(db=s))
+
+
+async def iter_items(
+    db: AsyncSession, chunk_size: int | None = None
+) -> AsyncIterator[list[models.Item]]:
+    """
+    Возвращает асинхронный итератор по всем элементам из БД пачками
+    по chunk_size штук.
+    """
+    result = await db.stream_scalars(crud.iter_items_stmt(chunk_size))
+    async for chunk in result.partitions():
+        yield chunk
+
+
+async def get_item_by_id(id: int, db: AsyncSession) -> models.Item:
+    """
+    Возвращает элемент по указанному id.
+    """
+    return await db.run_sync(lambda s: crud.get_item_by_id(id=id, db=s))
+
+
+async def get_item_cached(
+    id: int, db: AsyncSession, use_cache: bool = True
+) -> dict | None:
+    """
+    Возвращает элемент по указанному id в виде словаря схемы
+    schemas.ItemVersioned через кэш.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_item_cached(id=id, db=s, use_cache=use_cache)
+    )
+
+
+async def get_items_cached(
+    ids: Iterable[int], db: AsyncSession, use_cache: bool = True
+) -> dict[int, dict]:
+    """
+    Возвращает элементы с id из ids в виде словаря id -> словарь схемы
+    schemas.ItemVersioned через кэш.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_items_cached(ids=ids, db=s, use_cache=use_cache)
+    )
+
+
+def item_loader(db: AsyncSession) -> BatchLoader[dict]:
+    """
+    Возвращает загрузчик элементов по id для сессии db, который объединяет
+    одновременные запросы в один вызов get_items_cached.
+    """
+    return BatchLoader(lambda ids: get_items_cached(ids=ids, db=db))
+
+
+async def create_item(
+    item: schemas.ItemCreate, db: AsyncSession
+) -> models.Item | None:
+    """
+    Создает новый элемент на основе полей схемы item, если есть
+    пользователь item.user_id.
+    """
+    return await db.run_sync(lambda s: crud.create_item(item=item, db=s))
+
+
+async def update_item(
+    id: int,
+    item: schemas.ItemCreate,
+    db: AsyncSession,
+    versions: list[int] | None = None,
+) -> models.Item | None:
+    """
+    Обновляет элемент с указанным id значениями из схемы item.
+    """
+    return await db.run_sync(
+        lambda s: crud.update_item(id=id, item=item, db=s, versions=versions)
+    )
+
+
+async def delete_item(db_item: models.Item, db: AsyncSession) -> None:
+    """
+    Удаляет элемент db_item.
+    """
+    return await db.run_sync(lambda s: crud.delete_item(db_item=db_item, db=s))
+
+
+async def create_items(
+    items: list[schemas.ItemCreate], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Создает элементы из списка схем items пачками.
+    """
+    return await db.run_sync(lambda s: crud.create_items(items=items, db=s))
+
+
+async def update_items(
+    items: list[schemas.ItemBulkUpdate], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Обновляет элементы по id из списка схем items пачками.
+    """
+    return await db.run_sync(lambda s: crud.update_items(items=items, db=s))
+
+
+async def delete_items(
+    ids: list[int], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Удаляет элементы по списку ids пачками.
+    """
+    return await db.run_sync(lambda s: crud.delete_items(ids=ids, db=s))
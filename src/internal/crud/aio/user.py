@@ -0,0 +1,218 @@
+from typing import AsyncIterator, Iterable, Sequence
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import models, schemas
+from src.internal.crud import user as crud
+from src.internal.crud.aio import BatchLoader
+
+
+def _with_items(db_user: models.User | None) -> models.User | None:
+    """
+    Загружает элементы пользователя, если они еще не загружены.
+    """
+    if db_user is not None:
+        db_user.items
+    return db_user
+
+
+async def get_users(
+    db: AsyncSession,
+    after_id: int | None = None,
+    limit: int | None = None,
+    strategy: str | None = None,
+    projection: schemas.UserProjection | None = None,
+    filters: schemas.UserFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[models.User]:
+    """
+    Возвращает и БД список пользователей, отобранных по filters.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_users(
+            db=s,
+            after_id=after_id,
+            limit=limit,
+            strategy=strategy,
+            projection=projection,
+            filters=filters,
+            after_key=after_key,
+        ).all()
+    )
+
+
+async def get_user_rows(
+    db: AsyncSession,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.UserFilter | None = None,
+    after_key: Sequence | None = None,
+) -> tuple[list[Row], list[Row]]:
+    """
+    Возвращает страницу пользователей в виде кортежей столбцов
+    serialization.USER_FIELDS и их элементы в виде кортежей столбцов
+    serialization.ITEM_FIELDS.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_user_rows(
+            db=s,
+            after_id=after_id,
+            limit=limit,
+            filters=filters,
+            after_key=after_key,
+        )
+    )
+
+
+async def iter_users(
+    db: AsyncSession, chunk_size: int | None = None
+) -> AsyncIterator[list[models.User]]:
+    """
+    Возвращает асинхронный итератор по всем пользователям из БД пачками
+    по chunk_size штук.
+    """
+    result = await db.stream_scalars(crud.iter_users_stmt(chunk_size))
+    async for chunk in result.partitions():
+        yield chunk
+
+
+async def get_user_by_id(
+    id: int,
+    db: AsyncSession,
+    strategy: str | None = None,
+    projection: schemas.UserProjection | None = None,
+) -> models.User:
+    """
+    Возвращает пользователя по указанному id
+    """
+
+    def get(s: Session) -> models.User | None:
+        db_user = crud.get_user_by_id(
+            id=id, db=s, strategy=strategy, projection=projection
+        )
+        # Без элементов в проекции их чтение вызывает ошибку
+        if projection is None or projection.include_items:
+            _with_items(db_user)
+        return db_user
+
+    return await db.run_sync(get)
+
+
+async def user_exists(id: int, db: AsyncSession) -> bool:
+    """
+    Проверяет, есть ли пользователь с указанным id.
+    """
+    return await db.run_sync(lambda s: crud.user_exists(id=id, db=s))
+
+
+async def get_user_stats(db: AsyncSession, top: int = 10) -> schemas.UserStats:
+    """
+    Возвращает статистику пользователей, посчитанную в БД.
+    """
+    return await db.run_sync(lambda s: crud.get_user_stats(db=s, top=top))
+
+
+async def get_user_cached(
+    id: int, db: AsyncSession, use_cache: bool = True
+) -> dict | None:
+    """
+    Возвращает пользователя по указанному id в виде словаря схемы
+    schemas.UserVersioned через кэш.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_user_cached(id=id, db=s, use_cache=use_cache)
+    )
+
+
+async def get_users_cached(
+    ids: Iterable[int], db: AsyncSession, use_cache: bool = True
+) -> dict[int, dict]:
+    """
+    Возвращает пользователей с id из ids в виде словаря id -> словарь схемы
+    schemas.UserVersioned через кэш.
+    """
+    return await db.run_sync(
+        lambda s: crud.get_users_cached(ids=ids, db=s, use_cache=use_cache)
+    )
+
+
+def user_loader(db: AsyncSession) -> BatchLoader[dict]:
+    """
+    Возвращает загрузчик пользователей по id для сессии db, который объединяет
+    одновременные запросы в один вызов get_users_cached.
+    """
+    return BatchLoader(lambda ids: get_users_cached(ids=ids, db=db))
+
+
+async def get_user_by_email(
+    email: str, db: AsyncSession, strategy: str | None = None
+) -> models.User:
+    """
+    Возвращает пользователя по указанному email
+    """
+    return await db.run_sync(
+        lambda s: _with_items(
+            crud.get_user_by_email(email=email, db=s, strategy=strategy)
+        )
+    )
+
+
+async def create_user(
+    user: schemas.UserCreate, db: AsyncSession
+) -> models.User:
+    """
+    Создает нового пользователя в БД из полей схемы user.
+    """
+    return await db.run_sync(
+        lambda s: _with_items(crud.create_user(user=user, db=s))
+    )
+
+
+async def update_user(
+    id: int,
+    user: schemas.UserCreate,
+    db: AsyncSession,
+    versions: list[int] | None = None,
+) -> models.User | None:
+    """
+    Обновляет поля пользователя с указанным id значениями из схемы user.
+    """
+    return await db.run_sync(
+        lambda s: crud.update_user(id=id, user=user, db=s, versions=versions)
+    )
+
+
+async def delete_user(db_user: models.User, db: AsyncSession) -> None:
+    """
+    Мягко удаляет указаного пользователя.
+    """
+    return await db.run_sync(lambda s: crud.delete_user(db_user=db_user, db=s))
+
+
+async def create_users(
+    users: list[schemas.UserCreate], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Создает пользователей из списка схем users пачками.
+    """
+    return await db.run_sync(lambda s: crud.create_users(users=users, db=s))
+
+
+async def update_users(
+    users: list[schemas.UserBulkUpdate], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Обновляет пользователей по id из списка схем users пачками.
+    """
+    return await db.run_sync(lambda s: crud.update_users(users=users, db=s))
+
+
+async def delete_users(
+    ids: list[int], db: AsyncSession
+) -> list[schemas.BulkResult]:
+    """
+    Удаляет пользователей по списку ids пачками.
+    """
+    return await db.run_sync(lambda s: crud.delete_users(ids=ids, db=s))
@@ -0,0 +1,60 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session, raiseload
+
+from src import models, schemas
+from src.internal.crud import get_by_ids
+from src.internal.crud import item as itemcrud
+
+
+def get_changes(
+    db: Session, since: int = 0, limit: int | None = None
+) -> list[schemas.Change]:
+    """
+    Возвращает не более limit изменений пользователей и элементов с
+    номером больше since в порядке номеров. Запрос читает первичный ключ
+    changes от since, поэтому его стоимость зависит от количества
+    изменений, а не от размера таблиц. Текущее состояние неудаленных
+    записей читается одним запросом на тип записи. Запись, которой уже
+    нет среди неудаленных (например, элемент удаленного пользователя),
+    возвращается удаленной.
+    """
+    changes = db.scalars(
+        select(models.Change)
+        .where(models.Change.seq > since)
+        .order_by(models.Change.seq)
+        .limit(limit)
+    ).all()
+    ids = {"user": [], "item": []}
+    for change in changes:
+        if not change.deleted:
+            ids[change.entity].append(change.entity_id)
+    # Состояние читается в той же транзакции, что и журнал, поэтому оно
+    # не старше изменений страницы
+    users = get_by_ids(
+        select(models.User).options(raiseload(models.User.items)),
+        models.User.id,
+        ids["user"],
+        db,
+    )
+    items = itemcrud.get_items_by_ids(ids=ids["item"], db=db)
+
+    results = []
+    for change in changes:
+        result = schemas.Change(
+            seq=change.seq,
+            entity=change.entity,
+            id=change.entity_id,
+            deleted=True,
+        )
+        if change.entity == "user" and change.entity_id in users:
+            result.deleted = False
+            result.user = schemas.UserChanged.model_validate(
+                users[change.entity_id]
+            )
+        elif change.entity == "item" and change.entity_id in items:
+            result.deleted = False
+            result.item = schemas.ItemVersioned.model_validate(
+                items[change.entity_id]
+            )
+        results.append(result)
+    return results
@@ -1,14 +1,256 @@
-from sqlalchemy import select
+import re
+import sys
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import (
+    Row,
+    Select,
+    Subquery,
+    Update,
+    case,
+    column,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    table,
+    update,
+)
 from sqlalchemy.orm import Session
 
-from src import models, schemas
+from src import cache, config, models, schemas, serialization
+from src.internal.crud import (
+    chunked,
+    detach,
+    get_by_ids,
+    get_cached_by_ids,
+    sorted_page,
+)
+
+# Порядки сортировки элементов: столбцы ключа и признак убывания. Ключ
+# заканчивается id, чтобы порядок был однозначным, и совпадает с индексом
+# (индекс sqlite по title включает rowid)
+ITEM_SORTS = {
+    "id": ((models.Item.id,), False),
+    "-id": ((models.Item.id,), True),
+    "title": ((models.Item.title, models.Item.id), False),
+    "-title": ((models.Item.title, models.Item.id), True),
+}
+
+# Условие неудаленного элемента неудаленного пользователя для запросов
+# изменения, к которым не добавляется models.exclude_deleted
+LIVE_ITEM = models.Item.deleted_at.is_(None) & models.Item.user_id.not_in(
+    models.deleted_users
+)
+
+# Нижние границы корзин распределения владельцев по количеству элементов
+ITEMS_PER_OWNER_BOUNDS = (1, 2, 5, 10, 100, 1000)
+
+# Полнотекстовый индекс элементов (models.ITEMS_FTS_DDL). Столбец с именем
+# таблицы обозначает в условии MATCH все индексируемые столбцы
+items_fts = table(
+    "items_fts", column("rowid"), column("rank"), column("items_fts")
+)
+
+
+def prefix_upper_bound(prefix: str) -> str | None:
+    """
+    Возвращает наименьшую строку, которая больше всех строк, начинающихся
+    с prefix: последний символ prefix заменяется следующим. Символы
+    U+10FFFF в конце отбрасываются, как при переносе разряда; если prefix
+    состоит только из них, границы нет и возвращается None. Суррогаты
+    пропускаются: их нельзя записать в UTF-8.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return prefix[:-1] + chr(code)
+
+
+def items_page(
+    stmt: Select,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.ItemFilter | None = None,
+    after_key: Sequence | None = None,
+) -> Select:
+    """
+    Добавляет к запросу элементов stmt условия filters, порядок filters.sort
+    и постраничную выборку по ключу сортировки (keyset): возвращаются
+    элементы после элемента с ключом (*after_key, after_id), не более limit
+    штук. Для сортировки по title after_key - название последнего элемента
+    предыдущей страницы (см. sorted_page).
+    """
+    filters = filters or schemas.ItemFilter()
+    if filters.sort not in ITEM_SORTS:
+        raise ValueError(f"Unknown items sort: {filters.sort}")
+    keys, descending = ITEM_SORTS[filters.sort]
+
+    if filters.user_id is not None:
+        stmt = stmt.where(models.Item.user_id == filters.user_id)
+    if filters.title_prefix:
+        # Диапазон вместо LIKE, чтобы использовался индекс по title
+        stmt = stmt.where(models.Item.title >= filters.title_prefix)
+        upper = prefix_upper_bound(filters.title_prefix)
+        if upper is not None:
+            stmt = stmt.where(models.Item.title < upper)
+    if filters.min_id is not None:
+        stmt = stmt.where(models.Item.id >= filters.min_id)
+    if filters.max_id is not None:
+        stmt = stmt.where(models.Item.id <= filters.max_id)
+    return sorted_page(stmt, keys, descending, after_id, limit, after_key)
+
+
+def get_items(
+    db: Session,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.ItemFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[models.Item]:
+    """
+    Возвращает список элементов из БД, отобранных по filters и
+    упорядоченных по filters.sort (по умолчанию по id).
+    Постраничная выборка делается по ключу (keyset): возвращаются элементы
+    после элемента с ключом (*after_key, after_id), не более limit штук.
+    В отличие от OFFSET стоимость запроса не зависит от номера страницы.
+    """
+    return db.scalars(
+        items_page(select(models.Item), after_id, limit, filters, after_key)
+    )
+
+
+def get_item_rows(
+    db: Session,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.ItemFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[Row]:
+    """
+    Возвращает страницу элементов, как get_items, в виде кортежей столбцов
+    serialization.ITEM_FIELDS, без построения объектов модели.
+    """
+    columns = [getattr(models.Item, f) for f in serialization.ITEM_FIELDS]
+    return db.execute(
+        items_page(select(*columns), after_id, limit, filters, after_key)
+    ).all()
+
+
+def fts_query(q: str) -> str | None:
+    """
+    Преобразует строку поиска q в запрос FTS5: элемент должен содержать все
+    слова q, последнее слово может быть началом слова. Слова берутся
+    в кавычки, поэтому синтаксис FTS5 в q не действует.
+    Возвращает None, если в q нет слов.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def search_items(q: str, db: Session, limit: int) -> list[models.Item]:
+    """
+    Ищет элементы по словам q в title и description по полнотекстовому
+    индексу items_fts. Возвращает не более limit элементов, упорядоченных
+    по релевантности.
+    """
+    query = fts_query(q)
+    if query is None:
+        return []
+    return db.scalars(
+        select(models.Item)
+        .join(items_fts, items_fts.c.rowid == models.Item.id)
+        .where(items_fts.c.items_fts.match(query))
+        .order_by(items_fts.c.rank)
+        .limit(limit)
+    ).all()
+
+
+def item_counts() -> Subquery:
+    """
+    Возвращает подзапрос количества элементов каждого владельца
+    (user_id, items_count): GROUP BY items.user_id выполняется по индексу,
+    без чтения строк элементов.
+    """
+    return (
+        select(models.Item.user_id, func.count().label("items_count"))
+        .group_by(models.Item.user_id)
+        .subquery()
+    )
+
+
+def get_item_stats(db: Session) -> schemas.ItemStats:
+    """
+    Возвращает статистику элементов, посчитанную в БД: количество
+    элементов, владельцев, элементов без владельца в users и распределение
+    владельцев по количеству элементов. Размер результата не зависит от
+    количества строк.
+    """
+    counts = item_counts()
+    bounds = ITEMS_PER_OWNER_BOUNDS
+    # Нижняя граница корзины владельца
+    bucket = case(
+        *(
+            (counts.c.items_count < upper, lower)
+            for lower, upper in zip(bounds, bounds[1:])
+        ),
+        else_=bounds[-1],
+    )
+    rows = db.execute(
+        select(bucket, func.count(), func.sum(counts.c.items_count)).group_by(
+            bucket
+        )
+    ).all()
+    # Владелец проверяется один раз на группу его элементов
+    orphans = db.scalar(
+        select(func.coalesce(func.sum(counts.c.items_count), 0)).where(
+            ~exists().where(models.User.id == counts.c.user_id)
+        )
+    )
+    owners = {lower: count for lower, count, _ in rows}
+    uppers = [bound - 1 for bound in bounds[1:]] + [None]
+    return schemas.ItemStats(
+        items=sum(items for *_, items in rows),
+        owners=sum(owners.values()),
+        orphans=orphans,
+        items_per_owner=[
+            schemas.CountBucket(
+                min_items=lower, max_items=upper, owners=owners.get(lower, 0)
+            )
+            for lower, upper in zip(bounds, uppers)
+        ],
+    )
 
 
-def get_items(db: Session) -> list[models.Item]:
+def iter_items_stmt(chunk_size: int | None = None) -> Select:
     """
-    Возвращает список элементов из БД.
+    Возвращает запрос всех элементов, строки которого выбираются из курсора
+    БД пачками по chunk_size штук (yield_per).
     """
-    return db.scalars(select(models.Item))
+    return (
+        select(models.Item)
+        .order_by(models.Item.id)
+        .execution_options(yield_per=chunk_size or config.EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_items(
+    db: Session, chunk_size: int | None = None
+) -> Iterator[list[models.Item]]:
+    """
+    Возвращает итератор по всем элементам из БД пачками по chunk_size штук.
+    Строки выбираются из курсора БД по мере чтения, поэтому расход памяти
+    не зависит от количества элементов. Запрос выполняется при получении
+    первой пачки.
+    """
+    yield from db.scalars(iter_items_stmt(chunk_size)).partitions()
 
 
 def get_item_by_id(id: int, db: Session) -> models.Item:
@@ -18,41 +260,330 @@ def get_item_by_id(id: int, db: Session) -> models.Item:
     return db.get(models.Item, id)
 
 
-def create_item(item: schemas.ItemCreate, db: Session) -> models.Item:
+def get_item_cached(
+    id: int, db: Session, use_cache: bool = True
+) -> dict | None:
     """
-    Создает новый элемент на основе полей схемы item.
-    Возвращает созданный экземпляр модели Item.
+    Возвращает элемент по указанному id в виде словаря схемы
+    schemas.ItemVersioned. Словарь берется из кэша, при промахе - читается
+    из БД и сохраняется в кэш, если ключ не сбрасывался во время чтения.
+    Возвращает None, если элемента нет. С use_cache=False читается из БД
+    без кэша.
     """
-    db_item = models.Item(**item.model_dump())
-    db.add(db_item)
+    key = cache.item_key(id)
+    data = cache.backend.get(key) if use_cache else None
+    if data is None:
+        # Поколение берется до чтения: сброс во время чтения отменит
+        # заполнение кэша устаревшими данными
+        generation = cache.backend.generation(key) if use_cache else None
+        db_item = get_item_by_id(id=id, db=db)
+        if db_item is None:
+            return None
+        data = schemas.ItemVersioned.model_validate(db_item).model_dump(
+            mode="json"
+        )
+        if use_cache:
+            cache.backend.set(key, data, generation)
+    return data
+
+
+def get_items_by_ids(
+    ids: Iterable[int], db: Session
+) -> dict[int, models.Item]:
+    """
+    Возвращает элементы с id из ids одним запросом WHERE id IN (...) (при
+    большом количестве id - несколькими) в виде словаря id -> элемент.
+    Элементов, которых нет в БД, в словаре нет.
+    """
+    return get_by_ids(select(models.Item), models.Item.id, ids, db)
+
+
+def get_items_cached(
+    ids: Iterable[int], db: Session, use_cache: bool = True
+) -> dict[int, dict]:
+    """
+    Возвращает элементы с id из ids в виде словаря id -> словарь схемы
+    schemas.ItemVersioned. Элементы берутся из кэша, не найденные в нем -
+    читаются из БД одним запросом и сохраняются в кэш.
+    """
+
+    def load(missing: list[int]) -> dict[int, dict]:
+        return {
+            id: schemas.ItemVersioned.model_validate(db_item).model_dump(
+                mode="json"
+            )
+            for id, db_item in get_items_by_ids(ids=missing, db=db).items()
+        }
+
+    return get_cached_by_ids(ids, cache.item_key, load, use_cache)
+
+
+def create_item(item: schemas.ItemCreate, db: Session) -> models.Item | None:
+    """
+    Создает новый элемент на основе полей схемы item одним запросом
+    INSERT ... SELECT ... RETURNING, строка вставляется, только если есть
+    пользователь item.user_id.
+    Возвращает созданный экземпляр модели Item или None, если пользователя
+    нет.
+    """
+    values = item.model_dump()
+    columns = models.Item.__table__.c
+    row = select(
+        *(literal(value, columns[key].type) for key, value in values.items())
+    ).where(
+        exists().where(
+            models.User.id == item.user_id, models.User.deleted_at.is_(None)
+        )
+    )
+    db_item = db.scalars(
+        insert(models.Item)
+        .from_select(list(values), row)
+        .returning(models.Item)
+    ).one_or_none()
+    if db_item is not None:
+        detach(db, db_item)
     db.commit()
-    db.refresh(db_item)
+    if db_item is not None:
+        # Элементы входят в представление владельца, а id удаленных
+        # записей в sqlite могут выдаваться повторно
+        cache.invalidate(user_ids=[db_item.user_id], item_ids=[db_item.id])
     return db_item
 
 
 def update_item(
-    db_item: models.Item, item: schemas.ItemCreate, db: Session
-) -> models.Item:
+    id: int,
+    item: schemas.ItemCreate,
+    db: Session,
+    versions: list[int] | None = None,
+) -> models.Item | None:
     """
-    Обновляет экземпляр db_item значениями из схемы item.
-    Возвращает обновленный экземпляр модели Item.
+    Обновляет элемент с указанным id значениями из схемы item условным
+    запросом UPDATE ... RETURNING и увеличивает версию строки. Если указан
+    versions, элемент обновляется, только если его версия есть в списке.
+    Если владелец не меняется, выполняется один запрос. Иначе текущий
+    владелец читается отдельно (он нужен для сброса кэша), а наличие
+    нового проверяется в условии UPDATE.
+    Возвращает обновленный экземпляр модели Item или None, если элемента
+    нет, его версия не подходит или нет нового владельца.
     """
-    update_data = item.model_dump(exclude_unset=True)
+    stmt = (
+        update(models.Item)
+        .where(models.Item.id == id, LIVE_ITEM)
+        .values(**item.model_dump(), version=models.Item.version + 1)
+        .returning(models.Item)
+    )
+    if versions is not None:
+        stmt = stmt.where(models.Item.version.in_(versions))
 
-    for key, value in update_data.items():
-        setattr(db_item, key, value)
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    def execute(stmt: Update) -> models.Item | None:
+        # Условие LIVE_ITEM с подзапросом не вычисляется в Python, поэтому
+        # атрибуты элемента, уже загруженного в сессию, перезаписываются
+        # строкой из RETURNING явно
+        return db.scalars(
+            select(models.Item)
+            .from_statement(stmt)
+            .execution_options(populate_existing=True)
+        ).one_or_none()
+
+    user_ids = {item.user_id}
+    db_item = execute(stmt.where(models.Item.user_id == item.user_id))
+    if db_item is None:
+        owner = db.scalar(
+            select(models.Item.user_id).where(models.Item.id == id)
+        )
+        if owner is not None and owner != item.user_id:
+            user_ids.add(owner)
+            db_item = execute(
+                stmt.where(
+                    models.Item.user_id == owner,
+                    exists().where(
+                        models.User.id == item.user_id,
+                        models.User.deleted_at.is_(None),
+                    ),
+                )
+            )
 
+    if db_item is not None:
+        detach(db, db_item)
+    db.commit()
+    if db_item is not None:
+        cache.invalidate(user_ids=user_ids, item_ids=[id])
     return db_item
 
 
 def delete_item(db_item: models.Item, db: Session) -> None:
     """
-    Удаяет элемент db_item.
+    Мягко удаляет элемент db_item: отмечает время удаления. Элемент
+    удаляется из БД фоновой очисткой (purge_items).
     Возвращает None.
     """
-    db.delete(db_item)
+    id, user_id = db_item.id, db_item.user_id
+    db.execute(
+        update(models.Item)
+        .where(models.Item.id == id, LIVE_ITEM)
+        .values(deleted_at=func.now())
+    )
     db.commit()
+    cache.invalidate(user_ids=[user_id], item_ids=[id])
     return None
+
+
+def _existing_user_ids(user_ids: set[int], db: Session) -> set[int]:
+    """
+    Возвращает те id из user_ids, для которых есть пользователи в БД.
+    """
+    return set(
+        db.scalars(select(models.User.id).where(models.User.id.in_(user_ids)))
+    )
+
+
+def create_items(
+    items: list[schemas.ItemCreate], db: Session
+) -> list[schemas.BulkResult]:
+    """
+    Создает элементы из списка схем items пачками, по одной транзакции
+    на пачку. Наличие владельцев проверяется одним запросом на пачку.
+    Возвращает результат для каждой строки.
+    """
+    results = []
+    for start, chunk in chunked(items):
+        user_ids = _existing_user_ids({i.user_id for i in chunk}, db)
+
+        rows, indexes = [], []
+        for index, item in enumerate(chunk, start):
+            if item.user_id not in user_ids:
+                results.append(
+                    schemas.BulkResult(index=index, detail="User not found")
+                )
+                continue
+            rows.append(item.model_dump())
+            indexes.append(index)
+
+        if rows:
+            # Строки вставляются пачкой INSERT ... VALUES ... RETURNING.
+            # sqlite выдает id строкам пачки по возрастанию в порядке
+            # VALUES, поэтому отсортированные id соответствуют порядку строк
+            # (sort_by_parameter_order для sqlite выполняет вставку
+            # построчно)
+            ids = sorted(
+                db.scalars(insert(models.Item).returning(models.Item.id), rows)
+            )
+            results.extend(
+                schemas.BulkResult(index=index, id=id)
+                for index, id in zip(indexes, ids)
+            )
+        db.commit()
+        if rows:
+            cache.invalidate(
+                user_ids={row["user_id"] for row in rows}, item_ids=ids
+            )
+
+    return sorted(results, key=lambda r: r.index)
+
+
+def update_items(
+    items: list[schemas.ItemBulkUpdate], db: Session
+) -> list[schemas.BulkResult]:
+    """
+    Обновляет элементы по id из списка схем items пачками, по одной
+    транзакции на пачку. Наличие элементов и владельцев проверяется
+    одним запросом на пачку. Возвращает результат для каждой строки.
+    """
+    results = []
+    for start, chunk in chunked(items):
+        # Текущие владельцы и версии элементов пачки
+        current = db.execute(
+            select(
+                models.Item.id, models.Item.user_id, models.Item.version
+            ).where(models.Item.id.in_({i.id for i in chunk}))
+        ).all()
+        owners = {row.id: row.user_id for row in current}
+        versions = {row.id: row.version for row in current}
+        user_ids = _existing_user_ids({i.user_id for i in chunk}, db)
+
+        rows = []
+        for index, item in enumerate(chunk, start):
+            if item.id not in owners:
+                detail = "Item not found"
+            elif item.user_id not in user_ids:
+                detail = "User not found"
+            else:
+                detail = None
+                # UPDATE проверяет текущую версию строки и увеличивает ее,
+                # повтор id в пачке обновляет уже новую версию
+                rows.append(item.model_dump() | {"version": versions[item.id]})
+                versions[item.id] += 1
+            results.append(
+                schemas.BulkResult(index=index, id=item.id, detail=detail)
+            )
+
+        if rows:
+            # UPDATE по первичному ключу выполняется через executemany
+            db.execute(update(models.Item), rows)
+        db.commit()
+        cache.invalidate(
+            user_ids={owners[row["id"]] for row in rows}
+            | {row["user_id"] for row in rows},
+            item_ids=[row["id"] for row in rows],
+        )
+
+    return results
+
+
+def delete_items(ids: list[int], db: Session) -> list[schemas.BulkResult]:
+    """
+    Мягко удаляет элементы по списку ids пачками, по одной транзакции
+    на пачку. Возвращает результат для каждого id.
+    """
+    results = []
+    for start, chunk in chunked(ids):
+        deleted = dict(
+            db.execute(
+                update(models.Item)
+                .where(models.Item.id.in_(chunk), LIVE_ITEM)
+                .values(deleted_at=func.now())
+                .returning(models.Item.id, models.Item.user_id)
+            ).all()
+        )
+        db.commit()
+        cache.invalidate(user_ids=deleted.values(), item_ids=deleted)
+        results.extend(
+            schemas.BulkResult(
+                index=index,
+                id=id,
+                detail=None if id in deleted else "Item not found",
+            )
+            for index, id in enumerate(chunk, start)
+        )
+
+    return results
+
+
+def purge_items(db: Session, batch_size: int | None = None) -> int:
+    """
+    Удаляет из БД не более batch_size мягко удаленных элементов и элементов
+    мягко удаленных пользователей одной транзакцией, чтобы не держать
+    блокировку записи долго. Возвращает количество удаленных элементов.
+    """
+    limit = batch_size or config.PURGE_BATCH_SIZE
+    deleted = {}
+    # Условия выбираются по отдельности, чтобы каждое читало свой индекс
+    for condition in (
+        models.Item.deleted_at.is_not(None),
+        models.Item.user_id.in_(models.deleted_users),
+    ):
+        if len(deleted) >= limit:
+            break
+        ids = (
+            select(models.Item.id).where(condition).limit(limit - len(deleted))
+        )
+        deleted.update(
+            db.execute(
+                delete(models.Item)
+                .where(models.Item.id.in_(ids))
+                .returning(models.Item.id, models.Item.user_id)
+            ).all()
+        )
+    db.commit()
+    cache.invalidate(user_ids=set(deleted.values()), item_ids=deleted)
+    return len(deleted)
@@ -1,65 +1,643 @@
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from typing import Iterable, Iterator, Sequence
 
-from src import models, schemas
+from sqlalchemy import (
+    Row,
+    Select,
+    delete,
+    exists,
+    func,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import (
+    InstrumentedAttribute,
+    Load,
+    Session,
+    joinedload,
+    load_only,
+    raiseload,
+    selectinload,
+)
+from sqlalchemy.orm.attributes import set_committed_value
 
+from src import cache, config, models, schemas, serialization
+from src.internal.crud import (
+    chunked,
+    detach,
+    get_by_ids,
+    get_cached_by_ids,
+    keyset_page,
+    sorted_page,
+)
 
-def get_users(db: Session) -> list[models.User]:
+# Порядки сортировки пользователей: столбцы ключа и признак убывания. Ключ
+# заканчивается id и совпадает с индексом (индекс sqlite по items_count
+# включает rowid)
+USER_SORTS = {
+    "id": ((models.User.id,), False),
+    "-id": ((models.User.id,), True),
+    "items_count": ((models.User.items_count, models.User.id), False),
+    "-items_count": ((models.User.items_count, models.User.id), True),
+}
+
+# Доступные стратегии жадной загрузки User.items
+ITEMS_LOADERS = {
+    "selectin": selectinload,
+    "joined": joinedload,
+}
+
+
+def items_loader(strategy: str | None = None) -> Load:
+    """
+    Возвращает опцию загрузки User.items для указанной стратегии.
+    Если стратегия не указана, то берется из config.USER_ITEMS_LOADING.
+    """
+    strategy = strategy or config.USER_ITEMS_LOADING
+    if strategy not in ITEMS_LOADERS:
+        raise ValueError(f"Unknown items loading strategy: {strategy}")
+    return ITEMS_LOADERS[strategy](models.User.items)
+
+
+def user_options(
+    strategy: str | None = None,
+    projection: schemas.UserProjection | None = None,
+    keys: Sequence[InstrumentedAttribute] = (),
+) -> list[Load]:
+    """
+    Возвращает опции загрузки пользователя с проекцией projection:
+    загружаются только столбцы projection.fields (а также id и version
+    для ETag, и столбцы keys - ключ сортировки для курсора страницы) и
+    элементы, если projection.include_items. Чтение остальных атрибутов
+    вызывает ошибку, а не отдельный запрос.
+    """
+    projection = projection or schemas.UserProjection()
+    options = []
+    if projection.fields is not None:
+        columns = [getattr(models.User, f) for f in projection.fields]
+        options.append(
+            load_only(*columns, *keys, models.User.version, raiseload=True)
+        )
+    if projection.include_items:
+        options.append(items_loader(strategy))
+    else:
+        options.append(raiseload(models.User.items))
+    return options
+
+
+def user_sort(sort: str) -> tuple[tuple[InstrumentedAttribute, ...], bool]:
+    """
+    Возвращает столбцы ключа сортировки sort из USER_SORTS и признак
+    сортировки по убыванию.
+    """
+    if sort not in USER_SORTS:
+        raise ValueError(f"Unknown users sort: {sort}")
+    return USER_SORTS[sort]
+
+
+def users_page(
+    stmt: Select,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.UserFilter | None = None,
+    after_key: Sequence | None = None,
+) -> Select:
+    """
+    Добавляет к запросу пользователей stmt условия filters, порядок
+    filters.sort и постраничную выборку по ключу сортировки (keyset):
+    возвращаются пользователи после пользователя с ключом
+    (*after_key, after_id), не более limit штук. Для сортировки по
+    количеству элементов after_key - количество элементов последнего
+    пользователя предыдущей страницы (см. sorted_page). Условия и порядок
+    по количеству элементов используют индекс по users.items_count.
+    """
+    filters = filters or schemas.UserFilter()
+    keys, descending = user_sort(filters.sort)
+
+    if filters.min_items is not None:
+        stmt = stmt.where(models.User.items_count >= filters.min_items)
+    if filters.max_items is not None:
+        stmt = stmt.where(models.User.items_count <= filters.max_items)
+    return sorted_page(stmt, keys, descending, after_id, limit, after_key)
+
+
+def get_users(
+    db: Session,
+    after_id: int | None = None,
+    limit: int | None = None,
+    strategy: str | None = None,
+    projection: schemas.UserProjection | None = None,
+    filters: schemas.UserFilter | None = None,
+    after_key: Sequence | None = None,
+) -> list[models.User]:
+    """
+    Возвращает и БД список пользователей, отобранных по filters и
+    упорядоченных по filters.sort (по умолчанию по id).
+    Постраничная выборка делается по ключу (keyset): возвращаются
+    пользователи после пользователя с ключом (*after_key, after_id), не
+    более limit штук. Элементы пользователей загружаются жадно, без
+    запроса на каждого пользователя. С проекцией projection загружаются
+    только выбранные столбцы и связи.
+    """
+    keys, _ = user_sort((filters or schemas.UserFilter()).sort)
+    options = user_options(strategy, projection, keys)
+    stmt = users_page(
+        select(models.User).options(*options),
+        after_id,
+        limit,
+        filters,
+        after_key,
+    )
+    # unique() обязателен для joined-загрузки коллекций
+    return db.scalars(stmt).unique()
+
+
+def get_user_rows(
+    db: Session,
+    after_id: int | None = None,
+    limit: int | None = None,
+    filters: schemas.UserFilter | None = None,
+    after_key: Sequence | None = None,
+) -> tuple[list[Row], list[Row]]:
+    """
+    Возвращает страницу пользователей, как get_users, в виде кортежей
+    столбцов serialization.USER_FIELDS и элементы этих пользователей,
+    упорядоченные по id, в виде кортежей столбцов serialization.ITEM_FIELDS.
+    Объекты моделей не строятся, элементы выбираются вторым запросом,
+    как при selectin-загрузке.
+    """
+    columns = [getattr(models.User, f) for f in serialization.USER_FIELDS]
+    users = db.execute(
+        users_page(select(*columns), after_id, limit, filters, after_key)
+    ).all()
+    if not users:
+        return users, []
+    columns = [getattr(models.Item, f) for f in serialization.ITEM_FIELDS]
+    items = db.execute(
+        select(*columns)
+        .where(models.Item.user_id.in_([user.id for user in users]))
+        .order_by(models.Item.id)
+    ).all()
+    return users, items
+
+
+def iter_users_stmt(chunk_size: int | None = None) -> Select:
+    """
+    Возвращает запрос всех пользователей, строки которого выбираются
+    из курсора БД пачками по chunk_size штук (yield_per). Элементы
+    загружаются отдельным запросом на каждую пачку.
+    """
+    # joined-загрузка коллекций несовместима с yield_per
+    return (
+        select(models.User)
+        .options(items_loader("selectin"))
+        .order_by(models.User.id)
+        .execution_options(yield_per=chunk_size or config.EXPORT_CHUNK_SIZE)
+    )
+
+
+def iter_users(
+    db: Session, chunk_size: int | None = None
+) -> Iterator[list[models.User]]:
+    """
+    Возвращает итератор по всем пользователям из БД пачками по chunk_size
+    штук. Строки выбираются из курсора БД по мере чтения, запрос
+    выполняется при получении первой пачки.
+    """
+    yield from db.scalars(iter_users_stmt(chunk_size)).partitions()
+
+
+def get_user_by_id(
+    id: int,
+    db: Session,
+    strategy: str | None = None,
+    projection: schemas.UserProjection | None = None,
+) -> models.User:
+    """
+    Возвращает пользователя по указанному id. С проекцией projection
+    загружаются только выбранные столбцы и связи.
+    """
+    return db.get(models.User, id, options=user_options(strategy, projection))
+
+
+def user_exists(id: int, db: Session) -> bool:
+    """
+    Проверяет, есть ли пользователь с указанным id.
+    """
+    return db.scalar(
+        select(
+            exists().where(
+                models.User.id == id, models.User.deleted_at.is_(None)
+            )
+        )
+    )
+
+
+def get_user_stats(db: Session, top: int = 10) -> schemas.UserStats:
     """
-    Возвращает и БД список пользователей
+    Возвращает статистику пользователей, посчитанную в БД: количество
+    пользователей, количество пользователей с элементами, среднее
+    и наибольшее количество элементов и top пользователей с наибольшим
+    количеством элементов. Размер результата не зависит от количества строк.
+    Запросы читают индекс по users.items_count, а не items.
     """
-    return db.scalars(select(models.User))
+    count = models.User.items_count
+    users, with_items, items, max_items = db.execute(
+        select(
+            func.count(),
+            func.count().filter(count > 0),
+            func.coalesce(func.sum(count), 0),
+            func.coalesce(func.max(count), 0),
+        )
+    ).one()
+    top_owners = db.execute(
+        select(models.User.id, models.User.name, count)
+        .where(count > 0)
+        .order_by(count.desc(), models.User.id)
+        .limit(top)
+    ).all()
+    return schemas.UserStats(
+        users=users,
+        users_with_items=with_items,
+        avg_items=items / users if users else 0,
+        max_items=max_items,
+        top_owners=[
+            schemas.OwnerStats.model_validate(row, from_attributes=True)
+            for row in top_owners
+        ],
+    )
 
 
-def get_user_by_id(id: int, db: Session) -> models.User:
+def recount_items(db: Session, chunk_size: int | None = None) -> int:
     """
-    Возвращает пользователя по указанному id
+    Пересчитывает количество элементов users.items_count по таблице items
+    для пользователей, у которых оно расходится с фактическим (например,
+    после изменения items с отключенными триггерами). Пользователи
+    обрабатываются диапазонами id по chunk_size штук, по одной транзакции
+    на диапазон, чтобы не держать блокировку записи долго.
+    Возвращает количество исправленных пользователей.
     """
-    return db.get(models.User, id)
+    actual = (
+        select(func.count())
+        .where(
+            models.Item.user_id == models.User.id,
+            models.Item.deleted_at.is_(None),
+        )
+        .scalar_subquery()
+    )
+    repaired, after_id = 0, None
+    while True:
+        ids = db.scalars(
+            keyset_page(
+                select(models.User.id),
+                models.User.id,
+                after_id,
+                chunk_size or config.BULK_CHUNK_SIZE,
+            )
+        ).all()
+        if not ids:
+            return repaired
+        fixed = db.scalars(
+            update(models.User)
+            .where(
+                models.User.id.between(ids[0], ids[-1]),
+                models.User.items_count != actual,
+            )
+            .values(items_count=actual)
+            .returning(models.User.id)
+        ).all()
+        db.commit()
+        cache.invalidate(user_ids=fixed)
+        repaired += len(fixed)
+        after_id = ids[-1]
 
 
-def get_user_by_email(email: str, db: Session) -> models.User:
+def get_user_cached(
+    id: int, db: Session, use_cache: bool = True
+) -> dict | None:
+    """
+    Возвращает пользователя по указанному id в виде словаря схемы
+    schemas.UserVersioned. Словарь берется из кэша, при промахе - читается
+    из БД и сохраняется в кэш, если ключ не сбрасывался во время чтения.
+    Возвращает None, если пользователя нет. С use_cache=False читается из БД
+    без кэша.
+    """
+    key = cache.user_key(id)
+    data = cache.backend.get(key) if use_cache else None
+    if data is None:
+        # Поколение берется до чтения: сброс во время чтения отменит
+        # заполнение кэша устаревшими данными
+        generation = cache.backend.generation(key) if use_cache else None
+        db_user = get_user_by_id(id=id, db=db)
+        if db_user is None:
+            return None
+        data = schemas.UserVersioned.model_validate(db_user).model_dump(
+            mode="json"
+        )
+        if use_cache:
+            cache.backend.set(key, data, generation)
+    return data
+
+
+def get_users_by_ids(
+    ids: Iterable[int], db: Session, strategy: str | None = None
+) -> dict[int, models.User]:
+    """
+    Возвращает пользователей с id из ids с их элементами одним запросом
+    WHERE id IN (...) (при большом количестве id - несколькими) в виде
+    словаря id -> пользователь. Пользователей, которых нет в БД, в словаре
+    нет.
+    """
+    stmt = select(models.User).options(items_loader(strategy))
+    return get_by_ids(stmt, models.User.id, ids, db)
+
+
+def get_users_cached(
+    ids: Iterable[int], db: Session, use_cache: bool = True
+) -> dict[int, dict]:
+    """
+    Возвращает пользователей с id из ids в виде словаря id -> словарь схемы
+    schemas.UserVersioned. Пользователи берутся из кэша, не найденные в
+    нем - читаются из БД одним запросом и сохраняются в кэш.
+    """
+
+    def load(missing: list[int]) -> dict[int, dict]:
+        return {
+            id: schemas.UserVersioned.model_validate(db_user).model_dump(
+                mode="json"
+            )
+            for id, db_user in get_users_by_ids(ids=missing, db=db).items()
+        }
+
+    return get_cached_by_ids(ids, cache.user_key, load, use_cache)
+
+
+def get_user_by_email(
+    email: str, db: Session, strategy: str | None = None
+) -> models.User:
     """
     Возвращает пользователя по указанному email
     """
-    return db.scalar(select(models.User).where(models.User.email == email))
+    return (
+        db.scalars(
+            select(models.User)
+            .where(models.User.email == email)
+            .options(items_loader(strategy))
+        )
+        .unique()
+        .one_or_none()
+    )
 
 
 def create_user(user: schemas.UserCreate, db: Session) -> models.User:
     """
-    Создает нового пользователя в БД из полей схемы user.
+    Создает нового пользователя в БД из полей схемы user одним запросом
+    INSERT ... RETURNING. Занятость email проверяет ограничение
+    уникальности в БД: если email занят, откатывает транзакцию
+    и пробрасывает IntegrityError.
     Возвращает созданный экземпляр модели User.
     """
-    db_user = models.User(**user.model_dump())
-    db.add(db_user)
+    try:
+        db_user = db.scalars(
+            insert(models.User)
+            .values(**user.model_dump())
+            .returning(models.User)
+        ).one()
+    except IntegrityError:
+        db.rollback()
+        raise
+    # У нового пользователя нет элементов, загружать их не нужно
+    set_committed_value(db_user, "items", [])
+    detach(db, db_user)
     db.commit()
-    db.refresh(db_user)
+    # id удаленных записей в sqlite могут выдаваться повторно
+    cache.invalidate(user_ids=[db_user.id])
     return db_user
 
 
 def update_user(
-    db_user: models.User, user: schemas.UserCreate, db: Session
-) -> models.User:
+    id: int,
+    user: schemas.UserCreate,
+    db: Session,
+    versions: list[int] | None = None,
+) -> models.User | None:
     """
-    Обновляет поля пользователя db_user значениями из схемы user.
-    Возвращает обновленный экземпляр модели User.
+    Обновляет поля пользователя с указанным id значениями из схемы user
+    условным запросом UPDATE ... RETURNING и увеличивает версию строки.
+    Если указан versions, пользователь обновляется, только если его версия
+    есть в списке. Элементы пользователя загружаются вторым запросом.
+    Если email занят, откатывает транзакцию и пробрасывает IntegrityError.
+    Возвращает обновленный экземпляр модели User или None, если
+    пользователя нет или его версия не подходит.
     """
-    update_data = user.model_dump(exclude_unset=True)
+    stmt = (
+        update(models.User)
+        .where(models.User.id == id, models.User.deleted_at.is_(None))
+        .values(**user.model_dump(), version=models.User.version + 1)
+        .returning(models.User)
+        # joined-загрузка несовместима с RETURNING
+        .options(items_loader("selectin"))
+    )
+    if versions is not None:
+        stmt = stmt.where(models.User.version.in_(versions))
+    try:
+        db_user = db.scalars(stmt).one_or_none()
+    except IntegrityError:
+        db.rollback()
+        raise
 
-    for key, value in update_data.items():
-        setattr(db_user, key, value)
-    db.add(db_user)
+    if db_user is not None:
+        detach(db, db_user, *db_user.items)
     db.commit()
-    db.refresh(db_user)
-
+    if db_user is not None:
+        cache.invalidate(user_ids=[id])
     return db_user
 
 
+def _item_ids(user_ids: Iterable[int], db: Session) -> list[int]:
+    """
+    Возвращает id элементов пользователей user_ids, в том числе удаленных,
+    для сброса кэша. Запрос по таблице, а не модели, чтобы к нему не
+    добавлялось условие models.exclude_deleted, и читает индекс
+    ix_items_user_id.
+    """
+    items = models.Item.__table__
+    return list(
+        db.scalars(select(items.c.id).where(items.c.user_id.in_(user_ids)))
+    )
+
+
 def delete_user(db_user: models.User, db: Session) -> None:
     """
-    Удаляет из БД указаного пользователя.
+    Мягко удаляет указаного пользователя: отмечает время удаления одним
+    запросом UPDATE, независимо от количества элементов пользователя.
+    Элементы пользователя сразу перестают возвращаться запросами
+    (models.exclude_deleted) и отмечаются удаленными в журнале изменений
+    (триггер models.CHANGES_USER_ITEMS_DDL), а из БД пользователь и его
+    элементы удаляются фоновой очисткой (purge_users, item.purge_items).
+    Элементы пользователя сбрасываются из кэша вместе с ним.
     Возвращает None.
     """
-    db.delete(db_user)
+    id = db_user.id
+    db.execute(
+        update(models.User)
+        .where(models.User.id == id, models.User.deleted_at.is_(None))
+        .values(deleted_at=func.now())
+    )
+    item_ids = _item_ids([id], db)
     db.commit()
+    cache.invalidate(user_ids=[id], item_ids=item_ids)
     return None
+
+
+def create_users(
+    users: list[schemas.UserCreate], db: Session
+) -> list[schemas.BulkResult]:
+    """
+    Создает пользователей из списка схем users пачками, по одной транзакции
+    на пачку. Строки с занятым email, в том числе повторы email внутри
+    самого списка, пропускаются ограничением уникальности в БД
+    (INSERT ... ON CONFLICT DO NOTHING) без отдельной проверки.
+    Возвращает результат для каждой строки.
+    """
+    results = []
+    for start, chunk in chunked(users):
+        # Пачка вставляется одним запросом INSERT ... VALUES ... RETURNING,
+        # возвращаются только вставленные строки
+        inserted = dict(
+            db.execute(
+                sqlite_insert(models.User)
+                .on_conflict_do_nothing(
+                    index_elements=[models.User.email],
+                    index_where=models.User.deleted_at.is_(None),
+                )
+                .returning(models.User.email, models.User.id),
+                [user.model_dump() for user in chunk],
+            ).all()
+        )
+        db.commit()
+        if inserted:
+            cache.invalidate(user_ids=inserted.values())
+
+        for index, user in enumerate(chunk, start):
+            # При повторе email в пачке вставлена первая строка
+            id = inserted.pop(user.email, None)
+            results.append(
+                schemas.BulkResult(index=index, id=id)
+                if id is not None
+                else schemas.BulkResult(
+                    index=index, detail="Email already in use"
+                )
+            )
+
+    return results
+
+
+def update_users(
+    users: list[schemas.UserBulkUpdate], db: Session
+) -> list[schemas.BulkResult]:
+    """
+    Обновляет пользователей по id из списка схем users пачками, по одной
+    транзакции на пачку. Наличие пользователей и занятость email
+    проверяются одним запросом на пачку. Возвращает результат для каждой
+    строки.
+    """
+    results = []
+    for start, chunk in chunked(users):
+        ids = {u.id for u in chunk}
+        emails = {u.email for u in chunk}
+        # Версии существующих пользователей и владельцы email из пачки
+        rows = db.execute(
+            select(
+                models.User.id, models.User.email, models.User.version
+            ).where(models.User.id.in_(ids) | models.User.email.in_(emails))
+        ).all()
+        versions = {row.id: row.version for row in rows if row.id in ids}
+        owners = {row.email: row.id for row in rows if row.email in emails}
+
+        updates = []
+        for index, user in enumerate(chunk, start):
+            if user.id not in versions:
+                detail = "User not found"
+            elif owners.setdefault(user.email, user.id) != user.id:
+                detail = "Email already in use"
+            else:
+                detail = None
+                # UPDATE проверяет текущую версию строки и увеличивает ее,
+                # повтор id в пачке обновляет уже новую версию
+                updates.append(
+                    user.model_dump() | {"version": versions[user.id]}
+                )
+                versions[user.id] += 1
+            results.append(
+                schemas.BulkResult(index=index, id=user.id, detail=detail)
+            )
+
+        if updates:
+            # UPDATE по первичному ключу выполняется через executemany
+            db.execute(update(models.User), updates)
+        db.commit()
+        cache.invalidate(user_ids=[u["id"] for u in updates])
+
+    return results
+
+
+def delete_users(ids: list[int], db: Session) -> list[schemas.BulkResult]:
+    """
+    Мягко удаляет пользователей по списку ids пачками, по одной транзакции
+    на пачку. Элементы пользователей отмечаются удаленными в журнале
+    изменений, как в delete_user. Пользователи и их элементы сбрасываются
+    из кэша. Возвращает результат для каждого id.
+    """
+    results = []
+    for start, chunk in chunked(ids):
+        deleted = set(
+            db.scalars(
+                update(models.User)
+                .where(
+                    models.User.id.in_(chunk),
+                    models.User.deleted_at.is_(None),
+                )
+                .values(deleted_at=func.now())
+                .returning(models.User.id)
+            )
+        )
+        item_ids = _item_ids(deleted, db) if deleted else []
+        db.commit()
+        cache.invalidate(user_ids=deleted, item_ids=item_ids)
+        results.extend(
+            schemas.BulkResult(
+                index=index,
+                id=id,
+                detail=None if id in deleted else "User not found",
+            )
+            for index, id in enumerate(chunk, start)
+        )
+
+    return results
+
+
+def purge_users(db: Session, batch_size: int | None = None) -> int:
+    """
+    Удаляет из БД не более batch_size мягко удаленных пользователей, у
+    которых не осталось элементов (их удаляет item.purge_items), одной
+    транзакцией. Возвращает количество удаленных пользователей.
+    """
+    ids = (
+        select(models.User.id)
+        .where(
+            models.User.deleted_at.is_not(None),
+            ~exists().where(models.Item.user_id == models.User.id),
+        )
+        .limit(batch_size or config.PURGE_BATCH_SIZE)
+    )
+    deleted = db.scalars(
+        delete(models.User)
+        .where(models.User.id.in_(ids))
+        .returning(models.User.id)
+    ).all()
+    db.commit()
+    cache.invalidate(user_ids=deleted)
+    return len(deleted)
@@ -0,0 +1,478 @@
+import base64
+import hashlib
+import json
+from typing import AsyncIterator, Callable, Iterable, Iterator, Sequence
+
+from fastapi import Depends, Header, HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import config, schemas, serialization
+from src.database import READ_YOUR_WRITES_HEADER
+from src.internal.crud.item import ITEM_SORTS
+from src.internal.crud.user import USER_SORTS
+
+# Заголовок с курсором следующей страницы списка
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Тип содержимого для выгрузки в формате JSON Lines
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def make_etag(obj) -> str:
+    """
+    Возвращает строгий ETag пользователя или элемента obj: экземпляра
+    модели или словаря схемы schemas.UserVersioned/schemas.ItemVersioned
+    из кэша. ETag начинается с версии строки, за которой у пользователя
+    следует хэш id и версий его элементов и их количества. ETag не требует
+    сериализации тела, а версию из него можно проверить в условии UPDATE.
+    """
+    if isinstance(obj, dict):
+        version, items = obj["version"], obj.get("items")
+        if items is not None:
+            items = [(item["id"], item["version"]) for item in items]
+        count = obj.get("items_count")
+    else:
+        # Элементы пользователя, прочитанного без них (проекция), в ETag
+        # не входят
+        version, items = obj.version, vars(obj).get("items")
+        if items is not None:
+            items = [(item.id, item.version) for item in items]
+        count = vars(obj).get("items_count")
+    # Количество элементов меняется без изменения версии пользователя
+    if count is not None:
+        items = (items, count)
+    if items is None:
+        return f'"{version}"'
+    digest = hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """
+    Проверяет, совпадает ли etag с одним из значений заголовка
+    If-None-Match (слабое сравнение, без учета признака W/).
+    Значение "*" совпадает с любым ETag.
+    """
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def if_match_versions(header: str | None) -> list[int] | None:
+    """
+    Возвращает версии строки из ETag заголовка If-Match для проверки
+    в условии UPDATE. Возвращает None, если заголовка нет или он равен
+    "*" (подходит любая версия). Слабые и чужие ETag не совпадают ни с
+    одной версией (строгое сравнение).
+    """
+    if header is None or header.strip() == "*":
+        return None
+    versions = []
+    for tag in header.split(","):
+        version = tag.strip().strip('"').split("-")[0]
+        if version.isdigit():
+            versions.append(int(version))
+    return versions
+
+
+def precondition_failed() -> HTTPException:
+    """
+    Возвращает ошибку 412 для изменения ресурса, версия которого
+    не совпадает с ожидаемой клиентом.
+    """
+    return HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Resource has been modified",
+    )
+
+
+def not_found(detail: str) -> HTTPException:
+    """
+    Возвращает ошибку 404 с описанием detail.
+    """
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+def email_in_use() -> HTTPException:
+    """
+    Возвращает ошибку 400 для email, занятого другим пользователем.
+    """
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Email already in use",
+    )
+
+
+def user_update_failed(current) -> HTTPException:
+    """
+    Возвращает ошибку неудачного условного обновления пользователя по его
+    текущему состоянию current: 404, если пользователя нет, иначе 412 -
+    не совпала версия из If-Match.
+    """
+    if current is None:
+        return not_found("User not found")
+    return precondition_failed()
+
+
+def item_update_failed(current, versions: list[int] | None) -> HTTPException:
+    """
+    Возвращает ошибку неудачного условного обновления элемента по его
+    текущему состоянию current и версиям versions из If-Match: 404, если
+    элемента нет, 412, если не совпала версия, иначе 404 - нет
+    пользователя user_id.
+    """
+    if current is None:
+        return not_found("Item not found")
+    if versions is not None and current.version not in versions:
+        return precondition_failed()
+    return not_found("User not found")
+
+
+def versioned_response(
+    obj,
+    detail: str,
+    response: Response,
+    if_none_match: str | None,
+    serialize: Callable | None = None,
+):
+    """
+    Возвращает ответ на чтение пользователя или элемента obj по id с
+    ETag: ошибку 404 с описанием detail, если записи нет, ответ 304 без
+    тела, если у клиента актуальная версия, иначе obj с ETag в заголовке
+    response. Если задан serialize, тело строится из serialize(obj) без
+    response_model.
+    """
+    if obj is None:
+        raise not_found(detail)
+    etag = make_etag(obj)
+    # У клиента актуальная версия, тело ответа не сериализуется
+    if etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    if serialize is not None:
+        return json_response(serialize(obj), headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return obj
+
+
+def item_filter(
+    user_id: int | None = Query(None),
+    title_prefix: str | None = Query(None, min_length=1, max_length=100),
+    min_id: int | None = Query(None),
+    max_id: int | None = Query(None),
+    sort: str = Query("id", pattern="^-?(id|title)$"),
+) -> schemas.ItemFilter:
+    """
+    Зависимость с условиями отбора списка элементов из параметров запроса.
+    """
+    return schemas.ItemFilter(
+        user_id=user_id,
+        title_prefix=title_prefix,
+        min_id=min_id,
+        max_id=max_id,
+        sort=sort,
+    )
+
+
+def encode_cursor(key: Sequence) -> str:
+    """
+    Возвращает курсор следующей страницы по ключу сортировки key последней
+    строки страницы. Ключ из одного id передается числом, как after_id,
+    остальные - JSON-массивом в base64url.
+    """
+    if len(key) == 1:
+        return str(key[0])
+    data = json.dumps(
+        list(key), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Возвращает ключ сортировки из курсора encode_cursor. Вызывает
+    ValueError, если курсор поврежден.
+    """
+    if cursor.isdigit():
+        return [int(cursor)]
+    key = json.loads(
+        base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    )
+    if (
+        not isinstance(key, list)
+        or not key
+        or any(
+            isinstance(value, bool) or not isinstance(value, (str, int, float))
+            for value in key
+        )
+        or not isinstance(key[-1], int)
+    ):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def page_cursor(
+    after_id: int | None, cursor: str | None, keys: Sequence[str]
+) -> schemas.PageCursor:
+    """
+    Возвращает начало страницы списка с ключом сортировки из столбцов keys
+    по параметрам запроса: after_id - id последней строки предыдущей
+    страницы (только для сортировки по id), cursor - значение заголовка
+    X-Next-Cursor предыдущей страницы (для любой сортировки).
+    """
+    if after_id is not None and cursor is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Pass either after_id or cursor",
+        )
+    if cursor is not None:
+        try:
+            key = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Invalid cursor",
+            )
+    elif after_id is not None:
+        key = [after_id]
+    else:
+        return schemas.PageCursor(keys=keys)
+    if len(key) != len(keys):
+        # after_id не содержит ключа сортировки, отличной от id
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Cursor does not match the sort, use X-Next-Cursor",
+        )
+    return schemas.PageCursor(after_id=key[-1], after_key=key[:-1], keys=keys)
+
+
+def item_page_cursor(
+    after_id: int | None = Query(None, ge=0),
+    cursor: str | None = Query(None, min_length=1, max_length=1000),
+    filters: schemas.ItemFilter = Depends(item_filter),
+) -> schemas.PageCursor:
+    """
+    Зависимость с началом страницы списка элементов (см. page_cursor).
+    """
+    keys, _ = ITEM_SORTS[filters.sort]
+    return page_cursor(after_id, cursor, [key.key for key in keys])
+
+
+def user_filter(
+    min_items: int | None = Query(None, ge=0),
+    max_items: int | None = Query(None, ge=0),
+    sort: str = Query("id", pattern="^-?(id|items_count)$"),
+) -> schemas.UserFilter:
+    """
+    Зависимость с условиями отбора списка пользователей из параметров
+    запроса.
+    """
+    return schemas.UserFilter(
+        min_items=min_items, max_items=max_items, sort=sort
+    )
+
+
+def user_page_cursor(
+    after_id: int | None = Query(None, ge=0),
+    cursor: str | None = Query(None, min_length=1, max_length=1000),
+    filters: schemas.UserFilter = Depends(user_filter),
+) -> schemas.PageCursor:
+    """
+    Зависимость с началом страницы списка пользователей (см. page_cursor).
+    """
+    keys, _ = USER_SORTS[filters.sort]
+    return page_cursor(after_id, cursor, [key.key for key in keys])
+
+
+def user_projection(
+    fields: str | None = Query(None, max_length=100),
+    include_items: bool = Query(True),
+) -> schemas.UserProjection:
+    """
+    Зависимость с проекцией пользователя из параметров запроса: fields -
+    список полей через запятую, include_items - возвращать ли элементы.
+    """
+    if fields is not None:
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(fields) - set(serialization.USER_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+    return schemas.UserProjection(fields=fields, include_items=include_items)
+
+
+def cache_enabled(
+    read_your_writes: bool = Header(False, alias=READ_YOUR_WRITES_HEADER),
+) -> bool:
+    """
+    Зависимость: можно ли читать записи по id через кэш. Запрос с
+    заголовком X-Read-Your-Writes читает из основной БД мимо кэша: в кэше
+    может быть запись, прочитанная до изменения или с отстающей реплики.
+    """
+    return not read_your_writes
+
+
+def batch_ids(ids: str = Query(min_length=1)) -> list[int]:
+    """
+    Зависимость со списком id из параметра ids - id через запятую, не
+    больше config.BATCH_MAX_IDS.
+    """
+    try:
+        values = [int(id) for id in ids.split(",") if id.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers",
+        )
+    if not values or len(values) > config.BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"ids must contain 1 to {config.BATCH_MAX_IDS} ids",
+        )
+    return values
+
+
+def batch_response(name: str, ids: list[int], found: dict[int, dict]) -> dict:
+    """
+    Возвращает ответ на запрос записей по списку ids: найденные записи из
+    found под ключом name и отсутствующие id под ключом missing.
+    """
+    records, missing = split_found(ids, found)
+    return {name: records, "missing": missing}
+
+
+def split_found(ids: list[int], found: dict[int, dict]) -> tuple[list, list]:
+    """
+    Разделяет запрошенные ids на найденные записи из found и отсутствующие
+    id. Порядок запроса сохраняется, повторные id не учитываются.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    return (
+        [found[id] for id in unique_ids if id in found],
+        [id for id in unique_ids if id not in found],
+    )
+
+
+def split_page(
+    rows: Iterable, limit: int, keys: Sequence[str] = ("id",)
+) -> tuple[list, dict]:
+    """
+    Отбрасывает лишнюю строку страницы rows, запрошенной с одной лишней
+    строкой. Возвращает строки страницы и заголовки ответа: если лишняя
+    строка была, то в X-Next-Cursor передается курсор со значениями
+    столбцов keys последней строки (объекта, строки результата или
+    словаря).
+    """
+    rows = list(rows)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            [
+                last[key] if isinstance(last, dict) else getattr(last, key)
+                for key in keys
+            ]
+        )
+    return rows, headers
+
+
+def cursor_page(
+    rows: Iterable,
+    limit: int,
+    response: Response,
+    keys: Sequence[str] = ("id",),
+) -> list:
+    """
+    Возвращает страницу rows (см. split_page), курсор следующей страницы
+    передается в заголовке X-Next-Cursor ответа response.
+    """
+    rows, headers = split_page(rows, limit, keys)
+    response.headers.update(headers)
+    return rows
+
+
+def json_page_response(
+    rows: list[dict], limit: int, keys: Sequence[str] = ("id",)
+) -> Response:
+    """
+    Возвращает ответ со страницей rows (см. split_page), сериализованной
+    без моделей pydantic.
+    """
+    rows, headers = split_page(rows, limit, keys)
+    return json_response(rows, headers)
+
+
+def user_projection_page_response(
+    db_users: Iterable,
+    projection: schemas.UserProjection,
+    limit: int,
+    keys: Sequence[str] = ("id",),
+) -> Response:
+    """
+    Возвращает страницу пользователей, прочитанных с полями projection,
+    как json_page_response. Курсор берется из объектов, так как столбцов
+    ключа сортировки может не быть среди полей projection.
+    """
+    db_users, headers = split_page(db_users, limit, keys)
+    return json_response(
+        [serialization.user_projection(u, projection) for u in db_users],
+        headers,
+    )
+
+
+def json_response(content, headers: dict | None = None) -> Response:
+    """
+    Возвращает ответ с content, сериализованным без response_model.
+    """
+    return Response(
+        serialization.dumps(content),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def ndjson_response(
+    chunks: Iterator[list] | AsyncIterator[list],
+    schema: type[BaseModel],
+    db: Session | AsyncSession,
+) -> StreamingResponse:
+    """
+    Возвращает потоковый ответ, в котором каждый объект из пачек chunks
+    сериализуется схемой schema в отдельную строку JSON.
+    Пачки могут выбираться как синхронной, так и асинхронной сессией.
+    """
+
+    def dump(chunk: list) -> str:
+        return "".join(
+            schema.model_validate(obj).model_dump_json() + "\n"
+            for obj in chunk
+        )
+
+    # Зависимость с сессией закрывает ее до начала отправки ответа,
+    # при чтении сессия заново берет соединение из пула, поэтому
+    # закрываем ее еще раз после выгрузки
+    def generate():
+        try:
+            for chunk in chunks:
+                yield dump(chunk)
+        finally:
+            db.close()
+
+    async def agenerate():
+        try:
+            async for chunk in chunks:
+                yield dump(chunk)
+        finally:
+            await db.close()
+
+    if isinstance(db, AsyncSession):
+        return StreamingResponse(agenerate(), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,25 @@
+"""
+Асинхронные варианты роутеров для режима config.DB_MODE == "async".
+"""
+
+from fastapi import APIRouter
+from fastapi.routing import APIRoute
+
+
+def with_fallback(router: APIRouter, fallback: APIRouter) -> APIRouter:
+    """
+    Возвращает роутер с маршрутами fallback, в котором маршруты с теми же
+    путем и методами заменены асинхронными маршрутами router.
+    Порядок маршрутов fallback сохраняется, так как от него зависит
+    сопоставление путей (например, /bulk должен идти раньше /{id}).
+    """
+
+    def key(route: APIRoute) -> tuple[str, frozenset[str]]:
+        return route.path, frozenset(route.methods)
+
+    routes = {key(route): route for route in router.routes}
+    merged = APIRouter()
+    merged.routes.extend(routes.pop(key(r), r) for r in fallback.routes)
+    # Маршруты, которых нет в fallback
+    merged.routes.extend(routes.values())
+    return merged
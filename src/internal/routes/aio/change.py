@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config, schemas
+from src.database import get_async_read_db
+from src.internal.crud.aio import change as crud
+from src.internal.routes import NEXT_CURSOR_HEADER
+
+router = APIRouter(tags=["changes"])
+
+
+@router.get("/changes", response_model=list[schemas.Change])
+async def get_changes(
+    response: Response,
+    since: int = Query(0, ge=0),
+    limit: int = Query(
+        config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX
+    ),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Возвращает изменения пользователей и элементов после изменения с
+    номером since: последнее состояние каждой измененной записи или
+    отметку об удалении. Запись, измененная несколько раз, возвращается
+    один раз с номером последнего изменения. При удалении пользователя
+    отметки об удалении получают и все его элементы. Клиент синхронизируется,
+    запрашивая изменения с since, равным номеру последнего полученного.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor.
+    """
+    # Запрашиваем на одно изменение больше, чтобы узнать, есть ли еще
+    # страница
+    changes = await crud.get_changes(db=db, since=since, limit=limit + 1)
+    if len(changes) > limit:
+        changes = changes[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(changes[-1].seq)
+    return changes
@@ -0,0 +1,252 @@
+import asyncio
+
+from fastapi import APIRouter, Body, Depends, Header, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config, schemas, serialization
+from src.database import get_async_db, get_async_read_db
+from src.internal.crud.aio import item as crud
+from src.internal.routes import (
+    batch_ids,
+    batch_response,
+    cache_enabled,
+    cursor_page,
+    if_match_versions,
+    item_filter,
+    item_page_cursor,
+    item_update_failed,
+    json_page_response,
+    make_etag,
+    ndjson_response,
+    not_found,
+    versioned_response,
+)
+from src.writer import ItemWriter, get_item_writer
+
+router = APIRouter(prefix="/items", tags=["items"])
+
+
+@router.get("/", response_model=list[schemas.Item])
+async def get_items(
+    response: Response,
+    page: schemas.PageCursor = Depends(item_page_cursor),
+    limit: int = Query(
+        config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX
+    ),
+    filters: schemas.ItemFilter = Depends(item_filter),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Возвращает страницу списка элементов, отобранных по владельцу, началу
+    названия и диапазону id, в порядке sort.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor, его
+    значение передается в параметре cursor (при сортировке по id - также
+    в after_id). Курсор содержит ключ сортировки последнего элемента,
+    поэтому изменение или удаление этого элемента не прерывает список.
+    """
+    # Запрашиваем на один элемент больше, чтобы узнать, есть ли еще страница
+    if serialization.enabled():
+        # Строки сериализуются в JSON напрямую, без моделей pydantic
+        rows = await crud.get_item_rows(
+            db=db,
+            after_id=page.after_id,
+            limit=limit + 1,
+            filters=filters,
+            after_key=page.after_key,
+        )
+        return json_page_response(
+            serialization.item_dicts(rows), limit, page.keys
+        )
+    db_items = await crud.get_items(
+        db=db,
+        after_id=page.after_id,
+        limit=limit + 1,
+        filters=filters,
+        after_key=page.after_key,
+    )
+    return cursor_page(db_items, limit, response, page.keys)
+
+
+@router.get("/export")
+async def export_items(db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Выгружает все элементы потоком в формате JSON Lines.
+    """
+    return ndjson_response(crud.iter_items(db=db), schemas.Item, db)
+
+
+@router.get("/search", response_model=list[schemas.Item])
+async def search_items(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(
+        config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX
+    ),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    """
+    Ищет элементы по словам в названии и описании. Элементы упорядочены
+    по релевантности.
+    """
+    return await crud.search_items(q=q, db=db, limit=limit)
+
+
+@router.get("/stats", response_model=schemas.ItemStats)
+async def get_item_stats(db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Возвращает статистику элементов: количество элементов, владельцев,
+    элементов без владельца и распределение владельцев по количеству
+    элементов.
+    """
+    return await crud.get_item_stats(db=db)
+
+
+@router.get("/batch", response_model=schemas.ItemBatch)
+async def get_items_batch(
+    ids: list[int] = Depends(batch_ids),
+    db: AsyncSession = Depends(get_async_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
+    """
+    Возвращает элементы по списку ID через запятую (сначала из кэша,
+    остальных - одним запросом к БД) и список ID, элементов с которыми нет.
+    """
+    found = await crud.get_items_cached(ids=ids, db=db, use_cache=use_cache)
+    return batch_response("items", ids, found)
+
+
+@router.post("/batch", response_model=schemas.ItemBatch)
+async def post_items_batch(
+    ids: list[int] = Body(min_length=1, max_length=config.BATCH_MAX_IDS),
+    db: AsyncSession = Depends(get_async_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
+    """
+    Возвращает элементы по списку ID в теле запроса, как GET /items/batch,
+    для списков, которые не помещаются в адрес запроса.
+    """
+    found = await crud.get_items_cached(ids=ids, db=db, use_cache=use_cache)
+    return batch_response("items", ids, found)
+
+
+@router.post("/bulk", response_model=list[schemas.BulkResult])
+async def create_items(
+    new_items: list[schemas.ItemCreate] = Body(
+        max_length=config.BULK_MAX_ROWS
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Создает элементы списком. Возвращает результат для каждой строки.
+    """
+    return await crud.create_items(items=new_items, db=db)
+
+
+@router.put("/bulk", response_model=list[schemas.BulkResult])
+async def update_items(
+    items: list[schemas.ItemBulkUpdate] = Body(
+        max_length=config.BULK_MAX_ROWS
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Обновляет элементы списком по указанным ID. Возвращает результат для
+    каждой строки.
+    """
+    return await crud.update_items(items=items, db=db)
+
+
+@router.delete("/bulk", response_model=list[schemas.BulkResult])
+async def delete_items(
+    ids: list[int] = Body(max_length=config.BULK_MAX_ROWS),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Удаляет элементы по списку ID. Возвращает результат для каждого ID.
+    """
+    return await crud.delete_items(ids=ids, db=db)
+
+
+@router.get("/{id}", response_model=schemas.Item)
+async def get_item_by_id(
+    id: int,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
+    """
+    Возвращает элемент по указанному ID.
+    """
+    db_item = await crud.get_item_cached(id=id, db=db, use_cache=use_cache)
+    # Если такого элемента нет, то возвращаем ошибку 404
+    return versioned_response(
+        db_item, "User not found", response, if_none_match
+    )
+
+
+@router.post(
+    "/", response_model=schemas.Item, status_code=status.HTTP_201_CREATED
+)
+async def create_item(
+    new_item: schemas.ItemCreate,
+    db: AsyncSession = Depends(get_async_db),
+    writer: ItemWriter | None = Depends(get_item_writer),
+):
+    """
+    Создает новый элемент.
+    """
+    if writer is not None:
+        # Строка вставляется потоком групповой записи в одной транзакции
+        # с другими, ответ ждет фиксации этой транзакции
+        id = await asyncio.wrap_future(writer.submit(new_item))
+        if id is None:
+            raise not_found("User not found")
+        return {**new_item.model_dump(), "id": id}
+    # Наличие user c id равным user_id проверяется в запросе вставки
+    db_item = await crud.create_item(item=new_item, db=db)
+    # Если такого user нет то возвращаем ошибку 404
+    if db_item is None:
+        raise not_found("User not found")
+    return db_item
+
+
+@router.put("/{id}", response_model=schemas.Item)
+async def update_item(
+    id: int,
+    item: schemas.ItemCreate,
+    response: Response,
+    if_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Обновляет поля элемента по указанному ID.
+    """
+    # Наличие элемента и user c id == user_id, версия из If-Match и
+    # обновление проверяются условным запросом
+    versions = if_match_versions(if_match)
+    db_item = await crud.update_item(
+        id=id, item=item, db=db, versions=versions
+    )
+    if db_item is None:
+        # Причина ошибки выясняется отдельным запросом
+        current = await crud.get_item_by_id(id=id, db=db)
+        raise item_update_failed(current, versions)
+    response.headers["ETag"] = make_etag(db_item)
+    return db_item
+
+
+@router.delete(
+    "/{id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response
+)
+async def delete_item(id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Удаляет элемент по указанному ID.
+    """
+    # Проверяем есть ли такой ID в items
+    db_item = await crud.get_item_by_id(id=id, db=db)
+    if db_item is None:
+        raise not_found("Item not found")
+    # Удаляем
+    await crud.delete_item(db_item=db_item, db=db)
+    # Возвращаем ответ без контента
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
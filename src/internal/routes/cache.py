@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from src import cache, schemas
+
+router = APIRouter(prefix="/cache", tags=["cache"])
+
+
+@router.get("/stats", response_model=schemas.CacheStats)
+def get_cache_stats():
+    """
+    Возвращает счетчики кэша чтения пользователей и элементов.
+    """
+    return cache.backend.stats()
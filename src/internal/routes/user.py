@@ -1,34 +1,236 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from functools import partial
+
+from fastapi import APIRouter, Body, Depends, Header, Query, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from src import schemas
-from src.database import get_db
+from src import config, schemas, serialization
+from src.database import get_db, get_read_db
+from src.internal.crud import item as itemcrud
 from src.internal.crud import user as crud
+from src.internal.routes import (
+    batch_ids,
+    batch_response,
+    cache_enabled,
+    cursor_page,
+    email_in_use,
+    if_match_versions,
+    json_page_response,
+    make_etag,
+    ndjson_response,
+    not_found,
+    user_filter,
+    user_page_cursor,
+    user_projection,
+    user_projection_page_response,
+    user_update_failed,
+    versioned_response,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/", response_model=list[schemas.User])
-def get_users(db: Session = Depends(get_db)):
+def get_users(
+    response: Response,
+    page: schemas.PageCursor = Depends(user_page_cursor),
+    limit: int = Query(
+        config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX
+    ),
+    projection: schemas.UserProjection = Depends(user_projection),
+    filters: schemas.UserFilter = Depends(user_filter),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу списка пользователей, отобранных по количеству
+    элементов, в порядке sort. Параметры fields и include_items
+    ограничивают поля пользователей и отключают элементы.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor, его
+    значение передается в параметре cursor (при сортировке по id - также
+    в after_id). Курсор содержит ключ сортировки последнего пользователя,
+    поэтому изменение или удаление этого пользователя не прерывает список.
+    """
+    # Запрашиваем на одного пользователя больше, чтобы узнать,
+    # есть ли еще страница
+    if projection != schemas.UserProjection():
+        # Из БД загружаются только выбранные поля, ответ строится
+        # без response_model
+        db_users = crud.get_users(
+            db=db,
+            after_id=page.after_id,
+            limit=limit + 1,
+            projection=projection,
+            filters=filters,
+            after_key=page.after_key,
+        )
+        return user_projection_page_response(
+            db_users, projection, limit, page.keys
+        )
+    if serialization.enabled():
+        # Строки сериализуются в JSON напрямую, без моделей pydantic
+        rows, item_rows = crud.get_user_rows(
+            db=db,
+            after_id=page.after_id,
+            limit=limit + 1,
+            filters=filters,
+            after_key=page.after_key,
+        )
+        return json_page_response(
+            serialization.user_dicts(rows, item_rows), limit, page.keys
+        )
+    db_users = crud.get_users(
+        db=db,
+        after_id=page.after_id,
+        limit=limit + 1,
+        filters=filters,
+        after_key=page.after_key,
+    )
+    return cursor_page(db_users, limit, response, page.keys)
+
+
+@router.get("/export")
+def export_users(db: Session = Depends(get_read_db)):
+    """
+    Выгружает всех пользователей вместе с элементами потоком в формате
+    JSON Lines.
+    """
+    return ndjson_response(crud.iter_users(db=db), schemas.User, db)
+
+
+@router.get("/stats", response_model=schemas.UserStats)
+def get_user_stats(
+    top: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает статистику пользователей: количество пользователей, в том
+    числе с элементами, среднее и наибольшее количество элементов и top
+    пользователей с наибольшим количеством элементов.
+    """
+    return crud.get_user_stats(db=db, top=top)
+
+
+@router.get("/batch", response_model=schemas.UserBatch)
+def get_users_batch(
+    ids: list[int] = Depends(batch_ids),
+    db: Session = Depends(get_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
     """
-    Возвращает список пользователей.
+    Возвращает пользователей по списку ID через запятую (сначала из кэша,
+    остальных - одним запросом к БД) и список ID, пользователей с которыми нет.
     """
-    return crud.get_users(db=db)
+    found = crud.get_users_cached(ids=ids, db=db, use_cache=use_cache)
+    return batch_response("users", ids, found)
+
+
+@router.post("/batch", response_model=schemas.UserBatch)
+def post_users_batch(
+    ids: list[int] = Body(min_length=1, max_length=config.BATCH_MAX_IDS),
+    db: Session = Depends(get_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
+    """
+    Возвращает пользователей по списку ID в теле запроса, как GET /users/batch,
+    для списков, которые не помещаются в адрес запроса.
+    """
+    found = crud.get_users_cached(ids=ids, db=db, use_cache=use_cache)
+    return batch_response("users", ids, found)
+
+
+@router.post("/bulk", response_model=list[schemas.BulkResult])
+def create_users(
+    new_users: list[schemas.UserCreate] = Body(
+        max_length=config.BULK_MAX_ROWS
+    ),
+    db: Session = Depends(get_db),
+):
+    """
+    Создает пользователей списком. Возвращает результат для каждой строки.
+    """
+    return crud.create_users(users=new_users, db=db)
+
+
+@router.put("/bulk", response_model=list[schemas.BulkResult])
+def update_users(
+    users: list[schemas.UserBulkUpdate] = Body(
+        max_length=config.BULK_MAX_ROWS
+    ),
+    db: Session = Depends(get_db),
+):
+    """
+    Обновляет пользователей списком по указанным ID. Возвращает результат
+    для каждой строки.
+    """
+    return crud.update_users(users=users, db=db)
+
+
+@router.delete("/bulk", response_model=list[schemas.BulkResult])
+def delete_users(
+    ids: list[int] = Body(max_length=config.BULK_MAX_ROWS),
+    db: Session = Depends(get_db),
+):
+    """
+    Удаляет пользователей по списку ID. Возвращает результат для каждого ID.
+    """
+    return crud.delete_users(ids=ids, db=db)
 
 
 @router.get("/{id}", response_model=schemas.User)
-def get_user_by_id(id: int, db: Session = Depends(get_db)):
+def get_user_by_id(
+    id: int,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    projection: schemas.UserProjection = Depends(user_projection),
+    db: Session = Depends(get_read_db),
+    use_cache: bool = Depends(cache_enabled),
+):
     """
-    Возвращает пользователя по указанному ID.
+    Возвращает пользователя по указанному ID. Параметры fields
+    и include_items ограничивают поля пользователя и отключают элементы.
     """
-    # Ищем пользователя с таким ID
-    db_user = crud.get_user_by_id(id=id, db=db)
-    # Если такого пользователя нет, то возвращаем ошибку 404
-    if db_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+    serialize = None
+    if projection == schemas.UserProjection():
+        # Ищем пользователя с таким ID (сначала в кэше)
+        db_user = crud.get_user_cached(id=id, db=db, use_cache=use_cache)
+    else:
+        # Из БД загружаются только выбранные поля, ответ строится
+        # без response_model
+        db_user = crud.get_user_by_id(id=id, db=db, projection=projection)
+        serialize = partial(
+            serialization.user_projection, projection=projection
         )
-    return db_user
+    # Если такого пользователя нет, то возвращаем ошибку 404
+    return versioned_response(
+        db_user, "User not found", response, if_none_match, serialize
+    )
+
+
+@router.get("/{id}/items", response_model=list[schemas.Item])
+def get_user_items(
+    id: int,
+    response: Response,
+    after_id: int | None = Query(None, ge=0),
+    limit: int = Query(
+        config.PAGE_SIZE_DEFAULT, ge=1, le=config.PAGE_SIZE_MAX
+    ),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Возвращает страницу элементов пользователя по указанному ID.
+    Курсор следующей страницы передается в заголовке X-Next-Cursor.
+    """
+    db_items = itemcrud.get_items(
+        db=db,
+        after_id=after_id,
+        limit=limit + 1,
+        filters=schemas.ItemFilter(user_id=id),
+    )
+    db_items = cursor_page(db_items, limit, response)
+    # Наличие пользователя проверяется, только если страница пуста
+    if not db_items and not crud.user_exists(id=id, db=db):
+        raise not_found("User not found")
+    return db_items
 
 
 @router.post(
@@ -38,42 +240,39 @@ def create_user(new_user: schemas.UserCreate, db: Session = Depends(get_db)):
     """
     Создает нового пользователя.
     """
-    # Ищем пользователя с новым email
-    db_user = crud.get_user_by_email(email=new_user.email, db=db)
-    # Если пользователь найден, то возвращаем ошибку 400
-    if db_user is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already in use",
-        )
-    return crud.create_user(user=new_user, db=db)
+    try:
+        # Занятость email проверяется ограничением уникальности при вставке,
+        # без отдельного запроса и без гонки между проверкой и вставкой
+        return crud.create_user(user=new_user, db=db)
+    except IntegrityError:
+        # Если email занят, то возвращаем ошибку 400
+        raise email_in_use()
 
 
 @router.put("/{id}", response_model=schemas.User)
 def update_user(
-    id: int, user: schemas.UserCreate, db: Session = Depends(get_db)
+    id: int,
+    user: schemas.UserCreate,
+    response: Response,
+    if_match: str | None = Header(None),
+    db: Session = Depends(get_db),
 ):
     """
     Обновляет поля пользователя по указанному ID.
     """
-    # Ищем пользователя по указанному id
-    db_user = crud.get_user_by_id(id=id, db=db)
-    # Если пользователь найден, то возвращаем ошибку 404
+    versions = if_match_versions(if_match)
+    try:
+        # Наличие пользователя, версия из If-Match и обновление проверяются
+        # одним запросом
+        db_user = crud.update_user(id=id, user=user, db=db, versions=versions)
+    except IntegrityError:
+        # Новый email занят другим пользователем
+        raise email_in_use()
     if db_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
-    # Если изменилось поле email
-    if db_user.email != user.email:
-        # Проверяем не занят ли новый email
-        check = crud.get_user_by_email(email=user.email, db=db)
-        # Если занят, возвращаем ошибку 400
-        if check is not None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already in use",
-            )
-    return crud.update_user(db_user=db_user, user=user, db=db)
+        # Причина ошибки выясняется отдельным запросом
+        raise user_update_failed(crud.get_user_by_id(id=id, db=db))
+    response.headers["ETag"] = make_etag(db_user)
+    return db_user
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -81,13 +280,16 @@ def delete_user(id: int, db: Session = Depends(get_db)):
     """
     Удаляет пользователя по указанному ID.
     """
-    # Ищем пользователя по указанному id
-    db_user = crud.get_user_by_id(id=id, db=db)
-    # Если пользователь найден, то возвращаем ошибку 404
+    # Ищем пользователя по указанному id. Удаление не читает элементы
+    # пользователя, поэтому они не загружаются
+    db_user = crud.get_user_by_id(
+        id=id,
+        db=db,
+        projection=schemas.UserProjection(fields=[], include_items=False),
+    )
+    # Если пользователь не найден, то возвращаем ошибку 404
     if db_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
+        raise not_found("User not found")
     # Удаляем
     crud.delete_user(db_user=db_user, db=db)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
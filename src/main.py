@@ -1,12 +1,104 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from src import config, database, writer
+from src.internal.crud import item as itemcrud
+from src.internal.crud import user as usercrud
+from src.internal.routes import cache, change, item, metrics, user
+from src.metrics import MetricsMiddleware
+from src.purge import PurgeWorker
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_queries(db: Session) -> None:
+    """
+    Выполняет основные запросы чтения, чтобы их SQL попал в кэш
+    скомпилированных запросов engine сессии db.
+    """
+    usercrud.get_user_by_id(id=0, db=db)
+    usercrud.get_users(db=db, limit=1).all()
+    itemcrud.get_item_by_id(id=0, db=db)
+    itemcrud.get_items(db=db, limit=1).all()
+
 
-from src.internal.routes import item, user
+async def warm_up() -> None:
+    """
+    Заполняет пулы соединений engine для чтения и записи и выполняет
+    основные запросы чтения до первого HTTP-запроса.
+    """
+    size = config.STARTUP_WARMUP_CONNECTIONS
+    if config.DB_MODE == "async":
+        engines = {database.async_engine, database.async_read_engine}
+        for engine in engines:
+            await database.fill_async_pool(engine, size)
+        async with database.AsyncReadSessionLocal() as db:
+            await db.run_sync(warm_up_queries)
+        return
+    # Старт приложения ждет прогрева, поэтому он выполняется без пула
+    # потоков
+    for engine in {database.engine, database.read_engine}:
+        database.fill_pool(engine, size)
+    with database.ReadSessionLocal() as db:
+        warm_up_queries(db)
 
-# Создаем экземпляр приложения FastAPI
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    При старте приложения создает engine, если включено, прогревает
+    приложение и запускает фоновую очистку удаленных строк. При остановке
+    останавливает очистку, записывает строки из очереди групповой записи
+    элементов и закрывает соединения с БД.
+    """
+    database.init_engines()
+    purge_worker = None
+    if config.PURGE_INTERVAL > 0:
+        purge_worker = PurgeWorker(database.SessionLocal)
+        purge_worker.start()
+    if config.STARTUP_WARMUP:
+        # Прогрев не обязателен для работы приложения
+        try:
+            await warm_up()
+        except SQLAlchemyError:
+            logger.warning("Startup warm-up failed", exc_info=True)
+    yield
+    if purge_worker is not None:
+        purge_worker.close()
+    if writer.item_writer is not None:
+        writer.item_writer.close()
+    await database.dispose_engines()
+
+
+# Создаем экземпляр приложения FastAPI. Схема OpenAPI строится при первом
+# запросе /openapi.json, а не при старте
 app = FastAPI(
-    title="Проект для демонстрации модульного и интеграционного тестирования."
+    title="Проект для демонстрации модульного и интеграционного тестирования.",
+    lifespan=lifespan,
 )
 
-# Подключем роутеры items и users
-app.include_router(user.router)
-app.include_router(item.router)
+# Подключем роутеры items, users и changes
+if config.DB_MODE == "async":
+    # В асинхронном режиме обработчики заменяются асинхронными вариантами
+    from src.internal.routes.aio import change as async_change
+    from src.internal.routes.aio import item as async_item
+    from src.internal.routes.aio import user as async_user
+    from src.internal.routes.aio import with_fallback
+
+    app.include_router(with_fallback(async_user.router, user.router))
+    app.include_router(with_fallback(async_item.router, item.router))
+    app.include_router(with_fallback(async_change.router, change.router))
+else:
+    app.include_router(user.router)
+    app.include_router(item.router)
+    app.include_router(change.router)
+
+app.include_router(cache.router)
+app.include_router(metrics.router)
+
+# Статистика запросов к БД в заголовке Server-Timing и метриках /metrics
+app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,274 @@
+"""
+Инструментирование запросов к БД и HTTP-запросов.
+
+Обработчики событий engine считают SQL-запросы и время их выполнения
+в статистике текущего HTTP-запроса и пишут медленные запросы в лог.
+MetricsMiddleware создает статистику на каждый HTTP-запрос, добавляет
+ее в заголовок Server-Timing и накапливает метрики по маршрутам, которые
+отдаются в формате Prometheus эндпоинтом /metrics.
+"""
+
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from sqlalchemy import Engine, event
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина параметров запроса в журнале медленных запросов:
+# у массовых операций (executemany) параметры всех строк пачки
+LOG_PARAMETERS_LENGTH = 1000
+
+# Верхние границы корзин гистограмм времени в секундах
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+@dataclass
+class RequestStats:
+    """
+    Статистика SQL-запросов одного HTTP-запроса.
+    """
+
+    # Количество SQL-запросов
+    queries: int = 0
+    # Суммарное время SQL-запросов в секундах
+    db_time: float = 0.0
+
+
+# Статистика текущего HTTP-запроса. Объект изменяется на месте, поэтому
+# изменения из пула потоков синхронных обработчиков видны middleware
+current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_stats", default=None
+)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, *args):
+    # Стек на случай вложенного запроса в обработчике событий. Контекст
+    # выполнения запоминается, чтобы handle_error снял запись только
+    # своего запроса
+    conn.info.setdefault("query_start_time", []).append(
+        (context, time.perf_counter())
+    )
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, *args):
+    _, start = conn.info["query_start_time"].pop()
+    elapsed = time.perf_counter() - start
+    stats = current_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    threshold = config.SLOW_QUERY_MS
+    if threshold >= 0 and elapsed * 1000 >= threshold:
+        params = repr(parameters)
+        if len(params) > LOG_PARAMETERS_LENGTH:
+            params = params[:LOG_PARAMETERS_LENGTH] + "..."
+        logger.warning(
+            "Slow query (%.1f ms): %s; parameters: %s",
+            elapsed * 1000,
+            statement,
+            params,
+        )
+
+
+def handle_error(exception_context) -> None:
+    # При ошибке запроса after_cursor_execute не вызывается, и время начала
+    # снимается со стека здесь, иначе стек соединения из пула растет
+    conn = exception_context.connection
+    if conn is None:
+        return
+    starts = conn.info.get("query_start_time")
+    if starts and starts[-1][0] is exception_context.execution_context:
+        starts.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Подключает к engine подсчет SQL-запросов и журнал медленных запросов.
+    Для асинхронного engine передается его sync_engine.
+    """
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+class Registry:
+    """
+    Метрики HTTP-запросов по методам и маршрутам: количество запросов по
+    кодам ответа, гистограмма времени обработки, количество и время
+    SQL-запросов.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (метод, маршрут, код ответа) -> количество запросов
+        self.requests: dict[tuple[str, str, int], int] = {}
+        # (метод, маршрут) -> количество запросов в каждой корзине
+        self.durations: dict[tuple[str, str], list[int]] = {}
+        # (метод, маршрут) -> количество и суммарное время обработки
+        self.durations_count: dict[tuple[str, str], int] = {}
+        self.durations_sum: dict[tuple[str, str], float] = {}
+        # (метод, маршрут) -> количество и суммарное время SQL-запросов
+        self.queries: dict[tuple[str, str], int] = {}
+        self.db_time: dict[tuple[str, str], float] = {}
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        duration: float,
+        stats: RequestStats,
+    ) -> None:
+        """
+        Учитывает HTTP-запрос, обработанный за duration секунд.
+        """
+        key = (method, route)
+        with self._lock:
+            status_key = (method, route, status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            counts = self.durations.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    counts[i] += 1
+            self.durations_count[key] = self.durations_count.get(key, 0) + 1
+            self.durations_sum[key] = self.durations_sum.get(key, 0) + duration
+            self.queries[key] = self.queries.get(key, 0) + stats.queries
+            self.db_time[key] = self.db_time.get(key, 0) + stats.db_time
+
+    def clear(self) -> None:
+        """
+        Сбрасывает все метрики.
+        """
+        with self._lock:
+            for values in (
+                self.requests,
+                self.durations,
+                self.durations_count,
+                self.durations_sum,
+                self.queries,
+                self.db_time,
+            ):
+                values.clear()
+
+    def render(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+        """
+
+        def labels(method: str, route: str, **extra) -> str:
+            pairs = {"method": method, "route": route, **extra}
+            return ",".join(f'{k}="{v}"' for k, v in pairs.items())
+
+        lines = [
+            "# HELP http_requests_total Number of HTTP requests.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, status), count in sorted(
+                self.requests.items()
+            ):
+                lines.append(
+                    "http_requests_total"
+                    f"{{{labels(method, route, status=status)}}} {count}"
+                )
+
+            lines += [
+                "# HELP http_request_duration_seconds HTTP request latency.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), counts in sorted(self.durations.items()):
+                name = "http_request_duration_seconds"
+                count = self.durations_count[(method, route)]
+                for bound, bucket in zip(self.buckets, counts):
+                    lines.append(
+                        f"{name}_bucket"
+                        f"{{{labels(method, route, le=bound)}}} {bucket}"
+                    )
+                lines += [
+                    f'{name}_bucket{{{labels(method, route, le="+Inf")}}}'
+                    f" {count}",
+                    f"{name}_sum{{{labels(method, route)}}}"
+                    f" {self.durations_sum[(method, route)]}",
+                    f"{name}_count{{{labels(method, route)}}} {count}",
+                ]
+
+            lines += [
+                "# HELP db_queries_total Number of SQL statements.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(
+                    f"db_queries_total{{{labels(method, route)}}} {count}"
+                )
+
+            lines += [
+                "# HELP db_query_seconds_total Time spent in SQL statements.",
+                "# TYPE db_query_seconds_total counter",
+            ]
+            for (method, route), value in sorted(self.db_time.items()):
+                lines.append(
+                    f"db_query_seconds_total{{{labels(method, route)}}}"
+                    f" {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware, которое собирает статистику SQL-запросов каждого
+    HTTP-запроса, добавляет заголовок Server-Timing с временем обработчика
+    и БД и учитывает запрос в registry.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                handler = (time.perf_counter() - start) * 1000
+                timing = (
+                    f'db;dur={stats.db_time * 1000:.2f};desc="'
+                    f'{stats.queries} queries", app;dur={handler:.2f}'
+                )
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", timing.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            # Шаблон пути маршрута, а не сам путь, чтобы количество меток
+            # не зависело от id в путях
+            route = scope.get("route")
+            registry.observe(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+                time.perf_counter() - start,
+                stats,
+            )
@@ -0,0 +1,248 @@
+"""
+Версионные миграции схемы существующей БД.
+
+create_all создает только отсутствующие таблицы и не меняет существующие,
+поэтому изменения схемы (новые индексы, столбцы) оформляются миграциями.
+Номер последней примененной миграции хранится в таблице schema_version.
+Миграции идемпотентны, так как применяются и к БД, созданной create_all
+по актуальным моделям.
+"""
+
+from typing import Callable
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    Engine,
+    Integer,
+    MetaData,
+    Table,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from src import models
+
+# Таблица с номером версии схемы
+version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, nullable=False),
+)
+
+# Миграции по номерам версий
+MIGRATIONS: dict[int, Callable[[Connection], None]] = {}
+
+
+def migration(version: int):
+    """
+    Регистрирует функцию как миграцию схемы до версии version.
+    """
+
+    def decorator(fn: Callable[[Connection], None]):
+        if version in MIGRATIONS:
+            raise ValueError(f"Duplicate migration version: {version}")
+        MIGRATIONS[version] = fn
+        return fn
+
+    return decorator
+
+
+def create_index(conn: Connection, table: Table, name: str) -> None:
+    """
+    Создает индекс name, описанный в модели таблицы table, если его нет.
+    """
+    index = next(i for i in table.indexes if i.name == name)
+    index.create(conn, checkfirst=True)
+
+
+def add_column(conn: Connection, table: Table, name: str) -> None:
+    """
+    Добавляет столбец name, описанный в модели таблицы table, если его нет.
+    """
+    columns = [c["name"] for c in inspect(conn).get_columns(table.name)]
+    if name in columns:
+        return
+    ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+
+def rebuild_table(conn: Connection, table: Table) -> None:
+    """
+    Пересоздает таблицу table по ее модели с сохранением строк: sqlite не
+    умеет удалять и менять ограничения существующей таблицы. Все столбцы
+    модели уже должны быть в таблице. Индексы создаются заново по модели.
+    Триггеры других таблиц, ссылающиеся на table, нужно удалить до вызова
+    и создать после.
+    """
+    new = table.to_metadata(MetaData(), name=f"{table.name}_new")
+    conn.execute(CreateTable(new))
+    columns = ", ".join(c.name for c in table.columns)
+    conn.execute(
+        text(
+            f"INSERT INTO {new.name} ({columns}) "
+            f"SELECT {columns} FROM {table.name}"
+        )
+    )
+    # Таблица удаляется вместе со своими индексами. Внешние ключи других
+    # таблиц ссылаются на имя и после переименования указывают на новую
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {new.name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(conn)
+
+
+def get_version(conn: Connection) -> int:
+    """
+    Возвращает номер версии схемы БД (0, если миграции не применялись).
+    """
+    version_table.create(conn, checkfirst=True)
+    version = conn.scalar(select(version_table.c.version))
+    if version is None:
+        conn.execute(insert(version_table).values(version=0))
+        version = 0
+    return version
+
+
+def migrate(engine: Engine) -> int:
+    """
+    Применяет к БД все миграции с номером больше текущей версии схемы,
+    каждую в отдельной транзакции. Возвращает новую версию схемы.
+    """
+    with engine.begin() as conn:
+        current = get_version(conn)
+
+    for version in sorted(MIGRATIONS):
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            MIGRATIONS[version](conn)
+            conn.execute(update(version_table).values(version=version))
+        current = version
+
+    return current
+
+
+@migration(1)
+def add_items_user_id_index(conn: Connection) -> None:
+    """
+    Индекс на внешний ключ items.user_id для выборки элементов пользователя.
+    """
+    create_index(conn, models.Item.__table__, "ix_items_user_id")
+
+
+@migration(2)
+def add_row_versions(conn: Connection) -> None:
+    """
+    Столбцы версий строк users.version и items.version для ETag
+    и оптимистической блокировки.
+    """
+    add_column(conn, models.User.__table__, "version")
+    add_column(conn, models.Item.__table__, "version")
+
+
+@migration(3)
+def add_items_search(conn: Connection) -> None:
+    """
+    Индекс items.title для сортировки и фильтра по началу названия
+    и полнотекстовый индекс items_fts с триггерами синхронизации.
+    Полнотекстовый индекс заполняется по существующим строкам.
+    """
+    create_index(conn, models.Item.__table__, "ix_items_title")
+    for ddl in models.ITEMS_FTS_DDL:
+        conn.execute(text(ddl))
+    conn.execute(text("INSERT INTO items_fts(items_fts) VALUES ('rebuild')"))
+
+
+@migration(4)
+def add_users_items_count(conn: Connection) -> None:
+    """
+    Столбец users.items_count с индексом и триггеры, поддерживающие его при
+    изменении items. Количество заполняется по существующим строкам.
+    """
+    add_column(conn, models.User.__table__, "items_count")
+    create_index(conn, models.User.__table__, "ix_users_items_count")
+    for ddl in models.USERS_ITEMS_COUNT_DDL:
+        conn.execute(text(ddl))
+    conn.execute(text(models.USERS_ITEMS_COUNT_REBUILD))
+
+
+@migration(5)
+def add_soft_delete(conn: Connection) -> None:
+    """
+    Столбцы deleted_at мягкого удаления с индексами, триггеры
+    users.items_count, не учитывающие удаленные элементы, и уникальность
+    email только среди неудаленных пользователей. Ограничение UNIQUE(email)
+    заменяется частичным индексом пересозданием таблицы users.
+    """
+    for table in [models.User.__table__, models.Item.__table__]:
+        add_column(conn, table, "deleted_at")
+        create_index(conn, table, f"ix_{table.name}_deleted_at")
+    # Триггеры ссылаются на users и мешают ее пересозданию
+    for trigger in ["insert", "delete", "update", "soft_delete"]:
+        conn.execute(
+            text(f"DROP TRIGGER IF EXISTS users_items_count_{trigger}")
+        )
+    if inspect(conn).get_unique_constraints("users"):
+        rebuild_table(conn, models.User.__table__)
+    for ddl in models.USERS_ITEMS_COUNT_DDL:
+        conn.execute(text(ddl))
+
+
+@migration(6)
+def add_changes(conn: Connection) -> None:
+    """
+    Журнал изменений changes с триггерами. Журнал заполняется записями о
+    существующих строках, чтобы синхронизация с since=0 получила все
+    записи: сначала пользователи, затем элементы.
+    """
+    models.Change.__table__.create(conn, checkfirst=True)
+    for ddl in models.CHANGES_DDL:
+        conn.execute(text(ddl))
+    for entity, table in [("user", "users"), ("item", "items")]:
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO changes (entity, entity_id, deleted) "
+                f"SELECT '{entity}', id, deleted_at IS NOT NULL FROM {table} "
+                "ORDER BY id"
+            )
+        )
+
+
+@migration(7)
+def add_user_items_tombstones(conn: Connection) -> None:
+    """
+    Триггеры журнала, отмечающие удаленными элементы мягко удаленного
+    пользователя сразу, а не при очистке. Элементы уже удаленных, но еще
+    не очищенных пользователей отмечаются удаленными в журнале.
+    """
+    conn.execute(text("DROP TRIGGER IF EXISTS changes_items_delete"))
+    for ddl in models.CHANGES_DDL:
+        conn.execute(text(ddl))
+    items = (
+        "SELECT items.id FROM items JOIN users ON users.id = items.user_id "
+        "WHERE users.deleted_at IS NOT NULL AND items.deleted_at IS NULL"
+    )
+    conn.execute(
+        text(
+            "DELETE FROM changes WHERE entity = 'item' AND NOT deleted "
+            f"AND entity_id IN ({items})"
+        )
+    )
+    conn.execute(
+        text(
+            "INSERT OR IGNORE INTO changes (entity, entity_id, deleted) "
+            f"SELECT 'item', id, 1 FROM ({items}) ORDER BY id"
+        )
+    )
+
+
+if __name__ == "__main__":
+    from src import database
+
+    database.init_engines()
+    print(f"Schema version: {migrate(database.engine)}")
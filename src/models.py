@@ -1,10 +1,15 @@
-from sqlalchemy import ForeignKey, String
+from datetime import datetime
+
+from sqlalchemy import DDL, ForeignKey, Index, String, event, select, text
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
     MappedAsDataclass,
+    ORMExecuteState,
+    Session,
     mapped_column,
     relationship,
+    with_loader_criteria,
 )
 
 
@@ -18,8 +23,8 @@ class Base(DeclarativeBase, MappedAsDataclass):
 
 class BaseModel(Base):
     """
-    Абстрактная модель, в которой описан первичный ключ для всех наследуемых
-    от него моделей
+    Абстрактная модель, в которой описан первичный ключ и время мягкого
+    удаления для всех наследуемых от него моделей
     """
 
     __abstract__ = True
@@ -30,6 +35,25 @@ class BaseModel(Base):
         init=False,
         nullable=False,
     )
+    # Время удаления строки. Удаленные строки не возвращаются запросами
+    # ORM (exclude_deleted) и удаляются из БД фоновой очисткой (src.purge)
+    deleted_at: Mapped[datetime | None] = mapped_column(
+        nullable=True, default=None, init=False
+    )
+
+
+def deleted_at_index(table: str) -> Index:
+    """
+    Возвращает индекс удаленных строк таблицы table для очистки. Индекс
+    частичный: по условию deleted_at IS NULL в запросах чтения он не
+    подходит, и sqlite выбирает для них индексы по другим столбцам.
+    """
+    return Index(
+        f"ix_{table}_deleted_at",
+        "deleted_at",
+        sqlite_where=text("deleted_at IS NOT NULL"),
+        postgresql_where=text("deleted_at IS NOT NULL"),
+    )
 
 
 class User(BaseModel):
@@ -38,15 +62,37 @@ class User(BaseModel):
     """
 
     __tablename__ = "users"
+    # email уникален среди неудаленных пользователей: email удаленного
+    # пользователя можно использовать, не дожидаясь очистки
+    __table_args__ = (
+        Index(
+            "ix_users_email",
+            "email",
+            unique=True,
+            sqlite_where=text("deleted_at IS NULL"),
+            postgresql_where=text("deleted_at IS NULL"),
+        ),
+        deleted_at_index("users"),
+    )
 
     name: Mapped[str] = mapped_column(String(100), nullable=True)
-    email: Mapped[str] = mapped_column(
-        String(100), nullable=False, unique=True
-    )
+    email: Mapped[str] = mapped_column(String(100), nullable=False)
     address: Mapped[str] = mapped_column(String(500), nullable=True)
+    # Количество элементов пользователя, поддерживается триггерами на items
+    # (USERS_ITEMS_COUNT_DDL). Индекс для сортировки и фильтра по нему
+    items_count: Mapped[int] = mapped_column(
+        nullable=False, server_default="0", index=True, init=False
+    )
 
     items: Mapped[list["Item"]] = relationship("Item", init=False)
 
+    # Версия строки: увеличивается при каждом UPDATE и проверяется в его
+    # условии WHERE (оптимистическая блокировка)
+    version: Mapped[int] = mapped_column(
+        nullable=False, server_default="1", init=False
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Item(BaseModel):
     """
@@ -54,13 +100,289 @@ class Item(BaseModel):
     """
 
     __tablename__ = "items"
+    __table_args__ = (deleted_at_index("items"),)
 
-    title: Mapped[str] = mapped_column(String(100), nullable=False)
+    # Индекс для сортировки и поиска по началу названия
+    title: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
     description: Mapped[str] = mapped_column(String(500), nullable=True)
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id"), nullable=False
+        ForeignKey("users.id"), nullable=False, index=True
     )
 
+    # Версия строки: увеличивается при каждом UPDATE и проверяется в его
+    # условии WHERE (оптимистическая блокировка)
+    version: Mapped[int] = mapped_column(
+        nullable=False, server_default="1", init=False
+    )
+    __mapper_args__ = {"version_id_col": version}
+
     # owner: Mapped["User"] = relationship(
     #     "User", back_populates="items", init=False
     # )
+
+
+class Change(Base):
+    """
+    Модель журнала изменений пользователей и элементов для GET /changes.
+    На каждую запись users и items хранится одна строка с номером
+    последнего изменения. Строка удаленной записи остается в журнале и
+    после очистки, чтобы клиенты узнали об удалении, поэтому журнал растет
+    с количеством когда-либо созданных записей. Строки пишут триггеры
+    CHANGES_DDL
+    """
+
+    __tablename__ = "changes"
+    # AUTOINCREMENT: номера не используются повторно после удаления строки
+    # с наибольшим номером
+    __table_args__ = (
+        Index("ix_changes_entity", "entity", "entity_id", unique=True),
+        {"sqlite_autoincrement": True},
+    )
+
+    # Номер изменения. Запись sqlite выполняется по одной транзакции за
+    # раз, поэтому номера растут в порядке фиксации транзакций
+    seq: Mapped[int] = mapped_column(primary_key=True, init=False)
+    # Тип записи: "user" или "item"
+    entity: Mapped[str] = mapped_column(String(10), nullable=False)
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    # Запись удалена (мягко или из БД)
+    deleted: Mapped[bool] = mapped_column(nullable=False)
+
+
+# Полнотекстовый индекс элементов по title и description (sqlite FTS5).
+# Таблица items_fts хранит только индекс, содержимое строк берется из items
+# (external content), индекс обновляют триггеры на любое изменение items,
+# в том числе массовое и в обход crud
+ITEMS_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        title, description, content='items', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items
+    BEGIN
+        INSERT INTO items_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items
+    BEGIN
+        INSERT INTO items_fts(items_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS items_fts_update
+    AFTER UPDATE OF title, description ON items
+    BEGIN
+        INSERT INTO items_fts(items_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO items_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+# Количество элементов пользователей users.items_count. Триггеры срабатывают
+# на любое изменение items, в том числе массовое и в обход crud, и меняют
+# счетчик в той же транзакции. Учитываются только неудаленные элементы:
+# мягкое удаление уменьшает счетчик, а удаление из БД уже удаленного
+# элемента его не меняет
+USERS_ITEMS_COUNT_DDL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS users_items_count_insert
+    AFTER INSERT ON items
+    WHEN new.deleted_at IS NULL
+    BEGIN
+        UPDATE users SET items_count = items_count + 1
+        WHERE id = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_items_count_delete
+    AFTER DELETE ON items
+    WHEN old.deleted_at IS NULL
+    BEGIN
+        UPDATE users SET items_count = items_count - 1
+        WHERE id = old.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_items_count_update
+    AFTER UPDATE OF user_id ON items
+    WHEN new.user_id != old.user_id AND new.deleted_at IS NULL
+    BEGIN
+        UPDATE users SET items_count = items_count - 1
+        WHERE id = old.user_id;
+        UPDATE users SET items_count = items_count + 1
+        WHERE id = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS users_items_count_soft_delete
+    AFTER UPDATE OF deleted_at ON items
+    WHEN old.deleted_at IS NULL AND new.deleted_at IS NOT NULL
+    BEGIN
+        UPDATE users SET items_count = items_count - 1
+        WHERE id = old.user_id;
+    END
+    """,
+]
+
+# Пересчет users.items_count по items
+USERS_ITEMS_COUNT_REBUILD = """
+    UPDATE users SET items_count = (
+        SELECT count(*) FROM items WHERE items.user_id = users.id
+    )
+"""
+
+
+def changes_ddl(
+    entity: str,
+    table: str,
+    columns: str,
+    deleted: str = "old.deleted_at IS NOT NULL",
+) -> list[str]:
+    """
+    Возвращает триггеры журнала изменений записей entity таблицы table:
+    вставка, изменение столбцов columns (в том числе мягкое удаление) и
+    удаление неудаленной строки из БД заменяют строку записи в changes
+    новой с очередным номером. Удаление из БД строки, уже отмеченной в
+    журнале удаленной (условие deleted, по умолчанию - мягко удаленной),
+    при очистке журнал не меняет.
+    """
+    replace = """
+        DELETE FROM changes WHERE entity = '{entity}' AND entity_id = {row}.id;
+        INSERT INTO changes (entity, entity_id, deleted)
+        VALUES ('{entity}', {row}.id, {deleted});
+    """
+    new = replace.format(
+        entity=entity, row="new", deleted="new.deleted_at IS NOT NULL"
+    )
+    old = replace.format(entity=entity, row="old", deleted="1")
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS changes_{table}_insert
+        AFTER INSERT ON {table}
+        BEGIN {new} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS changes_{table}_update
+        AFTER UPDATE OF {columns}, deleted_at ON {table}
+        BEGIN {new} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS changes_{table}_delete
+        AFTER DELETE ON {table}
+        WHEN NOT ({deleted})
+        BEGIN {old} END
+        """,
+    ]
+
+
+# Мягкое удаление пользователя отмечает в журнале удаленными и его
+# неудаленные элементы: они перестают возвращаться вместе с пользователем
+# (exclude_deleted). Поэтому их удаление из БД при очистке журнал не меняет
+CHANGES_USER_ITEMS_DDL = """
+    CREATE TRIGGER IF NOT EXISTS changes_users_soft_delete
+    AFTER UPDATE OF deleted_at ON users
+    WHEN old.deleted_at IS NULL AND new.deleted_at IS NOT NULL
+    BEGIN
+        DELETE FROM changes WHERE entity = 'item' AND entity_id IN (
+            SELECT id FROM items
+            WHERE user_id = new.id AND deleted_at IS NULL
+        );
+        INSERT INTO changes (entity, entity_id, deleted)
+        SELECT 'item', id, 1 FROM items
+        WHERE user_id = new.id AND deleted_at IS NULL
+        ORDER BY id;
+    END
+"""
+
+# Журнал изменений changes. Триггеры срабатывают на любое изменение users и
+# items, в том числе массовое и в обход crud, и пишут журнал в той же
+# транзакции. users.items_count меняется вместе с элементами и в журнал
+# пользователей не попадает, поэтому schemas.UserChanged его не содержит
+CHANGES_DDL = (
+    changes_ddl("user", "users", "name, email, address")
+    + changes_ddl(
+        "item",
+        "items",
+        "title, description, user_id",
+        deleted="old.deleted_at IS NOT NULL OR EXISTS (SELECT 1 FROM users "
+        "WHERE id = old.user_id AND deleted_at IS NOT NULL)",
+    )
+    + [CHANGES_USER_ITEMS_DDL]
+)
+
+# create_all создает виртуальную таблицу и триггеры вместе с items
+for ddl in ITEMS_FTS_DDL + USERS_ITEMS_COUNT_DDL:
+    event.listen(
+        Item.__table__, "after_create", DDL(ddl).execute_if(dialect="sqlite")
+    )
+# Триггеры журнала ссылаются на несколько таблиц и создаются после всех
+for ddl in CHANGES_DDL:
+    event.listen(
+        Base.metadata, "after_create", DDL(ddl).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Item.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS items_fts").execute_if(dialect="sqlite"),
+)
+
+
+# id удаленных пользователей. Запрос по таблице, а не модели, чтобы к нему
+# не добавлялось условие exclude_deleted
+deleted_users = select(User.__table__.c.id).where(
+    User.__table__.c.deleted_at.is_not(None)
+)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def exclude_deleted(state: ORMExecuteState) -> None:
+    """
+    Добавляет к каждому запросу SELECT через ORM, в том числе к загрузке
+    связей и Session.get, условие deleted_at IS NULL для всех моделей.
+    Элементы удаленного пользователя тоже исключаются: до их очистки
+    удаление пользователя распространяется на них при чтении. Подзапрос
+    удаленных пользователей не зависит от строки и читает индекс
+    ix_users_deleted_at один раз на запрос.
+    Удаленные строки читаются с параметром выполнения include_deleted.
+    Условие не добавляется к запросам изменения и к подзапросам exists()
+    без модели в FROM, их условия указываются явно.
+    """
+    # Загрузки связей и отложенных столбцов наследуют условие родительского
+    # запроса. Обновление атрибутов объектов, уже загруженных в сессию,
+    # условие не получает
+    if (
+        state.is_select
+        and not state.is_column_load
+        and not state.is_relationship_load
+        and not state.execution_options.get("include_deleted", False)
+    ):
+        state.statement = state.statement.options(
+            with_loader_criteria(
+                User, User.deleted_at.is_(None), include_aliases=True
+            ),
+            with_loader_criteria(
+                Item,
+                lambda cls: cls.deleted_at.is_(None)
+                & cls.user_id.not_in(deleted_users),
+                include_aliases=True,
+            ),
+        )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def no_yield_per_in_relationship_loads(state: ORMExecuteState) -> None:
+    """
+    Отключает yield_per в загрузке связей, унаследованный от родительского
+    запроса: selectin-загрузка выбирает строки через unique(), что вместе с
+    yield_per приводит к ошибке, если у столбцов связанной модели есть
+    преобразование результата (deleted_at).
+    """
+    if state.is_relationship_load and state.execution_options.get("yield_per"):
+        state.update_execution_options(yield_per=None)
@@ -0,0 +1,108 @@
+"""
+Фоновая очистка мягко удаленных строк.
+
+DELETE /users/{id} и DELETE /items/{id} только отмечают строку временем
+удаления deleted_at одним UPDATE, а строки удаляются из БД позже потоком
+очистки: сначала удаленные элементы и элементы удаленных пользователей,
+затем удаленные пользователи без элементов. Строки удаляются пачками по
+PURGE_BATCH_SIZE штук, по одной транзакции на пачку с паузой
+PURGE_BATCH_PAUSE_MS миллисекунд между ними, чтобы очистка не держала
+блокировку записи sqlite долго и не задерживала запись запросов.
+Очистка запускается каждые PURGE_INTERVAL секунд.
+
+Запуск однократной очистки: python -m src.purge
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from src import config
+from src.internal.crud import item as itemcrud
+from src.internal.crud import user as usercrud
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeWorker:
+    """
+    Поток периодической очистки мягко удаленных строк.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval: float | None = None,
+        batch_size: int | None = None,
+        pause: float | None = None,
+    ):
+        self.session_factory = session_factory
+        # Интервал и пауза в секундах
+        self.interval = interval or config.PURGE_INTERVAL
+        self.batch_size = batch_size or config.PURGE_BATCH_SIZE
+        if pause is None:
+            pause = config.PURGE_BATCH_PAUSE_MS / 1000
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def run_once(self) -> int:
+        """
+        Удаляет пачками все мягко удаленные строки. Возвращает количество
+        удаленных строк.
+        """
+        total = 0
+        # Пользователи удаляются после своих элементов
+        for purge in (itemcrud.purge_items, usercrud.purge_users):
+            while not self._stop.is_set():
+                with self.session_factory() as db:
+                    purged = purge(db=db, batch_size=self.batch_size)
+                total += purged
+                if purged < self.batch_size:
+                    break
+                time.sleep(self.pause)
+        return total
+
+    def start(self) -> None:
+        """
+        Запускает поток очистки.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="purge", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Останавливает поток очистки после текущей пачки.
+        """
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                purged = self.run_once()
+            except Exception:
+                logger.exception("Purge of deleted rows failed")
+                continue
+            if purged:
+                logger.info("Purged %d deleted rows", purged)
+
+
+def main():
+    from src import database
+
+    database.init_engines()
+    purged = PurgeWorker(database.SessionLocal).run_once()
+    print(f"Purged deleted rows: {purged}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Восстановление денормализованных данных БД.
+
+Пересчитывает количество элементов users.items_count у пользователей,
+у которых оно расходится с таблицей items. Счетчик поддерживают триггеры,
+поэтому расхождение возможно только после изменения БД в обход них.
+
+Запуск: python -m src.repair
+"""
+
+from src import database
+from src.internal.crud import user as usercrud
+
+
+def main():
+    database.init_engines()
+    with database.SessionLocal() as db:
+        repaired = usercrud.recount_items(db=db)
+    print(f"Repaired users.items_count: {repaired}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,10 @@ class ItemCreate(ItemBase):
     pass
 
 
+class ItemBulkUpdate(ItemBase):
+    id: int
+
+
 class Item(ItemBase):
     id: int
 
@@ -18,6 +22,32 @@ class Item(ItemBase):
         from_attributes = True
 
 
+class ItemVersioned(Item):
+    # Версия строки для ETag
+    version: int
+
+
+class ItemFilter(BaseModel):
+    # Владелец элементов
+    user_id: int | None = None
+    # Начало названия (с учетом регистра)
+    title_prefix: str | None = None
+    # Границы id включительно
+    min_id: int | None = None
+    max_id: int | None = None
+    # Порядок: "id" или "title", с префиксом "-" - по убыванию
+    sort: str = "id"
+
+
+class PageCursor(BaseModel):
+    # id последней строки предыдущей страницы
+    after_id: int | None = None
+    # Значения остальных столбцов ключа сортировки этой строки
+    after_key: list[str | int | float] = []
+    # Имена столбцов ключа сортировки, последний - id
+    keys: list[str] = ["id"]
+
+
 class UserBase(BaseModel):
     name: str | None = Field(max_length=100)
     email: EmailStr = Field(max_length=100)
@@ -28,10 +58,139 @@ class UserCreate(UserBase):
     pass
 
 
+class UserBulkUpdate(UserBase):
+    id: int
+
+
 class User(UserBase):
     id: int
+    # Количество элементов пользователя
+    items_count: int = 0
 
     items: list[Item] = []
 
     class Config:
         from_attributes = True
+
+
+class UserFilter(BaseModel):
+    # Границы количества элементов включительно
+    min_items: int | None = None
+    max_items: int | None = None
+    # Порядок: "id" или "items_count", с префиксом "-" - по убыванию
+    sort: str = "id"
+
+
+class UserProjection(BaseModel):
+    # Поля пользователя в ответе (id возвращается всегда), None - все поля
+    fields: list[str] | None = None
+    # Возвращать ли элементы пользователя
+    include_items: bool = True
+
+
+class UserVersioned(User):
+    # Версия строки для ETag
+    version: int
+
+    items: list[ItemVersioned] = []
+
+
+class OwnerStats(BaseModel):
+    id: int
+    name: str | None
+    # Количество элементов пользователя
+    items_count: int
+
+
+class UserStats(BaseModel):
+    # Количество пользователей
+    users: int
+    # Количество пользователей, у которых есть элементы
+    users_with_items: int
+    # Среднее и наибольшее количество элементов пользователя
+    avg_items: float
+    max_items: int
+    # Пользователи с наибольшим количеством элементов
+    top_owners: list[OwnerStats]
+
+
+class CountBucket(BaseModel):
+    # Границы количества элементов включительно (None - без ограничения)
+    min_items: int
+    max_items: int | None
+    # Количество владельцев с таким количеством элементов
+    owners: int
+
+
+class ItemStats(BaseModel):
+    # Количество элементов
+    items: int
+    # Количество разных владельцев элементов
+    owners: int
+    # Количество элементов, владельца которых нет в users
+    orphans: int
+    # Распределение владельцев по количеству элементов
+    items_per_owner: list[CountBucket]
+
+
+class ItemBatch(BaseModel):
+    # Найденные элементы в порядке запрошенных id
+    items: list[Item]
+    # Запрошенные id, элементов с которыми нет
+    missing: list[int]
+
+
+class UserBatch(BaseModel):
+    # Найденные пользователи в порядке запрошенных id
+    users: list[User]
+    # Запрошенные id, пользователей с которыми нет
+    missing: list[int]
+
+
+class UserChanged(UserBase):
+    # Без items_count: счетчик меняется вместе с элементами и не попадает в
+    # журнал, количество элементов клиент считает по изменениям элементов
+    id: int
+    # Версия строки для ETag
+    version: int
+
+    class Config:
+        from_attributes = True
+
+
+class Change(BaseModel):
+    # Номер изменения: следующая страница запрашивается с since, равным
+    # номеру последнего изменения страницы
+    seq: int
+    # Тип записи: "user" или "item"
+    entity: str
+    id: int
+    # Запись удалена (tombstone). При удалении пользователя отметки об
+    # удалении получают и все его элементы
+    deleted: bool
+    # Текущее состояние неудаленной записи. Элементы пользователя в него
+    # не входят, их изменения передаются отдельно
+    user: UserChanged | None = None
+    item: ItemVersioned | None = None
+
+
+class BulkResult(BaseModel):
+    # Номер строки в запросе
+    index: int
+    # id созданной, измененной или удаленной записи
+    id: int | None = None
+    # Описание ошибки, если строка не обработана
+    detail: str | None = None
+
+
+class CacheStats(BaseModel):
+    # Количество чтений, найденных в кэше
+    hits: int
+    # Количество чтений, не найденных в кэше
+    misses: int
+    # Количество записей, вытесненных при переполнении
+    evictions: int
+    # Количество записей, удаленных по истечении времени жизни
+    expirations: int
+    # Количество записей в кэше (-1, если неизвестно)
+    size: int
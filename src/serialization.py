@@ -0,0 +1,83 @@
+"""
+Сериализация страниц списков в JSON без моделей pydantic.
+
+Списки выбираются из БД запросами только нужных столбцов, из кортежей
+строк собираются словари, которые сериализуются в байты JSON через orjson.
+Набор и порядок полей берутся из схем schemas.Item и schemas.User, поэтому
+тело ответа совпадает с телом, которое строит response_model.
+Используется при config.RESPONSE_SERIALIZER = "orjson", а также для
+ответов с проекцией полей, которые response_model построить не может.
+"""
+
+import json
+from typing import Any, Iterable, Sequence
+
+from src import config, models, schemas
+
+# Поля схем в порядке сериализации, вложенные элементы пользователя
+# собираются отдельно
+ITEM_FIELDS = tuple(schemas.Item.model_fields)
+USER_FIELDS = tuple(f for f in schemas.User.model_fields if f != "items")
+
+
+def enabled() -> bool:
+    """
+    Проверяет, включена ли сериализация без моделей pydantic.
+    """
+    return config.RESPONSE_SERIALIZER == "orjson"
+
+
+def item_dicts(rows: Iterable[Sequence]) -> list[dict]:
+    """
+    Возвращает словари схемы schemas.Item из кортежей столбцов ITEM_FIELDS.
+    """
+    return [dict(zip(ITEM_FIELDS, row)) for row in rows]
+
+
+def user_dicts(
+    user_rows: Iterable[Sequence], item_rows: Iterable[Sequence]
+) -> list[dict]:
+    """
+    Возвращает словари схемы schemas.User из кортежей столбцов USER_FIELDS
+    с элементами из кортежей столбцов ITEM_FIELDS. Элементы добавляются
+    пользователям в порядке item_rows.
+    """
+    users = [dict(zip(USER_FIELDS, row), items=[]) for row in user_rows]
+    items = {user["id"]: user["items"] for user in users}
+    user_id = ITEM_FIELDS.index("user_id")
+    for row in item_rows:
+        items[row[user_id]].append(dict(zip(ITEM_FIELDS, row)))
+    return users
+
+
+def user_projection(
+    db_user: models.User, projection: schemas.UserProjection
+) -> dict:
+    """
+    Возвращает словарь пользователя db_user с полями projection.fields
+    (и id) в порядке схемы schemas.User и, если projection.include_items,
+    с элементами. Читаются только эти атрибуты модели.
+    """
+    fields = {"id", *(projection.fields or USER_FIELDS)}
+    data = {f: getattr(db_user, f) for f in USER_FIELDS if f in fields}
+    if projection.include_items:
+        data["items"] = [
+            {f: getattr(db_item, f) for f in ITEM_FIELDS}
+            for db_item in db_user.items
+        ]
+    return data
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Сериализует obj в байты JSON через orjson, если он включен, иначе
+    так же, как JSONResponse.
+    """
+    if not enabled():
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+    # Пакет нужен только при RESPONSE_SERIALIZER=orjson
+    import orjson
+
+    return orjson.dumps(obj)
@@ -0,0 +1,120 @@
+"""
+Запуск приложения в нескольких рабочих процессах uvicorn.
+
+Один процесс uvicorn использует одно ядро процессора, поэтому сервер
+запускает workers процессов, принимающих соединения с общего сокета.
+Каждый процесс создает свои engine и пулы соединений при старте приложения
+(lifespan src.main), поэтому соединения sqlite не используются несколькими
+процессами. Схема БД создается и мигрируется один раз до запуска рабочих
+процессов, чтобы они не выполняли DDL одновременно.
+
+При остановке (SIGTERM, SIGINT) процесс перестает принимать соединения,
+завершает начатые запросы в течение SERVER_GRACEFUL_TIMEOUT секунд,
+записывает очередь групповой записи элементов и закрывает пулы соединений.
+
+Кэш в памяти (CACHE_BACKEND=memory) был бы у каждого процесса свой, и
+изменение в одном процессе не сбрасывало бы кэш других, поэтому при
+нескольких процессах он отключается (общий кэш - CACHE_BACKEND=redis).
+Метрики /metrics у каждого процесса свои.
+
+Запуск: python -m src.server --workers 4 --port 8000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+import uvicorn
+
+from src import config, database
+
+logger = logging.getLogger(__name__)
+
+
+def check_workers(workers: int) -> None:
+    """
+    Проверяет, что настройки БД и кэша допускают workers процессов.
+    """
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1")
+    if workers == 1:
+        return
+    # У каждого процесса была бы своя БД в памяти
+    if database.is_memory_database(config.DATABASE_URL):
+        raise ValueError("In-memory database requires a single worker")
+    if config.SQLITE_JOURNAL_MODE.upper() != "WAL":
+        logger.warning(
+            "SQLITE_JOURNAL_MODE=%s: readers of other workers are blocked "
+            "by writes, use WAL",
+            config.SQLITE_JOURNAL_MODE,
+        )
+
+
+def configure_cache(workers: int) -> None:
+    """
+    Отключает кэш в памяти, если запускается больше одного процесса.
+    """
+    if workers == 1 or config.CACHE_BACKEND != "memory":
+        return
+    logger.warning(
+        "CACHE_BACKEND=memory is not shared between workers, cache is "
+        "disabled: use CACHE_BACKEND=redis"
+    )
+    # Рабочие процессы запускаются через spawn и читают настройки из
+    # окружения заново
+    os.environ["CACHE_BACKEND"] = "none"
+    config.CACHE_BACKEND = "none"
+
+
+def prepare_database() -> None:
+    """
+    Создает и мигрирует схему БД и закрывает соединения, чтобы рабочие
+    процессы не унаследовали их.
+    """
+    database.create_database()
+    asyncio.run(database.dispose_engines())
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=config.SERVER_GRACEFUL_TIMEOUT,
+        help="время завершения начатых запросов при остановке, в секундах",
+    )
+    parser.add_argument(
+        "--no-migrate",
+        action="store_true",
+        help="не создавать и не мигрировать схему БД перед запуском",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    try:
+        check_workers(args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    configure_cache(args.workers)
+    if not args.no_migrate:
+        prepare_database()
+
+    # Рабочие процессы uvicorn запускаются через spawn и импортируют
+    # приложение заново, поэтому оно передается строкой импорта
+    uvicorn.run(
+        "src.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
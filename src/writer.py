@@ -0,0 +1,121 @@
+"""
+Групповая запись элементов (group commit).
+
+При отдельной транзакции на каждый POST /items/ пропускная способность
+записи ограничена стоимостью фиксации транзакции в sqlite. ItemWriter
+принимает строки из обработчиков запросов в очередь, а один поток записи
+вставляет накопленные строки одной транзакцией через crud.create_items:
+группа отправляется, когда в ней ITEM_WRITE_BATCH_SIZE строк или через
+ITEM_WRITE_BATCH_MS миллисекунд после первой строки. Результат каждой
+строки передается через Future только после фиксации транзакции, поэтому
+ответ, как и раньше, означает, что строка сохранена.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from src import config, schemas
+from src.database import SessionLocal
+from src.internal.crud import item as crud
+
+logger = logging.getLogger(__name__)
+
+
+class ItemWriter:
+    """
+    Поток групповой записи элементов. Поток запускается при первой строке.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_rows: int | None = None,
+        max_delay: float | None = None,
+    ):
+        self.session_factory = session_factory
+        self.max_rows = max_rows or config.ITEM_WRITE_BATCH_SIZE
+        # Время ожидания в секундах
+        if max_delay is None:
+            max_delay = config.ITEM_WRITE_BATCH_MS / 1000
+        self.max_delay = max_delay
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def submit(self, item: schemas.ItemCreate) -> Future:
+        """
+        Ставит элемент item в очередь на вставку. Возвращает Future с id
+        созданного элемента или None, если пользователя item.user_id нет.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="item-writer", daemon=True
+                )
+                self._thread.start()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def close(self) -> None:
+        """
+        Записывает строки, поставленные в очередь, и останавливает поток.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                try:
+                    entry = self._queue.get(
+                        timeout=max(0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopped = True
+                    break
+                batch.append(entry)
+            self._flush(batch)
+
+    def _flush(self, batch: list[tuple[schemas.ItemCreate, Future]]) -> None:
+        """
+        Вставляет строки группы batch и передает результаты в их Future.
+        """
+        try:
+            with self.session_factory() as db:
+                results = crud.create_items([item for item, _ in batch], db)
+        except Exception as e:
+            logger.exception("Item batch of %d rows failed", len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for result, (_, future) in zip(results, batch):
+            future.set_result(result.id)
+
+
+def get_item_writer() -> ItemWriter | None:
+    """
+    Зависимость с потоком групповой записи элементов (None, если групповая
+    запись отключена).
+    """
+    return item_writer
+
+
+item_writer = ItemWriter(SessionLocal) if config.ITEM_WRITE_BATCHING else None
@@ -1,9 +1,10 @@
 import unittest
+from unittest import mock
 
-from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy import create_engine, delete, func, insert, select
 from sqlalchemy.orm import Session
 
-from src import models, schemas
+from src import config, models, schemas
 from src.internal.crud import item as crud
 
 DB_URL = "sqlite:///:memory:"  # БД в памяти
@@ -92,6 +93,219 @@ class TestCrudItem(unittest.TestCase):
 
         self.db.execute(delete(models.Item))
 
+    def test_get_items_keyset(self):
+        """
+        Тест постраничной выборки элементов по ключу
+        """
+        items = self.db.scalars(
+            insert(models.Item).returning(models.Item),
+            [
+                {"title": f"Item {i}", "description": "", "user_id": 1}
+                for i in range(5)
+            ],
+        ).all()
+        self.db.commit()
+
+        # Первая страница
+        page = crud.get_items(db=self.db, limit=2).all()
+        self.assertListEqual(page, items[:2])
+        # Следующая страница начинается после последнего id
+        page = crud.get_items(db=self.db, after_id=page[-1].id, limit=2).all()
+        self.assertListEqual(page, items[2:4])
+        # Последняя неполная страница
+        page = crud.get_items(db=self.db, after_id=page[-1].id, limit=2).all()
+        self.assertListEqual(page, items[4:])
+
+        self.db.execute(delete(models.Item))
+
+    def test_prefix_upper_bound(self):
+        """
+        Тест верхней границы диапазона строк с заданным началом
+        """
+        self.assertEqual("Peo", crud.prefix_upper_bound("Pen"))
+        self.assertEqual("Peo", crud.prefix_upper_bound("Pen\U0010ffff"))
+        self.assertEqual("\ue000", crud.prefix_upper_bound("\ud7ff"))
+        self.assertIsNone(crud.prefix_upper_bound("\U0010ffff" * 2))
+
+    def test_get_items_filters(self):
+        """
+        Тест отбора и сортировки элементов с постраничной выборкой
+        """
+        db_user = models.User(name="Bob", email="bob@mail.com", address="")
+        self.db.add(db_user)
+        self.db.commit()
+        items = self.db.scalars(
+            insert(models.Item).returning(models.Item),
+            [
+                {"title": "Pen", "description": "", "user_id": 1},
+                {"title": "Book", "description": "", "user_id": 1},
+                {"title": "Pencil", "description": "", "user_id": db_user.id},
+                {"title": "pen", "description": "", "user_id": 1},
+                {"title": "Pen", "description": "", "user_id": 1},
+            ],
+        ).all()
+        self.db.commit()
+
+        def get_ids(after_id=None, limit=None, after_key=None, **filters):
+            return [
+                i.id
+                for i in crud.get_items(
+                    db=self.db,
+                    after_id=after_id,
+                    limit=limit,
+                    filters=schemas.ItemFilter(**filters),
+                    after_key=after_key,
+                )
+            ]
+
+        ids = [item.id for item in items]
+        self.assertListEqual(ids[2:3], get_ids(user_id=db_user.id))
+        # Начало названия сравнивается с учетом регистра
+        self.assertListEqual(
+            [ids[0], ids[2], ids[4]], get_ids(title_prefix="Pen")
+        )
+        self.assertListEqual(ids[1:4], get_ids(min_id=ids[1], max_id=ids[3]))
+        # У начала из последнего символа Unicode нет верхней границы
+        self.assertListEqual([], get_ids(title_prefix="\U0010ffff"))
+        self.assertListEqual([], get_ids(title_prefix="Pen\U0010ffff"))
+        self.assertListEqual(ids[::-1], get_ids(sort="-id"))
+        self.assertListEqual(
+            [ids[0], ids[4]],
+            get_ids(user_id=1, title_prefix="Pen", sort="title"),
+        )
+
+        # Страницы по названию: у одинаковых названий порядок по id
+        by_title = [ids[1], ids[0], ids[4], ids[2], ids[3]]
+        self.assertListEqual(by_title, get_ids(sort="title"))
+        titles = {item.id: item.title for item in items}
+
+        def next_ids(page, **filters):
+            return get_ids(
+                after_id=page[-1], after_key=[titles[page[-1]]], **filters
+            )
+
+        page = get_ids(limit=2, sort="title")
+        page += next_ids(page, limit=2, sort="title")
+        page += next_ids(page, limit=2, sort="title")
+        self.assertListEqual(by_title, page)
+        self.assertListEqual(
+            by_title[:2][::-1], next_ids([ids[4]], sort="-title")
+        )
+        # Ключ последней строки страницы передается значениями: строки с
+        # таким ключом может уже не быть
+        self.assertListEqual(
+            by_title[1:],
+            get_ids(after_id=ids[3] + 1, after_key=["Book"], sort="title"),
+        )
+        with self.assertRaises(ValueError):
+            get_ids(after_id=ids[0], after_key=[], sort="title")
+
+        with self.assertRaises(ValueError):
+            get_ids(sort="user_id")
+
+        self.db.execute(delete(models.Item))
+        self.db.delete(db_user)
+
+    def test_search_items(self):
+        """
+        Тест полнотекстового поиска, индекс которого обновляется триггерами
+        """
+        db_item = crud.create_item(
+            item=schemas.ItemCreate(
+                title="Red pencil", description="soft lead", user_id=1
+            ),
+            db=self.db,
+        )
+        crud.create_items(
+            items=[
+                schemas.ItemCreate(
+                    title="Blue pen", description="red cap", user_id=1
+                ),
+                schemas.ItemCreate(title="Book", description="", user_id=1),
+            ],
+            db=self.db,
+        )
+
+        def search(q):
+            return [
+                i.title for i in crud.search_items(q=q, db=self.db, limit=10)
+            ]
+
+        self.assertListEqual(["Red pencil"], search("pencil"))
+        self.assertCountEqual(["Red pencil", "Blue pen"], search("red"))
+        # Последнее слово ищется как начало слова, синтаксис FTS5 не действует
+        self.assertCountEqual(["Red pencil", "Blue pen"], search("pen"))
+        self.assertListEqual(["Red pencil"], search("soft pen"))
+        self.assertListEqual([], search('" OR *'))
+
+        crud.update_item(
+            id=db_item.id,
+            item=schemas.ItemCreate(title="Marker", description="", user_id=1),
+            db=self.db,
+        )
+        self.assertListEqual(["Blue pen"], search("red"))
+        self.db.execute(delete(models.Item))
+        self.assertListEqual([], search("red"))
+
+    def test_get_item_stats(self):
+        """
+        Тест статистики элементов
+        """
+        user_id = self.db.scalar(select(models.User.id))
+        # У владельцев 1, 3 и 12 элементов, владельца 1000 нет в users
+        self.db.execute(
+            insert(models.Item),
+            [
+                {"title": "Book", "description": "", "user_id": owner}
+                for owner, count in [(user_id, 1), (1000, 3), (1001, 12)]
+                for _ in range(count)
+            ],
+        )
+        self.db.commit()
+
+        stats = crud.get_item_stats(db=self.db)
+
+        self.assertEqual(16, stats.items)
+        self.assertEqual(3, stats.owners)
+        self.assertEqual(15, stats.orphans)
+        self.assertListEqual(
+            [(1, 1, 1), (2, 4, 1), (5, 9, 0), (10, 99, 1)],
+            [
+                (b.min_items, b.max_items, b.owners)
+                for b in stats.items_per_owner[:4]
+            ],
+        )
+        last = stats.items_per_owner[-1]
+        self.assertEqual((1000, None), (last.min_items, last.max_items))
+
+        self.db.execute(delete(models.Item))
+        self.db.commit()
+        stats = crud.get_item_stats(db=self.db)
+        self.assertEqual((0, 0, 0), (stats.items, stats.owners, stats.orphans))
+        self.assertEqual(
+            len(crud.ITEMS_PER_OWNER_BOUNDS), len(stats.items_per_owner)
+        )
+
+    def test_iter_items(self):
+        """
+        Тест выборки всех элементов пачками
+        """
+        items = self.db.scalars(
+            insert(models.Item).returning(models.Item),
+            [
+                {"title": f"Item {i}", "description": "", "user_id": 1}
+                for i in range(5)
+            ],
+        ).all()
+        self.db.commit()
+
+        chunks = list(crud.iter_items(db=self.db, chunk_size=2))
+
+        self.assertListEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertListEqual(items, [i for chunk in chunks for i in chunk])
+
+        self.db.execute(delete(models.Item))
+
     def test_get_item_by_id(self):
         db_item = models.Item(
             title="Book",
@@ -111,6 +325,25 @@ class TestCrudItem(unittest.TestCase):
 
         self.db.delete(db_item)
 
+    def test_get_items_by_ids(self):
+        ids = self.db.scalars(
+            insert(models.Item).returning(models.Item.id),
+            [
+                {"title": f"Item {i}", "description": "", "user_id": 1}
+                for i in range(5)
+            ],
+        ).all()
+        self.db.commit()
+
+        # id разбиваются на пачки, повторные и отсутствующие id пропускаются
+        with mock.patch.object(config, "SQL_IN_CHUNK_SIZE", 2):
+            found = crud.get_items_by_ids(ids=[*ids, ids[0], 0], db=self.db)
+
+        self.assertListEqual(sorted(ids), sorted(found))
+        self.assertTrue(all(found[id].id == id for id in ids))
+
+        self.db.execute(delete(models.Item))
+
     def test_update_item(self):
         """
         Тест обновления пользователя
@@ -130,7 +363,7 @@ class TestCrudItem(unittest.TestCase):
             user_id=1,
         )
 
-        db_item = crud.update_item(db_item=db_item, item=item_new, db=self.db)
+        db_item = crud.update_item(id=db_item.id, item=item_new, db=self.db)
 
         self.assertIsInstance(db_item, models.Item)
         self.assertEqual(item_new.title, db_item.title)
@@ -153,8 +386,20 @@ class TestCrudItem(unittest.TestCase):
         )
 
         crud.delete_item(db_item=db_item, db=self.db)
+        self.db.expunge_all()
 
         db_item = self.db.scalar(select(models.Item))
 
         self.assertNotIsInstance(db_item, models.Item)
         self.assertIsNone(db_item)
+        # Удаленный элемент не учитывается в количестве элементов владельца
+        self.assertEqual(0, self.db.get(models.User, 1).items_count)
+        # Строка остается в БД до очистки
+        db_item = self.db.scalar(
+            select(models.Item).execution_options(include_deleted=True)
+        )
+        self.assertIsNotNone(db_item.deleted_at)
+        self.assertEqual(1, crud.purge_items(db=self.db))
+        self.assertEqual(
+            0, self.db.scalar(select(func.count()).select_from(models.Item))
+        )
@@ -1,9 +1,20 @@
 import unittest
 
-from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy import (
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.orm import Session
 
 from src import models, schemas
+from src.internal.crud import change as changecrud
+from src.internal.crud import item as itemcrud
 from src.internal.crud import user as crud
 
 DB_URL = "sqlite:///:memory:"  # БД в памяти
@@ -55,6 +66,27 @@ class TestCrudUser(unittest.TestCase):
 
         self.db.delete(db_user)
 
+    def test_create_user_duplicate_email(self):
+        """
+        Тест создания пользователя с занятым email
+        """
+        user = schemas.UserCreate(
+            name="John Doe", email="test@mail.com", address="some address"
+        )
+        db_user = crud.create_user(user=user, db=self.db)
+
+        with self.assertRaises(IntegrityError):
+            crud.create_user(user=user, db=self.db)
+        # Транзакция откачена, сессия пригодна для работы
+        self.assertEqual(
+            [db_user.id],
+            self.db.scalars(
+                select(models.User.id).where(models.User.email == user.email)
+            ).all(),
+        )
+
+        self.db.execute(delete(models.User))
+
     def test_get_users(self):
         users = self.db.scalars(
             insert(models.User).returning(models.User),
@@ -83,6 +115,44 @@ class TestCrudUser(unittest.TestCase):
 
         self.db.execute(delete(models.User))
 
+    def test_get_users_loads_items(self):
+        """
+        Тест жадной загрузки элементов пользователей для всех стратегий
+        """
+        db_user = models.User(
+            name="Jack Black",
+            email="test@mail.com",
+            address="some address",
+        )
+        self.db.add(db_user)
+        self.db.commit()
+        self.db.execute(
+            insert(models.Item),
+            [
+                {"title": "Book", "description": "", "user_id": db_user.id},
+                {"title": "Pen", "description": "", "user_id": db_user.id},
+            ],
+        )
+        self.db.commit()
+
+        for strategy in crud.ITEMS_LOADERS:
+            with self.subTest(strategy=strategy):
+                # Сбрасываем identity map, чтобы объекты загрузились заново
+                self.db.expunge_all()
+
+                users = crud.get_users(db=self.db, strategy=strategy).all()
+
+                self.assertEqual(1, len(users))
+                # items должны быть загружены вместе с пользователем
+                self.assertNotIn("items", inspect(users[0]).unloaded)
+                self.assertEqual(2, len(users[0].items))
+
+        with self.assertRaises(ValueError):
+            crud.get_users(db=self.db, strategy="lazy")
+
+        self.db.execute(delete(models.Item))
+        self.db.execute(delete(models.User))
+
     def test_get_user_by_id(self):
         db_user = models.User(
             name="Jack Black",
@@ -102,6 +172,243 @@ class TestCrudUser(unittest.TestCase):
 
         self.db.delete(db_user)
 
+    def test_get_user_by_id_projection(self):
+        """
+        Тест чтения пользователя только с выбранными полями
+        """
+        db_user = crud.create_user(
+            user=schemas.UserCreate(
+                name="Jack Black", email="test@mail.com", address="address"
+            ),
+            db=self.db,
+        )
+        self.db.expunge_all()
+
+        user = crud.get_user_by_id(
+            id=db_user.id,
+            db=self.db,
+            projection=schemas.UserProjection(
+                fields=["email"], include_items=False
+            ),
+        )
+
+        self.assertEqual(db_user.email, user.email)
+        self.assertEqual(db_user.version, user.version)
+        # Остальные атрибуты не загружаются и не читаются отдельным запросом
+        self.assertSetEqual(
+            {"name", "address", "items", "items_count", "deleted_at"},
+            inspect(user).unloaded,
+        )
+        with self.assertRaises(InvalidRequestError):
+            user.name
+        with self.assertRaises(InvalidRequestError):
+            user.items
+
+        self.assertTrue(crud.user_exists(id=db_user.id, db=self.db))
+        self.db.delete(user)
+        self.db.commit()
+        self.assertFalse(crud.user_exists(id=db_user.id, db=self.db))
+
+    def test_get_user_stats(self):
+        """
+        Тест статистики пользователей и количества элементов в проекции
+        """
+        users = self.db.scalars(
+            insert(models.User).returning(models.User.id),
+            [{"email": f"user{i}@mail.com"} for i in range(4)],
+        ).all()
+        # У пользователей 3, 1, 3 и 0 элементов, у одного элемента нет
+        # владельца
+        self.db.execute(
+            insert(models.Item),
+            [
+                {"title": "Book", "description": "", "user_id": user_id}
+                for user_id in [*users[:1] * 3, users[1], *users[2:3] * 3]
+            ]
+            + [{"title": "Book", "description": "", "user_id": 1000}],
+        )
+        self.db.commit()
+
+        stats = crud.get_user_stats(db=self.db, top=2)
+
+        self.assertEqual(4, stats.users)
+        self.assertEqual(3, stats.users_with_items)
+        self.assertEqual(7 / 4, stats.avg_items)
+        self.assertEqual(3, stats.max_items)
+        # При равном количестве элементов пользователи упорядочены по id
+        self.assertListEqual(
+            [(users[0], 3), (users[2], 3)],
+            [(o.id, o.items_count) for o in stats.top_owners],
+        )
+
+        db_users = crud.get_users(
+            db=self.db,
+            projection=schemas.UserProjection(
+                fields=["items_count"], include_items=False
+            ),
+        ).all()
+        self.assertListEqual([3, 1, 3, 0], [u.items_count for u in db_users])
+        self.assertIn("items", inspect(db_users[0]).unloaded)
+
+        self.db.execute(delete(models.Item))
+        self.db.execute(delete(models.User))
+        self.db.commit()
+        stats = crud.get_user_stats(db=self.db)
+        self.assertEqual(0, stats.avg_items)
+        self.assertListEqual([], stats.top_owners)
+
+    def test_items_count(self):
+        """
+        Тест поддержки количества элементов при изменении элементов
+        и его пересчета
+        """
+        users = [
+            crud.create_user(
+                user=schemas.UserCreate(
+                    name="", email=f"user{i}@mail.com", address=""
+                ),
+                db=self.db,
+            ).id
+            for i in range(2)
+        ]
+
+        def counts() -> list[int]:
+            return self.db.scalars(
+                select(models.User.items_count).order_by(models.User.id)
+            ).all()
+
+        item = schemas.ItemCreate(
+            title="Book", description="", user_id=users[0]
+        )
+        db_item = itemcrud.create_item(item=item, db=self.db)
+        itemcrud.create_items(items=[item, item], db=self.db)
+        self.assertListEqual([3, 0], counts())
+
+        # Смена владельца переносит элемент в счетчик нового владельца
+        itemcrud.update_item(
+            id=db_item.id,
+            item=item.model_copy(update={"user_id": users[1]}),
+            db=self.db,
+        )
+        self.assertListEqual([2, 1], counts())
+        itemcrud.update_item(
+            id=db_item.id,
+            item=item.model_copy(update={"user_id": users[1]}),
+            db=self.db,
+        )
+        self.assertListEqual([2, 1], counts())
+        itemcrud.delete_item(
+            db_item=itemcrud.get_item_by_id(id=db_item.id, db=self.db),
+            db=self.db,
+        )
+        self.assertListEqual([2, 0], counts())
+
+        # Расхождение исправляется пересчетом
+        self.db.execute(update(models.User).values(items_count=5))
+        self.db.commit()
+        self.assertEqual(2, crud.recount_items(db=self.db, chunk_size=1))
+        self.assertListEqual([2, 0], counts())
+        self.assertEqual(0, crud.recount_items(db=self.db))
+
+        self.db.execute(delete(models.Item))
+        self.db.execute(delete(models.User))
+
+    def test_get_users_filters(self):
+        """
+        Тест отбора и сортировки пользователей по количеству элементов
+        """
+        users = self.db.scalars(
+            insert(models.User).returning(models.User.id),
+            [{"email": f"user{i}@mail.com"} for i in range(4)],
+        ).all()
+        # У пользователей 1, 3, 0 и 3 элемента
+        self.db.execute(
+            insert(models.Item),
+            [
+                {"title": "Book", "description": "", "user_id": user_id}
+                for user_id, count in zip(users, [1, 3, 0, 3])
+                for _ in range(count)
+            ],
+        )
+        self.db.commit()
+
+        def ids(**kwargs) -> list[int]:
+            return [
+                u.id
+                for u in crud.get_users(
+                    db=self.db, filters=schemas.UserFilter(**kwargs)
+                )
+            ]
+
+        self.assertListEqual(
+            [users[3], users[1], users[0], users[2]],
+            ids(sort="-items_count"),
+        )
+        self.assertListEqual([users[0], users[2]], ids(max_items=1))
+        self.assertListEqual(
+            [users[0], users[1], users[3]],
+            ids(min_items=1, sort="items_count"),
+        )
+        # Следующая страница начинается после ключа (after_key, after_id)
+        page = crud.get_users(
+            db=self.db,
+            after_id=users[1],
+            limit=2,
+            filters=schemas.UserFilter(sort="-items_count"),
+            after_key=[3],
+        )
+        self.assertListEqual([users[0], users[2]], [u.id for u in page])
+        # Ключ берется из курсора, а не из текущей строки after_id
+        page = crud.get_users(
+            db=self.db,
+            after_id=users[1],
+            filters=schemas.UserFilter(sort="-items_count"),
+            after_key=[1],
+        )
+        self.assertListEqual([users[0], users[2]], [u.id for u in page])
+        with self.assertRaises(ValueError):
+            crud.get_users(
+                db=self.db,
+                after_id=users[1],
+                filters=schemas.UserFilter(sort="items_count"),
+            )
+        rows, _ = crud.get_user_rows(
+            db=self.db,
+            filters=schemas.UserFilter(min_items=3),
+        )
+        self.assertListEqual([users[1], users[3]], [row.id for row in rows])
+        with self.assertRaises(ValueError):
+            ids(sort="name")
+
+        self.db.execute(delete(models.Item))
+        self.db.execute(delete(models.User))
+
+    def test_get_users_by_ids(self):
+        db_users = [
+            models.User(name="John", email=f"{i}@mail.com", address="")
+            for i in range(2)
+        ]
+        self.db.add_all(db_users)
+        self.db.commit()
+        itemcrud.create_item(
+            schemas.ItemCreate(
+                title="Book", description="", user_id=db_users[0].id
+            ),
+            db=self.db,
+        )
+        self.db.expire_all()
+
+        ids = [u.id for u in db_users]
+        found = crud.get_users_by_ids(ids=[*ids, 0], db=self.db)
+
+        self.assertListEqual(ids, sorted(found))
+        # Элементы загружены вместе с пользователями
+        self.assertIn("items", inspect(found[ids[0]]).dict)
+        self.assertEqual(1, len(found[ids[0]].items))
+
+        self.db.execute(delete(models.Item))
+        self.db.execute(delete(models.User))
+
     def test_get_user_by_email(self):
         db_user = models.User(
             name="Jack Black",
@@ -138,12 +445,14 @@ class TestCrudUser(unittest.TestCase):
             name="John Doe", email="john@doe.com", address="address new"
         )
 
-        db_user = crud.update_user(db_user=db_user, user=user_new, db=self.db)
+        db_user = crud.update_user(id=db_user.id, user=user_new, db=self.db)
 
         self.assertIsInstance(db_user, models.User)
         self.assertEqual(user_new.name, db_user.name)
         self.assertEqual(user_new.email, db_user.email)
         self.assertEqual(user_new.address, db_user.address)
+        # Версия строки увеличивается при изменении
+        self.assertEqual(2, db_user.version)
 
         self.db.delete(db_user)
 
@@ -161,8 +470,116 @@ class TestCrudUser(unittest.TestCase):
         )
 
         crud.delete_user(db_user=db_user, db=self.db)
+        self.db.expunge_all()
 
         db_user = self.db.scalar(select(models.User))
 
         self.assertNotIsInstance(db_user, models.User)
         self.assertIsNone(db_user)
+        # Строка остается в БД до очистки, а email можно использовать снова
+        db_user = self.db.scalar(
+            select(models.User).execution_options(include_deleted=True)
+        )
+        self.assertIsNotNone(db_user.deleted_at)
+        new_user = crud.create_user(
+            user=schemas.UserCreate(
+                name="Jack Black", email="test@mail.com", address=""
+            ),
+            db=self.db,
+        )
+        self.assertNotEqual(db_user.id, new_user.id)
+
+        self.assertEqual(1, crud.purge_users(db=self.db))
+        self.db.delete(new_user)
+
+    def test_purge_users(self):
+        """
+        Тест очистки удаленного пользователя и его элементов пачками
+        """
+        db_user = models.User(name="John", email="test@mail.com", address="")
+        self.db.add(db_user)
+        self.db.flush()
+        self.db.execute(
+            insert(models.Item),
+            [
+                {
+                    "title": f"Item {i}",
+                    "description": "",
+                    "user_id": db_user.id,
+                }
+                for i in range(3)
+            ],
+        )
+        self.db.commit()
+
+        crud.delete_user(db_user=db_user, db=self.db)
+        self.db.expunge_all()
+
+        # Элементы удаленного пользователя не читаются и до очистки
+        self.assertListEqual([], itemcrud.get_items(db=self.db).all())
+        # Пользователь удаляется только после своих элементов
+        self.assertEqual(0, crud.purge_users(db=self.db))
+        self.assertEqual(2, itemcrud.purge_items(db=self.db, batch_size=2))
+        self.assertEqual(1, itemcrud.purge_items(db=self.db, batch_size=2))
+        self.assertEqual(0, itemcrud.purge_items(db=self.db, batch_size=2))
+        self.assertEqual(1, crud.purge_users(db=self.db))
+        for model in [models.User, models.Item]:
+            self.assertIsNone(
+                self.db.scalar(
+                    select(model).execution_options(include_deleted=True)
+                )
+            )
+
+    def test_changes(self):
+        """
+        Тест журнала изменений при массовых изменениях пользователей
+        """
+        since = self.db.scalar(
+            select(func.coalesce(func.max(models.Change.seq), 0))
+        )
+        created = crud.create_users(
+            users=[
+                schemas.UserCreate(
+                    name=name, email=f"{name}@mail.com", address=""
+                )
+                for name in ["ann", "bob"]
+            ],
+            db=self.db,
+        )
+        ann_id, bob_id = [r.id for r in created]
+        item_id = itemcrud.create_item(
+            item=schemas.ItemCreate(
+                title="Book", description="", user_id=bob_id
+            ),
+            db=self.db,
+        ).id
+        crud.update_users(
+            users=[
+                schemas.UserBulkUpdate(
+                    id=ann_id, name="Ann", email="ann@mail.com", address=""
+                )
+            ],
+            db=self.db,
+        )
+        crud.delete_users(ids=[bob_id], db=self.db)
+
+        changes = changecrud.get_changes(db=self.db, since=since)
+
+        # Элемент удаленного пользователя отмечен удаленным сразу
+        self.assertCountEqual(
+            [("user", ann_id, False), ("user", bob_id, True)]
+            + [("item", item_id, True)],
+            [(c.entity, c.id, c.deleted) for c in changes],
+        )
+        users = {c.id: c for c in changes if c.entity == "user"}
+        self.assertEqual("Ann", users[ann_id].user.name)
+        # Счетчик элементов не попадает в журнал и не возвращается в нем
+        self.assertNotIn("items_count", users[ann_id].user.model_dump())
+        self.assertIsNone(users[bob_id].user)
+        # Очистка удаленных записей журнал не меняет
+        self.assertEqual(1, itemcrud.purge_items(db=self.db))
+        self.assertEqual(1, crud.purge_users(db=self.db))
+        self.assertListEqual(
+            changes, changecrud.get_changes(db=self.db, since=since)
+        )
+        self.db.execute(delete(models.User))
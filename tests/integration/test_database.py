@@ -0,0 +1,156 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import OperationalError
+
+from src import config, database
+from src.database import (
+    create_async_db_engine,
+    create_db_engine,
+    engine_options,
+    get_read_db,
+)
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "test.db")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def assertPragmas(self, pragmas: dict):
+        self.assertEqual("wal", pragmas["journal_mode"])
+        # synchronous=NORMAL
+        self.assertEqual(1, pragmas["synchronous"])
+        self.assertEqual(config.SQLITE_BUSY_TIMEOUT, pragmas["busy_timeout"])
+        self.assertEqual(config.SQLITE_CACHE_SIZE, pragmas["cache_size"])
+        self.assertEqual(config.SQLITE_MMAP_SIZE, pragmas["mmap_size"])
+
+    def test_sqlite_pragmas(self):
+        engine = create_db_engine(f"sqlite:///{self.path}")
+
+        with engine.connect() as conn:
+            pragmas = {
+                name: conn.scalar(text(f"PRAGMA {name}"))
+                for name in (
+                    "journal_mode",
+                    "synchronous",
+                    "busy_timeout",
+                    "cache_size",
+                    "mmap_size",
+                )
+            }
+        engine.dispose()
+
+        self.assertPragmas(pragmas)
+
+    def test_sqlite_pragmas_async(self):
+        engine = create_async_db_engine(f"sqlite+aiosqlite:///{self.path}")
+
+        async def get_pragmas():
+            async with engine.connect() as conn:
+                pragmas = {
+                    name: await conn.scalar(text(f"PRAGMA {name}"))
+                    for name in (
+                        "journal_mode",
+                        "synchronous",
+                        "busy_timeout",
+                        "cache_size",
+                        "mmap_size",
+                    )
+                }
+            await engine.dispose()
+            return pragmas
+
+        self.assertPragmas(asyncio.run(get_pragmas()))
+
+    def test_engine_options(self):
+        options = engine_options(f"sqlite:///{self.path}")
+
+        self.assertEqual(config.DB_POOL_SIZE, options["pool_size"])
+        self.assertEqual(config.DB_MAX_OVERFLOW, options["max_overflow"])
+        self.assertEqual(config.DB_POOL_RECYCLE, options["pool_recycle"])
+        self.assertFalse(options["connect_args"]["check_same_thread"])
+
+        # Для БД в памяти размер пула не задается
+        options = engine_options("sqlite://")
+        self.assertNotIn("pool_size", options)
+        # Для остальных БД не передаются параметры sqlite
+        options = engine_options("postgresql://user@localhost/db")
+        self.assertNotIn("connect_args", options)
+        self.assertEqual(config.DB_POOL_SIZE, options["pool_size"])
+
+    def test_engine_options_read_only(self):
+        with mock.patch.multiple(
+            config, READ_DB_POOL_SIZE=3, READ_DB_MAX_OVERFLOW=2
+        ):
+            options = engine_options(f"sqlite:///{self.path}", read_only=True)
+
+        self.assertEqual(3, options["pool_size"])
+        self.assertEqual(2, options["max_overflow"])
+
+    def test_read_only_engine(self):
+        engine = create_db_engine(f"sqlite:///{self.path}")
+        read_engine = create_db_engine(
+            f"sqlite:///{self.path}", read_only=True
+        )
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1)"))
+
+        with read_engine.connect() as conn:
+            self.assertEqual(1, conn.scalar(text("SELECT x FROM t")))
+            with self.assertRaises(OperationalError):
+                conn.execute(text("INSERT INTO t VALUES (2)"))
+        read_engine.dispose()
+        engine.dispose()
+
+    def test_get_read_db(self):
+        with mock.patch.multiple(
+            database, SessionLocal=mock.DEFAULT, ReadSessionLocal=mock.DEFAULT
+        ) as factories:
+            db = next(get_read_db(read_your_writes=False))
+            self.assertIs(factories["ReadSessionLocal"].return_value, db)
+
+            # Чтение своих записей выполняется через основную БД
+            db = next(get_read_db(read_your_writes=True))
+            self.assertIs(factories["SessionLocal"].return_value, db)
+
+    def test_reset_engines_after_fork(self):
+        url = f"sqlite:///{self.path}"
+        with mock.patch.multiple(
+            config, DATABASE_URL=url, READ_DATABASE_URL=url
+        ), mock.patch.multiple(
+            database,
+            engine=None,
+            read_engine=None,
+            SessionLocal=sessionmaker(autoflush=False),
+            ReadSessionLocal=sessionmaker(autoflush=False),
+        ):
+            database.init_engines()
+            parent = database.engine
+            with parent.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            self.assertEqual(1, parent.pool.checkedin())
+
+            # Так обработчик вызывается в дочернем процессе после fork
+            database.reset_engines_after_fork()
+            self.assertIsNone(database.engine)
+            self.assertIsNone(database.read_engine)
+            # Унаследованное соединение не закрыто, но больше не в пуле
+            self.assertEqual(0, parent.pool.checkedin())
+
+            # Дочерний процесс создает свои engine и пулы
+            database.init_engines()
+            self.assertIsNot(parent, database.engine)
+            with database.SessionLocal() as db:
+                self.assertIs(database.engine, db.get_bind())
+            asyncio.run(database.dispose_engines())
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from src import config, database, models
+from src.main import app
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        url = f"sqlite:///{os.path.join(self.dir.name, 'test.db')}"
+        # Приложение создает свои engine, не затрагивая общие
+        patchers = [
+            mock.patch.multiple(
+                config, DATABASE_URL=url, READ_DATABASE_URL=url
+            ),
+            mock.patch.multiple(
+                database,
+                engine=None,
+                read_engine=None,
+                SessionLocal=sessionmaker(autoflush=False),
+                ReadSessionLocal=sessionmaker(autoflush=False),
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_lifespan(self):
+        # engine не создаются при импорте приложения
+        self.assertIsNone(database.engine)
+
+        with TestClient(app) as client:
+            engine = database.engine
+            self.assertIsNotNone(engine)
+            models.Base.metadata.create_all(bind=engine)
+            response = client.post(
+                "/users/",
+                json={"name": "John", "email": "test@mail.com", "address": ""},
+            )
+            self.assertEqual(201, response.status_code)
+            # Схема OpenAPI строится только по запросу
+            self.assertIsNone(app.openapi_schema)
+
+            database.init_engines()
+            self.assertIs(engine, database.engine)
+
+        # При остановке соединения пула закрыты
+        self.assertEqual(0, engine.pool.checkedin())
+
+    def test_lifespan_warm_up(self):
+        database.init_engines()
+        models.Base.metadata.create_all(bind=database.engine)
+        with mock.patch.multiple(
+            config, STARTUP_WARMUP=True, STARTUP_WARMUP_CONNECTIONS=3
+        ):
+            with TestClient(app):
+                read_engine = database.read_engine
+                # Пул для чтения заполнен, запросы чтения скомпилированы
+                self.assertEqual(3, read_engine.pool.checkedin())
+                self.assertLess(0, len(read_engine._compiled_cache))
+                self.assertEqual(3, database.engine.pool.checkedin())
+
+    def test_lifespan_warm_up_error(self):
+        # Без таблиц прогрев не удается, но приложение запускается
+        with mock.patch.object(config, "STARTUP_WARMUP", True):
+            with self.assertLogs("src.main", "WARNING"):
+                with TestClient(app) as client:
+                    response = client.get("/metrics")
+        self.assertEqual(200, response.status_code)
@@ -0,0 +1,165 @@
+import unittest
+
+from sqlalchemy import create_engine, inspect, text
+
+from src import migrations, models
+
+DB_URL = "sqlite:///:memory:"  # БД в памяти
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(DB_URL)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_migrate_existing_database(self):
+        """
+        Тест применения миграций к БД, созданной до появления индексов
+        """
+        models.Base.metadata.create_all(bind=self.engine)
+        # Приводим схему к состоянию до миграций
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_items_user_id"))
+            conn.execute(text("DROP INDEX ix_items_title"))
+            conn.execute(text("DROP TABLE items_fts"))
+            for trigger in ["insert", "delete", "update"]:
+                conn.execute(text(f"DROP TRIGGER items_fts_{trigger}"))
+                conn.execute(text(f"DROP TRIGGER users_items_count_{trigger}"))
+            conn.execute(text("DROP TRIGGER users_items_count_soft_delete"))
+            for trigger in ["insert", "update", "delete"]:
+                conn.execute(text(f"DROP TRIGGER changes_items_{trigger}"))
+            conn.execute(text("DROP TABLE changes"))
+            # Таблица users, созданная create_all до миграций
+            conn.execute(text("DROP TABLE users"))
+            conn.execute(
+                text(
+                    "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, "
+                    "name VARCHAR(100), email VARCHAR(100) NOT NULL, "
+                    "address VARCHAR(500), UNIQUE (email))"
+                )
+            )
+            conn.execute(text("DROP INDEX ix_items_deleted_at"))
+            conn.execute(text("ALTER TABLE items DROP COLUMN deleted_at"))
+            conn.execute(text("ALTER TABLE items DROP COLUMN version"))
+            conn.execute(
+                text(
+                    "INSERT INTO users (name, email, address) "
+                    "VALUES ('John', 'test@mail.com', '')"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO items (title, description, user_id) "
+                    "VALUES ('Book', 'old item', 1)"
+                )
+            )
+
+        version = migrations.migrate(self.engine)
+
+        self.assertEqual(max(migrations.MIGRATIONS), version)
+        indexes = inspect(self.engine).get_indexes("items")
+        self.assertIn("ix_items_user_id", [i["name"] for i in indexes])
+        self.assertIn("ix_items_title", [i["name"] for i in indexes])
+        for table in ["users", "items"]:
+            columns = inspect(self.engine).get_columns(table)
+            self.assertIn("version", [c["name"] for c in columns])
+        with self.engine.connect() as conn:
+            self.assertEqual(version, migrations.get_version(conn))
+            # Журнал изменений заполнен существующими строками
+            self.assertListEqual(
+                [("user", 1), ("item", 1)],
+                conn.execute(
+                    text("SELECT entity, entity_id FROM changes ORDER BY seq")
+                ).all(),
+            )
+            # Полнотекстовый индекс заполнен существующими строками
+            found = conn.scalars(
+                text("SELECT rowid FROM items_fts WHERE items_fts MATCH 'old'")
+            ).all()
+            self.assertListEqual([1], found)
+            # Количество элементов посчитано по существующим строкам
+            # и поддерживается триггерами
+            conn.execute(
+                text(
+                    "INSERT INTO items (title, description, user_id) "
+                    "VALUES ('Pen', 'new item', 1)"
+                )
+            )
+            self.assertEqual(
+                2, conn.scalar(text("SELECT items_count FROM users"))
+            )
+            # Мягко удаленный элемент не учитывается
+            conn.execute(
+                text("UPDATE items SET deleted_at = CURRENT_TIMESTAMP")
+            )
+            self.assertEqual(
+                0, conn.scalar(text("SELECT items_count FROM users"))
+            )
+            # Email удаленного пользователя снова можно использовать
+            conn.execute(
+                text("UPDATE users SET deleted_at = CURRENT_TIMESTAMP")
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO users (name, email, address) "
+                    "VALUES ('Jane', 'test@mail.com', '')"
+                )
+            )
+            self.assertEqual([], inspect(conn).get_unique_constraints("users"))
+
+    def test_migrate_new_database(self):
+        """
+        Тест применения миграций к БД, созданной по актуальным моделям
+        """
+        models.Base.metadata.create_all(bind=self.engine)
+
+        version = migrations.migrate(self.engine)
+        # Повторный запуск ничего не применяет
+        self.assertEqual(version, migrations.migrate(self.engine))
+
+    def test_duplicate_version(self):
+        with self.assertRaises(ValueError):
+            migrations.migration(1)(lambda conn: None)
+
+    def test_migrate_user_items_tombstones(self):
+        """
+        Тест отметки удаленными элементов пользователей, удаленных до
+        появления триггера
+        """
+        models.Base.metadata.create_all(bind=self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("DROP TRIGGER changes_users_soft_delete"))
+            conn.execute(
+                text(
+                    "INSERT INTO users (name, email, address) "
+                    "VALUES ('John', 'test@mail.com', '')"
+                )
+            )
+            conn.execute(
+                text(
+                    "INSERT INTO items (title, description, user_id) "
+                    "VALUES ('Book', '', 1)"
+                )
+            )
+            conn.execute(
+                text("UPDATE users SET deleted_at = CURRENT_TIMESTAMP")
+            )
+            migrations.get_version(conn)
+            conn.execute(migrations.version_table.update().values(version=6))
+
+        migrations.migrate(self.engine)
+
+        with self.engine.begin() as conn:
+            changes = text(
+                "SELECT entity, entity_id, deleted FROM changes ORDER BY seq"
+            )
+            self.assertListEqual(
+                [("user", 1, 1), ("item", 1, 1)], conn.execute(changes).all()
+            )
+            # Очистка элемента журнал не меняет
+            conn.execute(text("DELETE FROM items"))
+            self.assertListEqual(
+                [("user", 1, 1), ("item", 1, 1)], conn.execute(changes).all()
+            )
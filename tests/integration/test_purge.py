@@ -0,0 +1,106 @@
+import os
+import time
+import unittest
+
+from sqlalchemy import create_engine, delete, event, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from src import models
+from src.internal.crud import user as usercrud
+from src.purge import PurgeWorker
+
+DB_URL = "sqlite:///test_purge.db"
+
+
+class TestPurgeWorker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(
+            DB_URL, connect_args={"check_same_thread": False}
+        )
+        models.Base.metadata.create_all(bind=cls.engine)
+        cls.Session = sessionmaker(autoflush=False, bind=cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        os.remove("./test_purge.db")
+
+    def setUp(self):
+        """
+        Создает пользователя с 5 элементами и мягко удаляет его
+        """
+        with self.Session() as db:
+            db_user = models.User(
+                name="John", email="test@mail.com", address=""
+            )
+            db.add(db_user)
+            db.flush()
+            db.execute(
+                insert(models.Item),
+                [
+                    {"title": f"{i}", "description": "", "user_id": db_user.id}
+                    for i in range(5)
+                ],
+            )
+            db.commit()
+            usercrud.delete_user(db_user=db_user, db=db)
+
+    def tearDown(self):
+        with self.Session() as db:
+            db.execute(delete(models.Item))
+            db.execute(delete(models.User))
+            db.commit()
+
+    def count_rows(self) -> int:
+        """
+        Возвращает количество строк в users и items, включая удаленные.
+        """
+        with self.Session() as db:
+            return sum(
+                len(
+                    db.scalars(
+                        select(model).execution_options(include_deleted=True)
+                    ).all()
+                )
+                for model in [models.User, models.Item]
+            )
+
+    def test_run_once(self):
+        """
+        Тест очистки всех удаленных строк пачками по транзакции на пачку
+        """
+        commits = []
+
+        def on_commit(conn):
+            commits.append(conn)
+
+        event.listen(self.engine, "commit", on_commit)
+        self.addCleanup(event.remove, self.engine, "commit", on_commit)
+        worker = PurgeWorker(self.Session, batch_size=2, pause=0)
+
+        self.assertEqual(6, worker.run_once())
+
+        self.assertEqual(0, self.count_rows())
+        # 3 пачки элементов и пачка пользователей
+        self.assertEqual(4, len(commits))
+
+    def test_background_purge(self):
+        """
+        Тест очистки в фоновом потоке и его остановки
+        """
+        worker = PurgeWorker(self.Session, interval=0.01, pause=0)
+        worker.start()
+        self.addCleanup(worker.close)
+
+        deadline = time.monotonic() + 10
+        while self.count_rows() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(0, self.count_rows())
+        worker.close()
+        self.assertIsNone(worker._thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,18 @@
+import json
 import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, delete, insert
+from sqlalchemy import create_engine, delete, event, func, insert, select
 from sqlalchemy.orm import sessionmaker
 
-from src import models
-from src.database import get_db
+from src import cache, config, metrics, models
+from src.database import create_db_engine, get_db, get_read_db
 from src.main import app
+from src.writer import ItemWriter, get_item_writer
 
 DB_URL = "sqlite:///test.db"
 
@@ -15,6 +20,8 @@ engine = create_engine(
     DB_URL,
     connect_args={"check_same_thread": False},
 )
+# Как и engine приложения, учитываем запросы в метриках
+metrics.instrument_engine(engine)
 
 TestingSessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine
@@ -32,6 +39,23 @@ def override_get_db():
         db.close()
 
 
+@contextmanager
+def capture_statements():
+    """
+    Собирает SQL-запросы, выполненные к тестовой БД внутри блока with
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 class TestRoutes(unittest.TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -39,6 +63,7 @@ class TestRoutes(unittest.TestCase):
 
         # Переписываем зависимость
         app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
 
         # Создаем тестовый клиент
         cls.client = TestClient(app)
@@ -54,6 +79,8 @@ class TestRoutes(unittest.TestCase):
         db.execute(delete(models.User))
         db.execute(delete(models.Item))
         db.commit()
+        # Записи удалены в обход crud, поэтому кэш сбрасывается целиком
+        cache.backend.clear()
 
     def testCreateUser(self):
         # Выполняем запрос к эндпоинту для создание пользователя
@@ -74,6 +101,257 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(data["email"], "test@mail.com")
         self.assertEqual(data["address"], "some addr")
 
+    def testCreateUser_Concurrent(self):
+        """
+        Из одновременных запросов с одним email создается один пользователь,
+        остальные получают ошибку 400
+        """
+        user = {"name": "John", "email": "test@mail.com", "address": ""}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(
+                pool.map(
+                    lambda _: self.client.post("/users/", json=user), range(8)
+                )
+            )
+
+        self.assertListEqual(
+            [201] + [400] * 7, sorted(r.status_code for r in responses)
+        )
+        self.assertTrue(
+            all(
+                r.json()["detail"] == "Email already in use"
+                for r in responses
+                if r.status_code == 400
+            )
+        )
+        self.assertEqual(1, len(self.client.get("/users/").json()))
+
+    def testCreateUsers_Concurrent(self):
+        """
+        Одновременные массовые вставки с пересекающимися email создают
+        каждого пользователя один раз
+        """
+        emails = [f"user{i}@mail.com" for i in range(20)]
+
+        def create(offset: int):
+            return self.client.post(
+                "/users/bulk",
+                json=[
+                    {"name": "John", "email": email, "address": ""}
+                    for email in emails[offset:] + emails[:offset]
+                ],
+            ).json()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(create, [0, 5, 10, 15]))
+
+        created = [r["id"] for rows in results for r in rows if r["id"]]
+        self.assertEqual(len(emails), len(created))
+        self.assertEqual(len(emails), len(set(created)))
+        self.assertEqual(
+            3 * len(emails),
+            sum(
+                r["detail"] == "Email already in use"
+                for rows in results
+                for r in rows
+            ),
+        )
+        response = self.client.get("/users/")
+        self.assertCountEqual(emails, [u["email"] for u in response.json()])
+
+    def testStats(self):
+        users = [
+            self.client.post(
+                "/users/",
+                json={
+                    "name": name,
+                    "email": f"{name}@mail.com",
+                    "address": "",
+                },
+            ).json()["id"]
+            for name in ["john", "bob", "ann"]
+        ]
+        for user_id, count in zip(users, [2, 3, 0]):
+            for _ in range(count):
+                self.client.post(
+                    "/items/",
+                    json={
+                        "title": "Book",
+                        "description": "",
+                        "user_id": user_id,
+                    },
+                )
+
+        response = self.client.get("/users/stats", params={"top": 1})
+        self.assertEqual(200, response.status_code)
+        self.assertDictEqual(
+            {
+                "users": 3,
+                "users_with_items": 2,
+                "avg_items": 5 / 3,
+                "max_items": 3,
+                "top_owners": [
+                    {"id": users[1], "name": "bob", "items_count": 3}
+                ],
+            },
+            response.json(),
+        )
+        response = self.client.get("/users/stats", params={"top": 1000})
+        self.assertEqual(422, response.status_code)
+
+        response = self.client.get("/items/stats")
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(
+            (5, 2, 0), (data["items"], data["owners"], data["orphans"])
+        )
+        self.assertListEqual(
+            [0, 2, 0], [b["owners"] for b in data["items_per_owner"][:3]]
+        )
+
+        response = self.client.get("/users/")
+        self.assertListEqual(
+            [2, 3, 0], [u["items_count"] for u in response.json()]
+        )
+        # Отбор и сортировка по количеству элементов, с курсором страницы
+        response = self.client.get(
+            "/users/",
+            params={"sort": "-items_count", "min_items": 1, "limit": 1},
+        )
+        self.assertListEqual([users[1]], [u["id"] for u in response.json()])
+        response = self.client.get(
+            "/users/",
+            params={
+                "sort": "-items_count",
+                "min_items": 1,
+                "cursor": response.headers["X-Next-Cursor"],
+            },
+        )
+        self.assertListEqual([users[0]], [u["id"] for u in response.json()])
+        response = self.client.get(
+            "/users/", params={"sort": "items_count", "after_id": users[0]}
+        )
+        self.assertEqual(422, response.status_code)
+        response = self.client.get("/users/", params={"sort": "name"})
+        self.assertEqual(422, response.status_code)
+
+    def testReadRoutes_ReadEngine(self):
+        # Чтение через отдельный engine, запись через него запрещена.
+        # Режим журнала тестовой БД не меняется, чтобы не оставлять файлов
+        patcher = mock.patch.object(config, "SQLITE_JOURNAL_MODE", "DELETE")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        read_engine = create_db_engine(DB_URL, read_only=True)
+        self.addCleanup(read_engine.dispose)
+        ReadSessionLocal = sessionmaker(autoflush=False, bind=read_engine)
+
+        def override_get_read_db():
+            with ReadSessionLocal() as db:
+                yield db
+
+        app.dependency_overrides[get_read_db] = override_get_read_db
+        self.addCleanup(
+            app.dependency_overrides.__setitem__, get_read_db, override_get_db
+        )
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(
+            read_engine, "before_cursor_execute", before_cursor_execute
+        )
+
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+        # Записи выполнены через основную БД
+        self.assertEqual([], statements)
+
+        for url in (
+            "/users/",
+            f"/users/{user_id}",
+            f"/users/{user_id}/items",
+            "/users/export",
+            "/items/",
+            "/items/search?q=Book",
+            "/items/export",
+        ):
+            statements.clear()
+            response = self.client.get(url)
+            self.assertEqual(200, response.status_code, url)
+            self.assertNotEqual([], statements, url)
+
+    def testReadYourWrites_BypassesCache(self):
+        user = {"name": "John", "email": "test@mail.com", "address": ""}
+        user_id = self.client.post("/users/", json=user).json()["id"]
+        item = {"title": "Book", "description": "", "user_id": user_id}
+        item_id = self.client.post("/items/", json=item).json()["id"]
+        self.client.get(f"/users/{user_id}")
+        self.client.get(f"/items/{item_id}")
+        # Строки меняются в обход crud: в кэше остаются прежние записи
+        with TestingSessionLocal() as db:
+            db.get(models.User, user_id).name = "Bob"
+            db.get(models.Item, item_id).title = "Pen"
+            db.commit()
+        headers = {"X-Read-Your-Writes": "1"}
+
+        response = self.client.get(f"/users/{user_id}", headers=headers)
+        self.assertEqual("Bob", response.json()["name"])
+        response = self.client.get(f"/items/{item_id}", headers=headers)
+        self.assertEqual("Pen", response.json()["title"])
+        response = self.client.get(
+            "/users/batch", params={"ids": user_id}, headers=headers
+        )
+        self.assertEqual("Bob", response.json()["users"][0]["name"])
+        response = self.client.get(
+            "/items/batch", params={"ids": item_id}, headers=headers
+        )
+        self.assertEqual("Pen", response.json()["items"][0]["title"])
+
+        # Запросы с заголовком не заполняют кэш
+        response = self.client.get(f"/users/{user_id}")
+        self.assertEqual("John", response.json()["name"])
+        response = self.client.get(f"/items/{item_id}")
+        self.assertEqual("Book", response.json()["title"])
+
+    def testCreateItem_GroupCommit(self):
+        writer = ItemWriter(TestingSessionLocal, max_delay=0.01)
+        app.dependency_overrides[get_item_writer] = lambda: writer
+        self.addCleanup(app.dependency_overrides.pop, get_item_writer)
+        self.addCleanup(writer.close)
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+
+        item = {"title": "Book", "description": "", "user_id": user_id}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(
+                pool.map(
+                    lambda _: self.client.post("/items/", json=item), range(8)
+                )
+            )
+
+        self.assertTrue(all(r.status_code == 201 for r in responses))
+        ids = [r.json()["id"] for r in responses]
+        self.assertEqual(8, len(set(ids)))
+        # Созданные элементы видны сразу после ответа
+        response = self.client.get(f"/users/{user_id}/items")
+        self.assertCountEqual(ids, [i["id"] for i in response.json()])
+        self.assertDictEqual(item | {"id": ids[0]}, responses[0].json())
+
+        response = self.client.post("/items/", json=item | {"user_id": 100})
+        self.assertEqual(404, response.status_code)
+
     def testCreateUser_BadEmail(self):
         response = self.client.post(
             "/users/",
@@ -120,21 +398,945 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(db_users[0].email, data[0]["email"])
         self.assertEqual(db_users[1].email, data[1]["email"])
 
-    def testDeleteUser(self):
+    def testGetUsers_ConstantQueryCount(self):
+        """
+        Количество запросов к БД не зависит от количества пользователей
+        """
+        db = next(override_get_db())
+
+        def count_queries(users_count: int) -> int:
+            # Добавляем пользователей, у каждого по два элемента
+            db_users = db.scalars(
+                insert(models.User).returning(models.User),
+                [
+                    {
+                        "name": f"User {i}",
+                        "email": f"user{users_count}_{i}@mail.com",
+                        "address": "addr",
+                    }
+                    for i in range(users_count)
+                ],
+            ).all()
+            db.execute(
+                insert(models.Item),
+                [
+                    {"title": "Book", "description": "", "user_id": u.id}
+                    for u in db_users
+                    for _ in range(2)
+                ],
+            )
+            db.commit()
+
+            with capture_statements() as statements:
+                response = self.client.get("/users/")
+
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(len(db_users), len(response.json()))
+            self.assertTrue(all(len(u["items"]) == 2 for u in response.json()))
+
+            db.execute(delete(models.Item))
+            db.execute(delete(models.User))
+            db.commit()
+            return len(statements)
+
+        self.assertEqual(count_queries(3), count_queries(30))
+
+    def testGetItems_Pagination(self):
+        db = next(override_get_db())
+        db_user = models.User(
+            name="John", email="test@mail.com", address="address"
+        )
+        db.add(db_user)
+        db.commit()
+        db_items = db.scalars(
+            insert(models.Item).returning(models.Item),
+            [
+                {
+                    "title": f"Item {i}",
+                    "description": "",
+                    "user_id": db_user.id,
+                }
+                for i in range(5)
+            ],
+        ).all()
+        db.commit()
+
+        # Проходим все страницы по курсору из заголовка
+        ids = []
+        params = {"limit": 2}
+        while True:
+            response = self.client.get("/items/", params=params)
+            self.assertEqual(200, response.status_code)
+            ids.extend(item["id"] for item in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params["after_id"] = cursor
+
+        self.assertListEqual([item.id for item in db_items], ids)
+
+        # Размер страницы ограничен на сервере
+        response = self.client.get(
+            "/items/", params={"limit": config.PAGE_SIZE_MAX + 1}
+        )
+        self.assertEqual(422, response.status_code)
+
+    def testGetItems_FiltersAndSearch(self):
+        db = next(override_get_db())
+        db_user = models.User(name="John", email="test@mail.com", address="")
+        db.add(db_user)
+        db.commit()
+        db_items = db.scalars(
+            insert(models.Item).returning(models.Item),
+            [
+                {"title": t, "description": d, "user_id": db_user.id}
+                for t, d in [
+                    ("Pen", "blue ink"),
+                    ("Book", "about pens"),
+                    ("Pencil", ""),
+                ]
+            ],
+        ).all()
+        db.commit()
+        ids = [item.id for item in db_items]
+
+        # Страницы по убыванию названия с курсором из заголовка
+        params = {"title_prefix": "Pen", "sort": "-title", "limit": 1}
+        response = self.client.get("/items/", params=params)
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(ids[2:3], [i["id"] for i in response.json()])
+        params["cursor"] = response.headers["X-Next-Cursor"]
+        response = self.client.get("/items/", params=params)
+        self.assertListEqual(ids[0:1], [i["id"] for i in response.json()])
+        self.assertNotIn("X-Next-Cursor", response.headers)
+        # Курсор сортировки по названию не передается в after_id
+        params = {"sort": "title", "after_id": ids[0]}
+        response = self.client.get("/items/", params=params)
+        self.assertEqual(422, response.status_code)
+        response = self.client.get(
+            "/items/", params={"sort": "title", "cursor": "x"}
+        )
+        self.assertEqual(422, response.status_code)
+        # Последний символ Unicode в начале названия
+        response = self.client.get("/items/?title_prefix=%F4%8F%BF%BF")
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual([], response.json())
+
+        response = self.client.get(
+            "/items/", params={"user_id": db_user.id, "min_id": ids[1]}
+        )
+        self.assertListEqual(ids[1:], [i["id"] for i in response.json()])
+
+        response = self.client.get("/items/", params={"sort": "user_id"})
+        self.assertEqual(422, response.status_code)
+
+        response = self.client.get("/items/search", params={"q": "pen"})
+        self.assertEqual(200, response.status_code)
+        self.assertCountEqual(ids, [i["id"] for i in response.json()])
+        response = self.client.get("/items/search", params={"q": "ink pen"})
+        self.assertListEqual(ids[0:1], [i["id"] for i in response.json()])
+
+        response = self.client.get("/items/search", params={"q": ""})
+        self.assertEqual(422, response.status_code)
+
+    def testGetItems_SortedCursor_RowChanged(self):
+        user = {"name": "John", "email": "test@mail.com", "address": ""}
+        user_id = self.client.post("/users/", json=user).json()["id"]
+        ids = [
+            self.client.post(
+                "/items/",
+                json={"title": title, "description": "", "user_id": user_id},
+            ).json()["id"]
+            for title in ["aa", "bb", "cc", "dd"]
+        ]
+
+        def titles(**params):
+            response = self.client.get(
+                "/items/", params={"sort": "title", "limit": 2, **params}
+            )
+            return (
+                [i["title"] for i in response.json()],
+                response.headers.get("X-Next-Cursor"),
+            )
+
+        page, cursor = titles()
+        self.assertListEqual(["aa", "bb"], page)
+        # Последний элемент страницы удален до запроса следующей
+        self.client.delete(f"/items/{ids[1]}")
+        self.assertListEqual(["cc", "dd"], titles(cursor=cursor)[0])
+
+        # Последний элемент страницы переименован до запроса следующей
+        page, cursor = titles()
+        self.assertListEqual(["aa", "cc"], page)
+        item = {"title": "zz", "description": "", "user_id": user_id}
+        self.client.put(f"/items/{ids[2]}", json=item)
+        self.assertListEqual(["dd", "zz"], titles(cursor=cursor)[0])
+
+    def testGetUsers_SortedCursor_RowChanged(self):
+        users, items = [], []
+        for count in range(1, 5):
+            user = {"name": "", "email": f"{count}@mail.com", "address": ""}
+            user_id = self.client.post("/users/", json=user).json()["id"]
+            users.append(user_id)
+            item = {"title": "Book", "description": "", "user_id": user_id}
+            items.append(
+                [
+                    self.client.post("/items/", json=item).json()["id"]
+                    for _ in range(count)
+                ]
+            )
+
+        def page(**params):
+            response = self.client.get(
+                "/users/",
+                params={"sort": "-items_count", "limit": 2, **params},
+            )
+            return (
+                [u["id"] for u in response.json()],
+                response.headers.get("X-Next-Cursor"),
+            )
+
+        # С проекцией ключ сортировки тоже попадает в курсор
+        ids, cursor = page(fields="id")
+        self.assertListEqual([users[3], users[2]], ids)
+        # У последнего пользователя страницы удалены элементы до запроса
+        # следующей
+        for item_id in items[2]:
+            self.client.delete(f"/items/{item_id}")
+        self.assertListEqual([users[1], users[0]], page(cursor=cursor)[0])
+
+        # Последний пользователь страницы удален до запроса следующей
+        ids, cursor = page()
+        self.assertListEqual([users[3], users[1]], ids)
+        self.client.delete(f"/users/{users[1]}")
+        self.assertListEqual([users[0], users[2]], page(cursor=cursor)[0])
+
+    def testGetUser_Projection(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        item_ids = [
+            self.client.post(
+                "/items/",
+                json={"title": t, "description": "", "user_id": user_id},
+            ).json()["id"]
+            for t in ["Book", "Pen", "Pencil"]
+        ]
+
+        # Без элементов читается одна строка и только выбранные столбцы
+        with capture_statements() as statements:
+            response = self.client.get(
+                f"/users/{user_id}",
+                params={"fields": "email", "include_items": "false"},
+            )
+        self.assertEqual(200, response.status_code)
+        self.assertDictEqual(
+            {"email": "test@mail.com", "id": user_id}, response.json()
+        )
+        self.assertEqual(1, len(statements))
+        self.assertNotIn("users.name", statements[0])
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            f"/users/{user_id}",
+            params={"fields": "email", "include_items": "false"},
+            headers={"If-None-Match": etag},
+        )
+        self.assertEqual(304, response.status_code)
+
+        response = self.client.get(
+            f"/users/{user_id}", params={"fields": "id,name"}
+        )
+        self.assertListEqual(["name", "id", "items"], list(response.json()))
+        self.assertListEqual(
+            item_ids, [i["id"] for i in response.json()["items"]]
+        )
+
+        # Количество элементов без самих элементов, входит в ETag
+        response = self.client.get(
+            f"/users/{user_id}",
+            params={"fields": "name,items_count", "include_items": "false"},
+        )
+        self.assertDictEqual(
+            {"name": "John", "id": user_id, "items_count": 3}, response.json()
+        )
+        self.assertNotEqual(etag, response.headers["ETag"])
+
+        response = self.client.get(
+            f"/users/{user_id}", params={"fields": "email,password"}
+        )
+        self.assertEqual(422, response.status_code)
+        response = self.client.get(
+            "/users/100", params={"include_items": "false"}
+        )
+        self.assertEqual(404, response.status_code)
+
+        with capture_statements() as statements:
+            response = self.client.get(
+                "/users/", params={"include_items": "false"}
+            )
+        self.assertEqual(1, len(statements))
+        self.assertListEqual(
+            [
+                {
+                    "name": "John",
+                    "email": "test@mail.com",
+                    "address": "",
+                    "id": user_id,
+                    "items_count": 3,
+                }
+            ],
+            response.json(),
+        )
+
+        # Элементы пользователя постранично
+        response = self.client.get(
+            f"/users/{user_id}/items", params={"limit": 2}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(item_ids[:2], [i["id"] for i in response.json()])
+        response = self.client.get(
+            f"/users/{user_id}/items",
+            params={"after_id": response.headers["X-Next-Cursor"]},
+        )
+        self.assertListEqual(item_ids[2:], [i["id"] for i in response.json()])
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+        response = self.client.get("/users/100/items")
+        self.assertEqual(404, response.status_code)
+
+    def testGetUsers_Pagination(self):
+        db = next(override_get_db())
+        db_users = db.scalars(
+            insert(models.User).returning(models.User),
+            [
+                {"name": "John", "email": "john@mail.com", "address": ""},
+                {"name": "Bob", "email": "bob@mail.com", "address": ""},
+                {"name": "Ann", "email": "ann@mail.com", "address": ""},
+            ],
+        ).all()
+        db.commit()
+
+        response = self.client.get("/users/", params={"limit": 2})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(response.json()))
+        cursor = response.headers["X-Next-Cursor"]
+        self.assertEqual(str(db_users[1].id), cursor)
+
+        response = self.client.get(
+            "/users/", params={"limit": 2, "after_id": cursor}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [db_users[2].email], [u["email"] for u in response.json()]
+        )
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def testGetUsersAndItems_FastSerialization(self):
+        """
+        Страницы, сериализованные без моделей pydantic, совпадают
+        с ответами response_model
+        """
+        db = next(override_get_db())
+        db_users = db.scalars(
+            insert(models.User).returning(models.User),
+            [
+                {"name": "Иван", "email": "ivan@mail.com", "address": None},
+                {"name": None, "email": "bob@mail.com", "address": ""},
+                {"name": "Ann", "email": "ann@mail.com", "address": ""},
+            ],
+        ).all()
+        # Элементы разных пользователей вперемешку
+        db.execute(
+            insert(models.Item),
+            [
+                {"title": f"Item {i}", "description": None, "user_id": u.id}
+                for i in range(3)
+                for u in db_users[:2]
+            ],
+        )
+        db.commit()
+
+        for path in ("/users/", "/items/"):
+            for params in ({}, {"limit": 2}, {"limit": 2, "after_id": 2}):
+                expected = self.client.get(path, params=params)
+                with mock.patch.object(
+                    config, "RESPONSE_SERIALIZER", "orjson"
+                ):
+                    response = self.client.get(path, params=params)
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(
+                    expected.headers["Content-Type"],
+                    response.headers["Content-Type"],
+                )
+                self.assertEqual(
+                    expected.headers.get("X-Next-Cursor"),
+                    response.headers.get("X-Next-Cursor"),
+                )
+                self.assertEqual(expected.content, response.content)
+
+    def testExportUsersAndItems(self):
+        db = next(override_get_db())
+        db_users = db.scalars(
+            insert(models.User).returning(models.User),
+            [
+                {"name": "John", "email": "john@mail.com", "address": ""},
+                {"name": "Bob", "email": "bob@mail.com", "address": ""},
+            ],
+        ).all()
+        db.execute(
+            insert(models.Item),
+            [
+                {"title": "Book", "description": "", "user_id": u.id}
+                for u in db_users
+            ],
+        )
+        db.commit()
+
+        response = self.client.get("/users/export")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            "application/x-ndjson", response.headers["content-type"]
+        )
+        # Каждая строка - отдельный пользователь в формате JSON
+        users = [json.loads(line) for line in response.text.splitlines()]
+        self.assertListEqual(
+            [u.email for u in db_users], [u["email"] for u in users]
+        )
+        self.assertTrue(all(len(u["items"]) == 1 for u in users))
+
+        response = self.client.get("/items/export")
+
+        self.assertEqual(200, response.status_code)
+        items = [json.loads(line) for line in response.text.splitlines()]
+        self.assertListEqual(
+            [u.id for u in db_users], [i["user_id"] for i in items]
+        )
+
+    def testBulkItems(self):
         db = next(override_get_db())
         db_user = models.User(
             name="John", email="test@mail.com", address="address"
         )
+        db.add(db_user)
+        db.commit()
+
+        # Создание: вторая строка ссылается на несуществующего пользователя
+        response = self.client.post(
+            "/items/bulk",
+            json=[
+                {"title": "Book", "description": "", "user_id": db_user.id},
+                {"title": "Pen", "description": "", "user_id": 100},
+                {"title": "Cup", "description": "", "user_id": db_user.id},
+            ],
+        )
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertListEqual([0, 1, 2], [r["index"] for r in data])
+        self.assertIsNone(data[0]["detail"])
+        self.assertEqual("User not found", data[1]["detail"])
+        self.assertIsNone(data[1]["id"])
+        book_id, cup_id = data[0]["id"], data[2]["id"]
+        self.assertEqual("Cup", db.get(models.Item, cup_id).title)
+
+        # Обновление: вторая строка ссылается на несуществующий элемент
+        response = self.client.put(
+            "/items/bulk",
+            json=[
+                {
+                    "id": book_id,
+                    "title": "Notebook",
+                    "description": "new",
+                    "user_id": db_user.id,
+                },
+                {
+                    "id": 100,
+                    "title": "Pen",
+                    "description": "",
+                    "user_id": db_user.id,
+                },
+            ],
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [None, "Item not found"], [r["detail"] for r in response.json()]
+        )
+        db.expire_all()
+        self.assertEqual("Notebook", db.get(models.Item, book_id).title)
+        self.assertEqual(2, db.get(models.Item, book_id).version)
 
+        # Повтор id в запросе применяет изменения по порядку
+        response = self.client.put(
+            "/items/bulk",
+            json=[
+                {
+                    "id": book_id,
+                    "title": title,
+                    "description": "",
+                    "user_id": db_user.id,
+                }
+                for title in ["Album", "Diary"]
+            ],
+        )
+        self.assertEqual(200, response.status_code)
+        db.expire_all()
+        db_item = db.get(models.Item, book_id)
+        self.assertEqual(("Diary", 4), (db_item.title, db_item.version))
+
+        # Удаление
+        response = self.client.request(
+            "DELETE", "/items/bulk", json=[book_id, 100]
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [None, "Item not found"], [r["detail"] for r in response.json()]
+        )
+        db.expunge_all()
+        self.assertIsNone(db.get(models.Item, book_id))
+        self.assertIsNotNone(db.get(models.Item, cup_id))
+
+    def testBulkItems_ConstantQueryCount(self):
+        db = next(override_get_db())
+        db_user = models.User(
+            name="John", email="test@mail.com", address="address"
+        )
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+
+        def count_queries(items_count: int) -> int:
+            with capture_statements() as statements:
+                response = self.client.post(
+                    "/items/bulk",
+                    json=[
+                        {
+                            "title": "Book",
+                            "description": "",
+                            "user_id": db_user.id,
+                        }
+                        for _ in range(items_count)
+                    ],
+                )
+            self.assertEqual(200, response.status_code)
+            return len(statements)
+
+        self.assertEqual(count_queries(5), count_queries(50))
+
+    def testBulkUsers(self):
+        db = next(override_get_db())
+        db_user = models.User(
+            name="John", email="test@mail.com", address="address"
+        )
+        db.add(db_user)
+        db.commit()
+
+        # Создание: email занят в БД и повторяется внутри запроса
+        response = self.client.post(
+            "/users/bulk",
+            json=[
+                {"name": "Bob", "email": "test@mail.com", "address": ""},
+                {"name": "Ann", "email": "ann@mail.com", "address": ""},
+                {"name": "Ann", "email": "ann@mail.com", "address": ""},
+            ],
+        )
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertListEqual(
+            ["Email already in use", None, "Email already in use"],
+            [r["detail"] for r in data],
+        )
+        ann_id = data[1]["id"]
+
+        # Обновление: занятый email и несуществующий пользователь
+        response = self.client.put(
+            "/users/bulk",
+            json=[
+                {
+                    "id": ann_id,
+                    "name": "Ann",
+                    "email": "test@mail.com",
+                    "address": "",
+                },
+                {
+                    "id": db_user.id,
+                    "name": "John Doe",
+                    "email": "test@mail.com",
+                    "address": "new",
+                },
+                {
+                    "id": 100,
+                    "name": "Nobody",
+                    "email": "nobody@mail.com",
+                    "address": "",
+                },
+            ],
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            ["Email already in use", None, "User not found"],
+            [r["detail"] for r in response.json()],
+        )
+        db.expire_all()
+        self.assertEqual("John Doe", db.get(models.User, db_user.id).name)
+
+        # Удаление
+        response = self.client.request(
+            "DELETE", "/users/bulk", json=[ann_id, 100]
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [None, "User not found"], [r["detail"] for r in response.json()]
+        )
+
+    def testGetUserAndItem_Cache(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        response = self.client.post(
+            "/items/",
+            json={"title": "Item", "description": "", "user_id": user_id},
+        )
+        item_id = response.json()["id"]
+
+        # Первое чтение заполняет кэш, повторное не обращается к БД
+        for path in [f"/users/{user_id}", f"/items/{item_id}"]:
+            first = self.client.get(path).json()
+            with capture_statements() as statements:
+                response = self.client.get(path)
+            self.assertEqual(200, response.status_code)
+            self.assertDictEqual(first, response.json())
+            self.assertListEqual([], statements)
+
+        stats = self.client.get("/cache/stats").json()
+        self.assertEqual((2, 2), (stats["hits"], stats["misses"]))
+
+        # Изменение элемента сбрасывает его и представление владельца
+        self.client.put(
+            f"/items/{item_id}",
+            json={"title": "New", "description": "", "user_id": user_id},
+        )
+        self.assertEqual(
+            "New", self.client.get(f"/items/{item_id}").json()["title"]
+        )
+        self.assertEqual(
+            "New",
+            self.client.get(f"/users/{user_id}").json()["items"][0]["title"],
+        )
+
+        # Как и массовые операции
+        self.client.request("DELETE", "/items/bulk", json=[item_id])
+        self.assertEqual(404, self.client.get(f"/items/{item_id}").status_code)
+        self.assertListEqual(
+            [], self.client.get(f"/users/{user_id}").json()["items"]
+        )
+
+        self.client.delete(f"/users/{user_id}")
+        self.assertEqual(404, self.client.get(f"/users/{user_id}").status_code)
+
+    def testChanges(self):
+        db = next(override_get_db())
+        # Журнал не очищается между тестами
+        since = db.scalar(
+            select(func.coalesce(func.max(models.Change.seq), 0))
+        )
         db.close()
+        user = {"name": "John", "email": "test@mail.com", "address": ""}
+        user_id = self.client.post("/users/", json=user).json()["id"]
+        book = {"title": "Book", "description": "", "user_id": user_id}
+        book_id = self.client.post("/items/", json=book).json()["id"]
+        self.client.put(f"/items/{book_id}", json=book | {"title": "Diary"})
+        pen = {"title": "Pen", "description": "", "user_id": user_id}
+        pen_id = self.client.post("/items/", json=pen).json()["id"]
+        self.client.delete(f"/items/{pen_id}")
+
+        with capture_statements() as statements:
+            response = self.client.get("/changes", params={"since": since})
+        self.assertEqual(200, response.status_code)
+        # Журнал, пользователи и элементы - по запросу
+        self.assertEqual(3, len(statements))
+        changes = response.json()
+        # Запись, измененная несколько раз, возвращается один раз
+        self.assertListEqual(
+            [("user", user_id, False), ("item", book_id, False)]
+            + [("item", pen_id, True)],
+            [(c["entity"], c["id"], c["deleted"]) for c in changes],
+        )
+        seqs = [c["seq"] for c in changes]
+        self.assertListEqual(sorted(seqs), seqs)
+        self.assertEqual("John", changes[0]["user"]["name"])
+        self.assertEqual("Diary", changes[1]["item"]["title"])
+        self.assertIsNone(changes[2]["item"])
+
+        # Постраничная выборка
+        response = self.client.get(
+            "/changes", params={"since": since, "limit": 2}
+        )
+        self.assertEqual(2, len(response.json()))
+        self.assertEqual(str(seqs[1]), response.headers["X-Next-Cursor"])
 
-        response = self.client.delete(f"/users/{db_user.id}")
+        # Удаление пользователя сразу отмечает удаленными его элементы
+        self.client.delete(f"/users/{user_id}")
+        response = self.client.get("/changes", params={"since": seqs[-1]})
+        self.assertCountEqual(
+            [("user", user_id, True), ("item", book_id, True)],
+            [(c["entity"], c["id"], c["deleted"]) for c in response.json()],
+        )
+        response = self.client.get("/changes", params={"since": since})
+        self.assertTrue(
+            all(c["deleted"] for c in response.json()), response.json()
+        )
+
+    def testBatchUsersAndItems(self):
+        db = next(override_get_db())
+        db.execute(
+            insert(models.User),
+            [
+                {"name": f"User {i}", "email": f"u{i}@mail.com", "address": ""}
+                for i in range(5)
+            ],
+        )
+        db.commit()
+        user_ids = list(db.scalars(select(models.User.id)))
+        db.execute(
+            insert(models.Item),
+            [
+                {"title": "Item", "description": "", "user_id": user_ids[0]}
+                for _ in range(3)
+            ],
+        )
+        db.commit()
+        item_ids = list(db.scalars(select(models.Item.id)))
+
+        # id читаются пачками по SQL_IN_CHUNK_SIZE, повторные id
+        # не учитываются
+        ids = [user_ids[2], 0, user_ids[0], user_ids[2]]
+        with mock.patch.object(config, "SQL_IN_CHUNK_SIZE", 2):
+            with capture_statements() as statements:
+                response = self.client.get(
+                    "/users/batch", params={"ids": ",".join(map(str, ids))}
+                )
+        self.assertEqual(200, response.status_code)
+        # Две пачки: пользователи и их элементы в каждой
+        self.assertEqual(4, len(statements))
+        body = response.json()
+        self.assertListEqual(
+            [user_ids[2], user_ids[0]], [u["id"] for u in body["users"]]
+        )
+        self.assertEqual(3, len(body["users"][1]["items"]))
+        self.assertListEqual([0], body["missing"])
+
+        # Прочитанные записи берутся из кэша
+        ids = [*item_ids, -1]
+        response = self.client.post("/items/batch", json=item_ids[:1])
+        self.assertEqual(200, response.status_code)
+        with capture_statements() as statements:
+            response = self.client.post("/items/batch", json=ids)
+        self.assertEqual(200, response.status_code)
+        # Из БД читаются только id, которых нет в кэше
+        self.assertEqual(1, len(statements))
+        self.assertIn("IN (?, ?, ?)", statements[0])
+        body = response.json()
+        self.assertListEqual(item_ids, [i["id"] for i in body["items"]])
+        self.assertListEqual([-1], body["missing"])
+        # Отсутствующие id не кэшируются, поэтому запрашиваются без них
+        with capture_statements() as statements:
+            response = self.client.get(
+                "/items/batch", params={"ids": ",".join(map(str, item_ids))}
+            )
+        self.assertListEqual([], statements)
+        self.assertListEqual(
+            item_ids, [i["id"] for i in response.json()["items"]]
+        )
+
+        # Неверные и слишком длинные списки id
+        for params in [{"ids": "1,a"}, {"ids": ","}, {}]:
+            response = self.client.get("/items/batch", params=params)
+            self.assertEqual(422, response.status_code)
+        with mock.patch.object(config, "BATCH_MAX_IDS", 2):
+            response = self.client.get("/users/batch", params={"ids": "1,2,3"})
+            self.assertEqual(422, response.status_code)
+        response = self.client.post("/users/batch", json=[])
+        self.assertEqual(422, response.status_code)
+
+    def testGetUserAndItem_ETag(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        response = self.client.post(
+            "/items/",
+            json={"title": "Item", "description": "", "user_id": user_id},
+        )
+        item_id = response.json()["id"]
+
+        etags = {}
+        for path in [f"/users/{user_id}", f"/items/{item_id}"]:
+            etags[path] = self.client.get(path).headers["ETag"]
+            # Версия не изменилась - ответ без тела
+            response = self.client.get(
+                path, headers={"If-None-Match": f"W/{etags[path]}"}
+            )
+            self.assertEqual(304, response.status_code)
+            self.assertEqual(etags[path], response.headers["ETag"])
+            self.assertEqual(b"", response.content)
+
+        # Изменение элемента меняет ETag элемента и его владельца
+        response = self.client.put(
+            f"/items/{item_id}",
+            json={"title": "New", "description": "", "user_id": user_id},
+            headers={"If-Match": etags[f"/items/{item_id}"]},
+        )
+        self.assertEqual(200, response.status_code)
+        item_etag = response.headers["ETag"]
+        for path in [f"/users/{user_id}", f"/items/{item_id}"]:
+            response = self.client.get(
+                path, headers={"If-None-Match": etags[path]}
+            )
+            self.assertEqual(200, response.status_code)
+            self.assertNotEqual(etags[path], response.headers["ETag"])
+        self.assertEqual(
+            item_etag, self.client.get(f"/items/{item_id}").headers["ETag"]
+        )
+
+        # Изменение устаревшей версии отклоняется
+        response = self.client.put(
+            f"/items/{item_id}",
+            json={"title": "Old", "description": "", "user_id": user_id},
+            headers={"If-Match": etags[f"/items/{item_id}"]},
+        )
+        self.assertEqual(412, response.status_code)
+        self.assertEqual(
+            "New", self.client.get(f"/items/{item_id}").json()["title"]
+        )
+
+        # If-Match пользователя проверяет только версию его строки
+        for status_code in [200, 412]:
+            response = self.client.put(
+                f"/users/{user_id}",
+                json={"name": "Bob", "email": "test@mail.com", "address": ""},
+                headers={"If-Match": etags[f"/users/{user_id}"]},
+            )
+            self.assertEqual(status_code, response.status_code)
+
+    def testWrites_StatementCount(self):
+        def count_statements(method: str, path: str, body: dict) -> int:
+            with capture_statements() as statements:
+                response = self.client.request(method, path, json=body)
+            self.assertLess(response.status_code, 300)
+            return len(statements)
+
+        user = {"name": "John", "email": "test@mail.com", "address": ""}
+        # INSERT ... RETURNING, email проверяется ограничением уникальности
+        self.assertEqual(1, count_statements("POST", "/users/", user))
+        user_id = self.client.get("/users/").json()[0]["id"]
+        other_id = self.client.post(
+            "/users/", json=user | {"email": "other@mail.com"}
+        ).json()["id"]
+
+        item = {"title": "Book", "description": "", "user_id": user_id}
+        # INSERT ... SELECT ... RETURNING с проверкой владельца
+        self.assertEqual(1, count_statements("POST", "/items/", item))
+        item_id = self.client.get("/items/").json()[0]["id"]
+        # Условный UPDATE ... RETURNING
+        self.assertEqual(1, count_statements("PUT", f"/items/{item_id}", item))
+        # Смена владельца: текущий владелец читается для сброса кэша
+        self.assertEqual(
+            3,
+            count_statements(
+                "PUT", f"/items/{item_id}", item | {"user_id": other_id}
+            ),
+        )
+        # UPDATE ... RETURNING и загрузка элементов для ответа
+        self.assertEqual(2, count_statements("PUT", f"/users/{user_id}", user))
+
+        # Ошибки определяются после неудавшегося запроса
+        response = self.client.put("/items/100", json=item)
+        self.assertEqual(
+            (404, "Item not found"),
+            (response.status_code, response.json()["detail"]),
+        )
+        for method, path in [
+            ("POST", "/items/"),
+            ("PUT", f"/items/{item_id}"),
+        ]:
+            response = self.client.request(
+                method, path, json=item | {"user_id": 100}
+            )
+            self.assertEqual(
+                (404, "User not found"),
+                (response.status_code, response.json()["detail"]),
+            )
+        response = self.client.put(
+            f"/users/{user_id}", json=user | {"email": "other@mail.com"}
+        )
+        self.assertEqual(
+            (400, "Email already in use"),
+            (response.status_code, response.json()["detail"]),
+        )
+        response = self.client.put("/users/100", json=user)
+        self.assertEqual(404, response.status_code)
+
+    def testMetrics(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+
+        # Пользователь и его элементы читаются двумя запросами
+        response = self.client.get(f"/users/{user_id}")
+        timing = response.headers["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="2 queries", ')
+        self.assertRegex(timing, r"app;dur=[\d.]+$")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        self.assertIn(
+            'http_requests_total{method="GET",route="/users/{id}",'
+            'status="200"}',
+            response.text,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{method="POST",'
+            'route="/users/",le="+Inf"}',
+            response.text,
+        )
+
+    def testDeleteUser(self):
+        db = next(override_get_db())
+        db_user = models.User(
+            name="John", email="test@mail.com", address="address"
+        )
+
+        db.add(db_user)
+        db.flush()
+        db_item = models.Item(title="Book", description="", user_id=db_user.id)
+        db.add(db_item)
+        db.commit()
+        user_id, item_id = db_user.id, db_item.id
+        db.close()
+        # Элемент попадает в кэш до удаления пользователя
+        self.assertEqual(200, self.client.get(f"/items/{item_id}").status_code)
+
+        response = self.client.delete(f"/users/{user_id}")
 
         self.assertEqual(204, response.status_code)
 
-        user = db.get(models.User, db_user.id)
+        user = db.get(models.User, user_id)
 
         self.assertIsNone(user)
+        # Удаление распространяется на элементы пользователя
+        self.assertEqual(404, self.client.get(f"/users/{user_id}").status_code)
+        self.assertEqual(404, self.client.get(f"/items/{item_id}").status_code)
+        response = self.client.get("/items/batch", params={"ids": item_id})
+        self.assertListEqual([item_id], response.json()["missing"])
+        self.assertListEqual([], self.client.get("/items/").json())
+        self.assertEqual(
+            404, self.client.delete(f"/users/{user_id}").status_code
+        )
@@ -0,0 +1,428 @@
+import asyncio
+import json
+import os
+import unittest
+from unittest import mock
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src import cache, config, models
+from src.database import (
+    get_async_db,
+    get_async_read_db,
+    get_db,
+    get_read_db,
+)
+from src.internal.crud.aio import user as async_usercrud
+from src.internal.routes import change, item, user
+from src.internal.routes.aio import change as async_change
+from src.internal.routes.aio import item as async_item
+from src.internal.routes.aio import user as async_user
+from src.internal.routes.aio import with_fallback
+
+DB_URL = "sqlite:///test_async.db"
+ASYNC_DB_URL = "sqlite+aiosqlite:///test_async.db"
+
+engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autoflush=False, bind=engine)
+
+async_engine = create_async_engine(ASYNC_DB_URL)
+TestingAsyncSessionLocal = async_sessionmaker(
+    autoflush=False, bind=async_engine
+)
+
+
+def override_get_db():
+    """
+    Заменяет зависимость БД на тестовую БД
+    """
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+async def override_get_async_db():
+    """
+    Заменяет асинхронную зависимость БД на тестовую БД
+    """
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+# Приложение в асинхронном режиме, как в src/main.py
+app = FastAPI()
+app.include_router(with_fallback(async_user.router, user.router))
+app.include_router(with_fallback(async_item.router, item.router))
+app.include_router(with_fallback(async_change.router, change.router))
+
+
+class TestRoutesAsync(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        models.Base.metadata.create_all(bind=engine)
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        app.dependency_overrides[get_async_read_db] = override_get_async_db
+
+        cls.client = TestClient(app)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+        os.remove("./test_async.db")
+
+    def tearDown(self) -> None:
+        db = next(override_get_db())
+        db.execute(delete(models.User))
+        db.execute(delete(models.Item))
+        db.commit()
+        # Записи удалены в обход crud, поэтому кэш сбрасывается целиком
+        cache.backend.clear()
+
+    def testRoutesAreAsync(self):
+        endpoints = [
+            route.endpoint
+            for route in app.routes
+            if route.path.startswith(("/users", "/items", "/changes"))
+        ]
+
+        self.assertTrue(all(asyncio.iscoroutinefunction(e) for e in endpoints))
+
+    def testWithFallback(self):
+        sync_router = APIRouter(prefix="/things")
+        sync_router.get("/export")(lambda: "sync export")
+        sync_router.get("/{id}")(lambda id: "sync get")
+        async_router = APIRouter(prefix="/things")
+
+        @async_router.get("/{id}")
+        async def get_thing(id: int):
+            return "async get"
+
+        router = with_fallback(async_router, sync_router)
+
+        # Порядок маршрутов сохраняется, отсутствующие берутся из fallback
+        self.assertListEqual(
+            ["/things/export", "/things/{id}"], [r.path for r in router.routes]
+        )
+        self.assertIs(get_thing, router.routes[1].endpoint)
+
+    def testUserAndItemLifecycle(self):
+        # Создаем пользователя
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        self.assertEqual(201, response.status_code)
+        user_id = response.json()["id"]
+        self.assertListEqual([], response.json()["items"])
+
+        # Повторный email
+        response = self.client.post(
+            "/users/",
+            json={"name": "Bob", "email": "test@mail.com", "address": ""},
+        )
+        self.assertEqual(400, response.status_code)
+
+        # Создаем элемент
+        response = self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+        self.assertEqual(201, response.status_code)
+        item_id = response.json()["id"]
+
+        # Элемент несуществующего пользователя
+        response = self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": 100},
+        )
+        self.assertEqual(404, response.status_code)
+
+        # Пользователь загружается вместе с элементами
+        response = self.client.get(f"/users/{user_id}")
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [item_id], [i["id"] for i in response.json()["items"]]
+        )
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            f"/users/{user_id}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(304, response.status_code)
+
+        # Обновляем пользователя и элемент
+        response = self.client.put(
+            f"/users/{user_id}",
+            json={"name": "John Doe", "email": "john@mail.com", "address": ""},
+            headers={"If-Match": etag},
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers["ETag"])
+        self.assertEqual("John Doe", response.json()["name"])
+        self.assertEqual(1, len(response.json()["items"]))
+
+        response = self.client.put(
+            f"/items/{item_id}",
+            json={"title": "Pen", "description": "", "user_id": user_id},
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("Pen", response.json()["title"])
+
+        # Списки и выгрузка
+        response = self.client.get("/users/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.json()))
+
+        response = self.client.get("/items/export")
+        self.assertEqual(200, response.status_code)
+        items = [json.loads(line) for line in response.text.splitlines()]
+        self.assertListEqual(["Pen"], [i["title"] for i in items])
+
+        # Удаляем
+        response = self.client.delete(f"/items/{item_id}")
+        self.assertEqual(204, response.status_code)
+        response = self.client.delete(f"/users/{user_id}")
+        self.assertEqual(204, response.status_code)
+        response = self.client.get(f"/users/{user_id}")
+        self.assertEqual(404, response.status_code)
+
+    def testDeleteUserItems(self):
+        """
+        Элементы удаленного пользователя сбрасываются из кэша
+        """
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        response = self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+        item_id = response.json()["id"]
+        self.assertEqual(200, self.client.get(f"/items/{item_id}").status_code)
+
+        response = self.client.delete(f"/users/{user_id}")
+
+        self.assertEqual(204, response.status_code)
+        self.assertEqual(404, self.client.get(f"/items/{item_id}").status_code)
+        response = self.client.get("/items/batch", params={"ids": item_id})
+        self.assertListEqual([item_id], response.json()["missing"])
+
+    def testReadYourWrites_BypassesCache(self):
+        """
+        Запрос с заголовком X-Read-Your-Writes читает мимо кэша
+        """
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        self.client.get(f"/users/{user_id}")
+        with TestingSessionLocal() as db:
+            db.get(models.User, user_id).name = "Bob"
+            db.commit()
+
+        response = self.client.get(
+            f"/users/{user_id}", headers={"X-Read-Your-Writes": "1"}
+        )
+
+        self.assertEqual("Bob", response.json()["name"])
+        response = self.client.get(f"/users/{user_id}")
+        self.assertEqual("John", response.json()["name"])
+
+    def testBulkItems(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+
+        response = self.client.post(
+            "/items/bulk",
+            json=[
+                {"title": "Book", "description": "", "user_id": user_id},
+                {"title": "Pen", "description": "", "user_id": 100},
+            ],
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [None, "User not found"], [r["detail"] for r in response.json()]
+        )
+
+    def testBatch(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        response = self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+        item_id = response.json()["id"]
+
+        response = self.client.get(
+            "/users/batch", params={"ids": f"{user_id},100"}
+        )
+        self.assertEqual(200, response.status_code)
+        body = response.json()
+        self.assertListEqual([user_id], [u["id"] for u in body["users"]])
+        self.assertEqual(item_id, body["users"][0]["items"][0]["id"])
+        self.assertListEqual([100], body["missing"])
+        response = self.client.post("/items/batch", json=[100, item_id])
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            [item_id], [i["id"] for i in response.json()["items"]]
+        )
+
+    def testBatchLoader(self):
+        db = next(override_get_db())
+        db_users = [
+            models.User(name="John", email=f"{i}@mail.com", address="")
+            for i in range(3)
+        ]
+        db.add_all(db_users)
+        db.commit()
+        ids = [u.id for u in db_users]
+
+        async def load():
+            async with TestingAsyncSessionLocal() as session:
+                loader = async_usercrud.user_loader(session)
+                with mock.patch.object(
+                    async_usercrud,
+                    "get_users_cached",
+                    wraps=async_usercrud.get_users_cached,
+                ) as get_users_cached:
+                    # Одновременные одиночные запросы объединяются в один
+                    users = await asyncio.gather(
+                        loader.load(ids[0]),
+                        loader.load(100),
+                        loader.load_many(ids[1:]),
+                    )
+                    # Повторный запрос берется из загрузчика
+                    again = await loader.load(ids[0])
+                return users, again, get_users_cached.call_args_list
+
+        (first, missing, rest), again, calls = asyncio.run(load())
+        self.assertEqual(ids[0], first["id"])
+        self.assertIsNone(missing)
+        self.assertListEqual(ids[1:], [u["id"] for u in rest])
+        self.assertIs(first, again)
+        self.assertEqual(1, len(calls))
+        self.assertListEqual([ids[0], 100, *ids[1:]], calls[0].kwargs["ids"])
+
+    def testFastSerialization(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+
+        for path in ("/users/", "/items/"):
+            expected = self.client.get(path)
+            with mock.patch.object(config, "RESPONSE_SERIALIZER", "orjson"):
+                response = self.client.get(path)
+
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(expected.content, response.content)
+
+    def testProjection(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        response = self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+        item_id = response.json()["id"]
+
+        response = self.client.get(
+            f"/users/{user_id}",
+            params={"fields": "name", "include_items": "false"},
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertDictEqual({"name": "John", "id": user_id}, response.json())
+
+        response = self.client.get(
+            "/users/", params={"fields": "email", "include_items": "false"}
+        )
+        self.assertListEqual(
+            [{"email": "test@mail.com", "id": user_id}], response.json()
+        )
+
+        response = self.client.get(f"/users/{user_id}/items")
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual([item_id], [i["id"] for i in response.json()])
+        response = self.client.get("/users/100/items")
+        self.assertEqual(404, response.status_code)
+
+    def testStats(self):
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+
+        response = self.client.get("/users/stats")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json()["users_with_items"])
+        response = self.client.get("/items/stats")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.json()["items"])
+        response = self.client.get(
+            f"/users/{user_id}",
+            params={"fields": "items_count", "include_items": "false"},
+        )
+        self.assertEqual(1, response.json()["items_count"])
+
+    def testChanges(self):
+        db = next(override_get_db())
+        # Журнал не очищается между тестами
+        since = db.scalar(
+            select(func.coalesce(func.max(models.Change.seq), 0))
+        )
+        db.close()
+        response = self.client.post(
+            "/users/",
+            json={"name": "John", "email": "test@mail.com", "address": ""},
+        )
+        user_id = response.json()["id"]
+        self.client.post(
+            "/items/",
+            json={"title": "Book", "description": "", "user_id": user_id},
+        )
+
+        response = self.client.get(
+            "/changes", params={"since": since, "limit": 1}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(
+            ["John"], [c["user"]["name"] for c in response.json()]
+        )
+        response = self.client.get(
+            "/changes", params={"since": response.headers["X-Next-Cursor"]}
+        )
+        self.assertListEqual(
+            ["Book"], [c["item"]["title"] for c in response.json()]
+        )
@@ -0,0 +1,120 @@
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, delete, event, select
+from sqlalchemy.orm import sessionmaker
+
+from src import models, schemas
+from src.writer import ItemWriter
+
+DB_URL = "sqlite:///test_writer.db"
+
+
+class TestItemWriter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine(
+            DB_URL, connect_args={"check_same_thread": False}
+        )
+        models.Base.metadata.create_all(bind=cls.engine)
+        cls.Session = sessionmaker(autoflush=False, bind=cls.engine)
+        with cls.Session() as db:
+            db_user = models.User(
+                name="John", email="test@mail.com", address=""
+            )
+            db.add(db_user)
+            db.commit()
+            cls.user_id = db_user.id
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+        os.remove("./test_writer.db")
+
+    def tearDown(self):
+        with self.Session() as db:
+            db.execute(delete(models.Item))
+            db.commit()
+
+    def test_group_commit(self):
+        """
+        Тест вставки одновременных строк небольшим числом транзакций
+        """
+        commits = []
+
+        def on_commit(conn):
+            commits.append(conn)
+
+        event.listen(self.engine, "commit", on_commit)
+        self.addCleanup(event.remove, self.engine, "commit", on_commit)
+        writer = ItemWriter(self.Session, max_rows=100, max_delay=0.05)
+        self.addCleanup(writer.close)
+
+        def create(i: int) -> int | None:
+            item = schemas.ItemCreate(
+                title=f"Item {i}", description="", user_id=self.user_id
+            )
+            return writer.submit(item).result(timeout=10)
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            ids = list(pool.map(create, range(100)))
+
+        self.assertEqual(100, len(set(ids)))
+        self.assertLess(len(commits), 20)
+        with self.Session() as db:
+            titles = dict(
+                db.execute(select(models.Item.id, models.Item.title)).all()
+            )
+        self.assertListEqual(
+            [f"Item {i}" for i in range(100)], [titles[id] for id in ids]
+        )
+
+    def test_user_not_found(self):
+        writer = ItemWriter(self.Session, max_delay=0)
+        self.addCleanup(writer.close)
+
+        future = writer.submit(
+            schemas.ItemCreate(title="Book", description="", user_id=100)
+        )
+
+        self.assertIsNone(future.result(timeout=10))
+
+    def test_close(self):
+        """
+        Тест записи строк из очереди при остановке, не дожидаясь задержки
+        """
+        writer = ItemWriter(self.Session, max_delay=60)
+        futures = [
+            writer.submit(
+                schemas.ItemCreate(
+                    title="Book", description="", user_id=self.user_id
+                )
+            )
+            for _ in range(3)
+        ]
+
+        writer.close()
+
+        self.assertTrue(all(f.done() for f in futures))
+        self.assertEqual(3, len({f.result() for f in futures}))
+
+    def test_error(self):
+        """
+        Тест передачи ошибки записи во все строки группы
+        """
+
+        def broken_session():
+            raise RuntimeError("DB is unavailable")
+
+        writer = ItemWriter(broken_session, max_delay=0)
+        self.addCleanup(writer.close)
+
+        future = writer.submit(
+            schemas.ItemCreate(
+                title="Book", description="", user_id=self.user_id
+            )
+        )
+
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=10)
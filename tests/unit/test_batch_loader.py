@@ -0,0 +1,47 @@
+import asyncio
+import unittest
+
+from src.internal.crud.aio import BatchLoader
+
+
+class TestBatchLoader(unittest.TestCase):
+    def test_load(self):
+        calls = []
+
+        async def batch_load(ids):
+            calls.append(ids)
+            return {id: f"record {id}" for id in ids if id > 0}
+
+        async def main():
+            loader = BatchLoader(batch_load)
+            first = await asyncio.gather(
+                loader.load(1), loader.load(2), loader.load(-1), loader.load(1)
+            )
+            # Запомненные id не запрашиваются повторно
+            second = await loader.load_many([2, 3])
+            return first, second
+
+        first, second = asyncio.run(main())
+
+        self.assertListEqual(["record 1", "record 2", None, "record 1"], first)
+        self.assertListEqual(["record 2", "record 3"], second)
+        self.assertListEqual([[1, 2, -1], [3]], calls)
+
+    def test_load_error(self):
+        calls = []
+
+        async def batch_load(ids):
+            calls.append(ids)
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            return {id: id for id in ids}
+
+        async def main():
+            loader = BatchLoader(batch_load)
+            with self.assertRaises(RuntimeError):
+                await loader.load_many([1, 2])
+            # После ошибки запрос повторяется
+            return await loader.load(1)
+
+        self.assertEqual(1, asyncio.run(main()))
+        self.assertListEqual([[1, 2], [1]], calls)
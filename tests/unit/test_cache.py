@@ -0,0 +1,213 @@
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from src import cache
+from src.internal.crud import get_cached_by_ids
+from src.internal.crud import user as usercrud
+
+
+class FakeRedis:
+    """
+    Хранилище с интерфейсом Redis в памяти (без учета времени жизни).
+    Команды конвейера и транзакции выполняются сразу.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None):
+        self.data[name] = value.encode()
+
+    def delete(self, *names):
+        for name in names:
+            self.data.pop(name, None)
+
+    def incr(self, name):
+        self.data[name] = str(int(self.data.get(name, 0)) + 1).encode()
+
+    def expire(self, name, time):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def multi(self):
+        pass
+
+    def execute(self):
+        pass
+
+    def transaction(self, func, *watches):
+        func(self)
+
+
+class TestCache(unittest.TestCase):
+    def testLRUCache(self):
+        backend = cache.LRUCache(maxsize=2, ttl=60)
+
+        backend.set("a", {"id": 1})
+        backend.set("b", {"id": 2})
+        # Чтение делает "a" недавно использованной, вытесняется "b"
+        self.assertDictEqual({"id": 1}, backend.get("a"))
+        backend.set("c", {"id": 3})
+
+        self.assertIsNone(backend.get("b"))
+        self.assertDictEqual({"id": 3}, backend.get("c"))
+
+        backend.delete("a", "x")
+        self.assertIsNone(backend.get("a"))
+
+        self.assertDictEqual(
+            {
+                "hits": 2,
+                "misses": 2,
+                "evictions": 1,
+                "expirations": 0,
+                "size": 1,
+            },
+            backend.stats(),
+        )
+
+        backend.clear()
+        self.assertEqual(0, backend.size())
+        self.assertEqual(0, backend.hits)
+
+    def testLRUCache_Expired(self):
+        backend = cache.LRUCache(maxsize=2, ttl=0)
+
+        backend.set("a", {"id": 1})
+
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(1, backend.expirations)
+        self.assertEqual(0, backend.size())
+
+    def testRedisCache(self):
+        client = FakeRedis()
+        backend = cache.RedisCache(client, ttl=60)
+
+        backend.set(cache.user_key(1), {"id": 1, "items": []})
+
+        self.assertIn(b'"items"', client.data["cache:user:1"])
+        self.assertDictEqual(
+            {"id": 1, "items": []}, backend.get(cache.user_key(1))
+        )
+
+        backend.delete(cache.user_key(1))
+
+        self.assertIsNone(backend.get(cache.user_key(1)))
+        self.assertEqual((1, 1), (backend.hits, backend.misses))
+
+    def testCacheBackend_Abstract(self):
+        class PartialCache(cache.CacheBackend):
+            def get(self, key):
+                return None
+
+        # Хранилище без всех методов нельзя создать
+        with self.assertRaises(TypeError):
+            cache.CacheBackend()
+        with self.assertRaises(TypeError):
+            PartialCache()
+
+    def testLRUCache_Generation(self):
+        backend = cache.LRUCache(maxsize=2, ttl=60)
+
+        # Ключ сброшен после того, как взято поколение: заполнение
+        # отменяется
+        generation = backend.generation("a")
+        backend.delete("a")
+        backend.set("a", {"id": 1}, generation)
+        self.assertIsNone(backend.get("a"))
+
+        backend.set("a", {"id": 1}, backend.generation("a"))
+        self.assertDictEqual({"id": 1}, backend.get("a"))
+
+        # Вытесненные поколения не теряют сброс
+        generation = backend.generation("b")
+        backend.delete("b", "c", "d")
+        self.assertNotEqual(generation, backend.generation("b"))
+        backend.set("b", {"id": 2}, generation)
+        self.assertIsNone(backend.get("b"))
+
+        # Очистка меняет поколения всех ключей
+        generation = backend.generation("e")
+        backend.clear()
+        backend.set("e", {"id": 5}, generation)
+        self.assertIsNone(backend.get("e"))
+
+    def testRedisCache_Generation(self):
+        client = FakeRedis()
+        backend = cache.RedisCache(client, ttl=60)
+        key = cache.user_key(1)
+
+        generation = backend.generation(key)
+        backend.delete(key)
+        backend.set(key, {"id": 1}, generation)
+        self.assertIsNone(backend.get(key))
+
+        backend.set(key, {"id": 1}, backend.generation(key))
+        self.assertDictEqual({"id": 1}, backend.get(key))
+        self.assertEqual(b"1", client.data["cache:generation:user:1"])
+
+    def testGetCachedByIds_InvalidatedDuringLoad(self):
+        backend = cache.LRUCache(maxsize=10, ttl=60)
+        patcher = mock.patch.object(cache, "backend", backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def load(ids):
+            # Запись 1 изменена, пока читаются записи
+            cache.invalidate(user_ids=[1])
+            return {id: {"id": id} for id in ids}
+
+        found = get_cached_by_ids([1, 2], cache.user_key, load)
+
+        self.assertDictEqual({1: {"id": 1}, 2: {"id": 2}}, found)
+        self.assertIsNone(backend.get(cache.user_key(1)))
+        self.assertDictEqual({"id": 2}, backend.get(cache.user_key(2)))
+
+    def testGetUserCached_InvalidatedDuringRead(self):
+        backend = cache.LRUCache(maxsize=10, ttl=60)
+        patcher = mock.patch.object(cache, "backend", backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        read, updated = threading.Event(), threading.Event()
+
+        def get_user_by_id(id, db):
+            # Читатель прочитал старую строку и ждет, пока писатель
+            # изменит ее и сбросит кэш
+            db_user = SimpleNamespace(
+                id=id,
+                name="old",
+                email="a@mail.com",
+                address="",
+                items_count=0,
+                items=[],
+                version=1,
+            )
+            read.set()
+            updated.wait(5)
+            return db_user
+
+        patcher = mock.patch.object(usercrud, "get_user_by_id", get_user_by_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        result = {}
+        reader = threading.Thread(
+            target=lambda: result.update(
+                usercrud.get_user_cached(id=1, db=None)
+            )
+        )
+        reader.start()
+        self.assertTrue(read.wait(5))
+        cache.invalidate(user_ids=[1])
+        updated.set()
+        reader.join(5)
+
+        self.assertEqual("old", result["name"])
+        # Устаревшая строка не попала в кэш
+        self.assertIsNone(backend.get(cache.user_key(1)))
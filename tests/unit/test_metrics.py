@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from src import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def testRegistry(self):
+        registry = metrics.Registry(buckets=(0.1, 1))
+
+        stats = metrics.RequestStats(queries=2, db_time=0.05)
+        registry.observe("GET", "/users/{id}", 200, 0.5, stats)
+        registry.observe("GET", "/users/{id}", 404, 0.05, stats)
+
+        lines = registry.render().splitlines()
+        labels = 'method="GET",route="/users/{id}"'
+        for line in [
+            f'http_requests_total{{{labels},status="200"}} 1',
+            f'http_requests_total{{{labels},status="404"}} 1',
+            # Корзины гистограммы накопительные
+            f'http_request_duration_seconds_bucket{{{labels},le="0.1"}} 1',
+            f'http_request_duration_seconds_bucket{{{labels},le="1"}} 2',
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f"http_request_duration_seconds_count{{{labels}}} 2",
+            f"db_queries_total{{{labels}}} 4",
+            f"db_query_seconds_total{{{labels}}} 0.1",
+        ]:
+            self.assertIn(line, lines)
+
+        registry.clear()
+        self.assertNotIn("/users/{id}", registry.render())
+
+    def testRequestStats(self):
+        engine = create_engine("sqlite:///:memory:")
+        metrics.instrument_engine(engine)
+        stats = metrics.RequestStats()
+
+        token = metrics.current_stats.set(stats)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+        finally:
+            metrics.current_stats.reset(token)
+
+        self.assertEqual(2, stats.queries)
+        self.assertGreater(stats.db_time, 0)
+
+    def testFailedQuery(self):
+        engine = create_engine("sqlite:///:memory:")
+        metrics.instrument_engine(engine)
+
+        with engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing"))
+            conn.execute(text("SELECT 1"))
+
+            # Время начала неудачных запросов не остается на стеке
+            self.assertListEqual([], conn.info["query_start_time"])
+
+    def testSlowQueryLog(self):
+        engine = create_engine("sqlite:///:memory:")
+        metrics.instrument_engine(engine)
+
+        with mock.patch("src.config.SLOW_QUERY_MS", 0):
+            with self.assertLogs("src.metrics", "WARNING") as logs:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT :value"), {"value": 42})
+
+        self.assertIn("SELECT ?", logs.output[0])
+        self.assertIn("42", logs.output[0])
+
+    def testSlowQueryLog_LongParameters(self):
+        engine = create_engine("sqlite:///:memory:")
+        metrics.instrument_engine(engine)
+
+        with mock.patch("src.config.SLOW_QUERY_MS", 0):
+            with self.assertLogs("src.metrics", "WARNING") as logs:
+                with engine.begin() as conn:
+                    conn.execute(text("CREATE TABLE t (value)"))
+                    conn.execute(
+                        text("INSERT INTO t VALUES (:value)"),
+                        [{"value": i} for i in range(10_000)],
+                    )
+
+        # Параметры пачки обрезаются
+        self.assertLess(
+            len(logs.output[-1]), metrics.LOG_PARAMETERS_LENGTH + 200
+        )
+        self.assertTrue(logs.output[-1].endswith("..."))
@@ -33,6 +33,7 @@ class TestSchemas(unittest.TestCase):
             "email": "test@mail.com",
             "address": "some address",
             "id": 1,
+            "items_count": 1,
             "items": [
                 {
                     "title": "Book",
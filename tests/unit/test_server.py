@@ -0,0 +1,81 @@
+import os
+import unittest
+from unittest import mock
+
+from src import config, server
+
+
+class TestServer(unittest.TestCase):
+    def test_check_workers(self):
+        with mock.patch.multiple(
+            config,
+            DATABASE_URL="sqlite:///local.db",
+            SQLITE_JOURNAL_MODE="WAL",
+            CACHE_BACKEND="none",
+        ):
+            server.check_workers(1)
+            with self.assertNoLogs(server.logger):
+                server.check_workers(4)
+            with self.assertRaises(ValueError):
+                server.check_workers(0)
+
+            with mock.patch.object(config, "SQLITE_JOURNAL_MODE", "DELETE"):
+                with self.assertLogs(server.logger, "WARNING"):
+                    server.check_workers(4)
+
+            # У каждого процесса была бы своя БД в памяти
+            with mock.patch.object(config, "DATABASE_URL", "sqlite://"):
+                server.check_workers(1)
+                with self.assertRaises(ValueError):
+                    server.check_workers(2)
+
+    def test_configure_cache(self):
+        with mock.patch.object(
+            config, "CACHE_BACKEND", "memory"
+        ), mock.patch.dict(os.environ, {"CACHE_BACKEND": "memory"}):
+            server.configure_cache(1)
+            self.assertEqual("memory", config.CACHE_BACKEND)
+
+            with self.assertLogs(server.logger, "WARNING"):
+                server.configure_cache(4)
+
+            # Настройка передается рабочим процессам через окружение
+            self.assertEqual("none", config.CACHE_BACKEND)
+            self.assertEqual("none", os.environ["CACHE_BACKEND"])
+
+        with mock.patch.object(config, "CACHE_BACKEND", "redis"):
+            with self.assertNoLogs(server.logger):
+                server.configure_cache(4)
+            self.assertEqual("redis", config.CACHE_BACKEND)
+
+    def test_main(self):
+        with mock.patch("logging.basicConfig"), mock.patch.object(
+            server, "prepare_database"
+        ) as prepare, mock.patch("uvicorn.run") as run, mock.patch.object(
+            config, "CACHE_BACKEND", "none"
+        ):
+            server.main(["--workers", "3", "--port", "9000"])
+            prepare.assert_called_once_with()
+            run.assert_called_once_with(
+                "src.main:app",
+                host=config.SERVER_HOST,
+                port=9000,
+                workers=3,
+                timeout_graceful_shutdown=config.SERVER_GRACEFUL_TIMEOUT,
+                log_level="info",
+            )
+
+            prepare.reset_mock()
+            server.main(["--workers", "1", "--no-migrate"])
+            prepare.assert_not_called()
+
+    def test_main_invalid_workers(self):
+        with mock.patch("logging.basicConfig"), mock.patch.object(
+            server, "prepare_database"
+        ) as prepare, mock.patch("uvicorn.run") as run, mock.patch(
+            "sys.stderr"
+        ):
+            with self.assertRaises(SystemExit):
+                server.main(["--workers", "0"])
+        prepare.assert_not_called()
+        run.assert_not_called()